@@ -1,8 +1,17 @@
 import csv
+from datetime import timedelta
+from django.db.models import IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.http import HttpResponse
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Post, ChatRoom, Message, ModerationSettings, UserMessageRate, UserBan
+from django.utils import timezone
+from django.utils.html import format_html_join
+from .models import (
+    CustomUser, Post, ChatRoom, Message, ModerationSettings, UserMessageRate, UserBan, LexiconEntry,
+    ModerationStatsRollup,
+)
+from .moderation_stats import REASON_LABELS, get_moderation_stats, get_stats_settings, hour_bucket
 
 def export_users_csv(modeladmin, request, queryset):
     """Экспорт пользователей в CSV с оптимизацией"""
@@ -111,15 +120,60 @@ class PostAdmin(admin.ModelAdmin):
         return qs.select_related('author')  # ✅ Убираем N+1 для author!
 
 
+def _rollup_sum(since, **filters):
+    """Подзапрос: сумма почасовых счетчиков комнаты с момента since"""
+    rows = ModerationStatsRollup.objects.filter(room=OuterRef('pk'), hour__gte=since, **filters)
+    return Coalesce(
+        Subquery(rows.order_by().values('room').annotate(total=Sum('count')).values('total'),
+                 output_field=IntegerField()),
+        0,
+    )
+
+
 @admin.register(ChatRoom)
 class ChatRoomAdmin(admin.ModelAdmin):
-    list_display = ['name', 'topic', 'created_at', 'is_private']
+    list_display = ['name', 'topic', 'created_at', 'is_private', 'window_messages', 'window_blocked', 'window_block_rate']
     list_filter = ['is_private', 'created_at']
     search_fields = ['name', 'topic']
+    readonly_fields = ['moderation_stats']
 
     # ✅ ПАГИНАЦИЯ
     list_per_page = 25
 
+    # ✅ ОПТИМИЗАЦИЯ: статистика из почасовых счетчиков, а не COUNT(*) по сообщениям
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        since = hour_bucket(timezone.now() - timedelta(days=get_stats_settings()['WINDOW_DAYS']))
+        return qs.annotate(
+            stats_messages=_rollup_sum(since),
+            stats_blocked=_rollup_sum(since, reason__gt=''),
+        )
+
+    def window_messages(self, obj):
+        return obj.stats_messages
+    window_messages.short_description = 'Сообщений за окно'
+    window_messages.admin_order_field = 'stats_messages'
+
+    def window_blocked(self, obj):
+        return obj.stats_blocked
+    window_blocked.short_description = 'Заблокировано'
+    window_blocked.admin_order_field = 'stats_blocked'
+
+    def window_block_rate(self, obj):
+        if not obj.stats_messages:
+            return '-'
+        return f'{obj.stats_blocked / obj.stats_messages * 100:.1f}%'
+    window_block_rate.short_description = 'Доля блокировок'
+
+    def moderation_stats(self, obj):
+        if obj.pk is None:
+            return '-'
+        stats = get_moderation_stats(obj)
+        lines = [('Сообщений', stats['total_messages']), ('Заблокировано', stats['blocked_messages'])]
+        lines += [(REASON_LABELS.get(reason, reason), count) for reason, count in stats['reasons'].items()]
+        return format_html_join('', '<div>{}: {}</div>', lines)
+    moderation_stats.short_description = 'Статистика модерации'
+
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
@@ -267,3 +321,42 @@ class UserBanAdmin(admin.ModelAdmin):
             obj.expires_at = timezone.now() + timedelta(days=7)
 
         super().save_model(request, obj, form, change)
+
+
+@admin.register(LexiconEntry)
+class LexiconEntryAdmin(admin.ModelAdmin):
+    list_display = ['word', 'category', 'is_active', 'created_at']
+    list_filter = ['category', 'is_active']
+    search_fields = ['word']
+    readonly_fields = ['created_at']
+    list_editable = ['is_active']
+
+    # ✅ ПАГИНАЦИЯ
+    list_per_page = 100
+
+
+@admin.register(ModerationStatsRollup)
+class ModerationStatsRollupAdmin(admin.ModelAdmin):
+    list_display = ['room_name', 'hour', 'reason', 'count']
+    list_filter = ['reason', 'hour']
+    search_fields = ['room__name']
+
+    # ✅ ПАГИНАЦИЯ
+    list_per_page = 100
+
+    def room_name(self, obj):
+        return obj.room.name
+    room_name.short_description = 'Комната'
+    room_name.admin_order_field = 'room__name'
+
+    # Счетчики пишет только модерация
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    # ✅ ОПТИМИЗАЦИЯ
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.select_related('room')
@@ -0,0 +1,114 @@
+"""
+Индекс активных банов пользователей
+
+Активные баны загружаются из UserBan одним запросом и хранятся в памяти
+процесса: словарь по пользователю и min-heap по времени окончания.
+Истекшие баны выпадают из индекса лениво при проверке, так что проверка
+бана на каждое сообщение выполняется без SQL.
+
+Изменения UserBan (сигналы post_save/post_delete) сбрасывают индекс текущего
+процесса и увеличивают версию в кеше, по которой остальные процессы
+перечитывают индекс не позже чем через BAN_INDEX_REFRESH_INTERVAL секунд.
+"""
+import heapq
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache_utils import VersionWatcher, bump_cache_version
+
+BAN_INDEX_VERSION = 'ban_index'
+
+BanEntry = namedtuple('BanEntry', ['id', 'room_id', 'reason', 'expires_at', 'is_permanent'])
+
+
+class BanIndex:
+    """Активные баны: user_id -> {ban_id: BanEntry} + heap (expires_at, ban_id, user_id)"""
+
+    def __init__(self, refresh_interval=None):
+        if refresh_interval is None:
+            refresh_interval = getattr(settings, 'BAN_INDEX_REFRESH_INTERVAL', 1.0)
+
+        self._watcher = VersionWatcher(BAN_INDEX_VERSION, refresh_interval)
+        self._lock = threading.RLock()
+        self._bans = None
+        self._expiry_heap = []
+
+    def invalidate(self):
+        """Сбрасывает индекс текущего процесса"""
+        with self._lock:
+            self._bans = None
+
+    def _ensure_loaded(self):
+        changed = self._watcher.changed()
+        if self._bans is None or changed:
+            self._load()
+
+    def _load(self):
+        from .models import UserBan
+
+        rows = UserBan.objects.filter(
+            is_active=True
+        ).filter(
+            Q(is_permanent=True) | Q(expires_at__isnull=True) | Q(expires_at__gte=timezone.now())
+        ).order_by('id').values_list(
+            'id', 'user_id', 'room_id', 'reason', 'expires_at', 'is_permanent'
+        )
+
+        bans = {}
+        expiry_heap = []
+        for ban_id, user_id, room_id, reason, expires_at, is_permanent in rows:
+            bans.setdefault(user_id, {})[ban_id] = BanEntry(ban_id, room_id, reason, expires_at, is_permanent)
+            if not is_permanent and expires_at:
+                expiry_heap.append((expires_at, ban_id, user_id))
+
+        heapq.heapify(expiry_heap)
+
+        self._bans = bans
+        self._expiry_heap = expiry_heap
+
+    def _expire(self, now):
+        """Убирает из индекса баны, срок которых истек"""
+        heap = self._expiry_heap
+        while heap and heap[0][0] < now:
+            expires_at, ban_id, user_id = heapq.heappop(heap)
+            user_bans = self._bans.get(user_id)
+            if user_bans is not None:
+                user_bans.pop(ban_id, None)
+                if not user_bans:
+                    del self._bans[user_id]
+
+    def find_active_ban(self, user_id, room_id=None):
+        """
+        Возвращает первый активный бан пользователя (BanEntry) или None.
+        Если комната указана, учитываются баны этой комнаты и глобальные баны
+        """
+        with self._lock:
+            self._ensure_loaded()
+            self._expire(timezone.now())
+
+            user_bans = self._bans.get(user_id)
+            if not user_bans:
+                return None
+
+            for ban in user_bans.values():
+                if room_id is None or ban.room_id is None or ban.room_id == room_id:
+                    return ban
+
+        return None
+
+
+ban_index = BanIndex()
+
+
+def get_ban_index():
+    return ban_index
+
+
+def invalidate_ban_index():
+    """Сбрасывает индекс в текущем процессе и оповещает остальные процессы"""
+    ban_index.invalidate()
+    bump_cache_version(BAN_INDEX_VERSION)
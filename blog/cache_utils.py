@@ -2,6 +2,15 @@ from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
 from django.conf import settings
 import hashlib
+import logging
+import math
+import random
+import time
+import uuid
+
+from .two_tier_cache import get_two_tier_cache
+
+logger = logging.getLogger(__name__)
 
 def get_cache_key(prefix, *args):
     """
@@ -11,14 +20,16 @@ def get_cache_key(prefix, *args):
     hash_key = hashlib.md5(key.encode('utf-8')).hexdigest()
     return f"{prefix}:{hash_key}"
 
-def cache_page_data(key_prefix, timeout=300):
+def cache_page_data(key_prefix, timeout=300, namespaces=()):
     """
-    Декоратор для кэширования данных страницы
+    Декоратор для кэширования данных страницы.
+    namespaces - пространства имен, при сбросе которых кэш страницы устаревает
     """
     def decorator(view_func):
         def wrapper(request, *args, **kwargs):
             # Создаем уникальный ключ кэша на основе URL и параметров
             cache_key = get_cache_key(key_prefix, request.path, str(args), str(sorted(kwargs.items())))
+            cache_key = versioned_key(cache_key, *namespaces)
             
             # Попробуем получить данные из кэша
             cached_data = cache.get(cache_key)
@@ -52,14 +63,205 @@ def invalidate_template_fragment(fragment_name, *args):
     cache.delete(key)
     return key
 
+# ✅ Пространства имен кеша с поколениями
+#
+# У каждого пространства (список постов, пост N, комната N) есть целое
+# поколение, которое хранится в кеше и входит в производные ключи. Сброс
+# пространства - один INCR поколения: старые ключи больше не читаются и
+# истекают по своему TTL, перебирать ключи кеша не нужно.
+
+NAMESPACE_KEY_PREFIX = 'ns'
+POSTS_NAMESPACE = 'posts'
+
+
+def post_namespace(post_id):
+    return f'post:{post_id}'
+
+
+def room_namespace(room_id):
+    return f'room:{room_id}'
+
+
+def _generation_key(namespace):
+    return f'{NAMESPACE_KEY_PREFIX}:{namespace}'
+
+
+def _initial_generation():
+    # Поколение начинается с текущего времени в мс: если ключ поколения вытеснен
+    # из кеша, новое поколение не совпадет с поколением старых производных ключей
+    return time.time_ns() // 1_000_000
+
+
+def get_namespace_generations(*namespaces):
+    """Текущие поколения пространств имен (одним запросом get_many)"""
+    # Поколения читаются через L1 (blog.two_tier_cache): INCR рассылает их сброс
+    tiered = get_two_tier_cache()
+    keys = [_generation_key(namespace) for namespace in namespaces]
+    generations = tiered.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            initial = _initial_generation()
+            # Поколение могли создать одновременно в другом процессе
+            generations[key] = initial if tiered.add(key, initial, None) else (tiered.get(key) or initial)
+    return [generations[key] for key in keys]
+
+
+def versioned_key(key, *namespaces):
+    """
+    Ключ кеша, привязанный к поколениям пространств имен:
+    versioned_key('total_published_posts', POSTS_NAMESPACE)
+    """
+    if not namespaces:
+        return key
+    generations = get_namespace_generations(*namespaces)
+    return key + '|' + '|'.join(f'{namespace}@{generation}' for namespace, generation in zip(namespaces, generations))
+
+
+def invalidate_namespace(*namespaces):
+    """Сбрасывает пространства имен: один INCR на пространство"""
+    tiered = get_two_tier_cache()
+    for namespace in namespaces:
+        key = _generation_key(namespace)
+        try:
+            tiered.incr(key)
+        except ValueError:
+            # Поколения еще нет - производных ключей тоже нет
+            tiered.add(key, _initial_generation(), None)
+
+
+# ✅ Защита от лавины пересчетов (cache stampede)
+#
+# get_or_compute хранит значение вместе со временем его вычисления и
+# логическим сроком жизни:
+# - срок жизни случайно укорачивается (JITTER), чтобы ключи, записанные
+#   одновременно, не истекали одновременно;
+# - незадолго до срока значение пересчитывается заранее с вероятностью,
+#   растущей к концу срока и со временем вычисления (XFetch, BETA);
+# - пересчитывает один процесс - тот, кто взял короткую блокировку
+#   (cache.add, в Redis - SET NX); остальные отдают устаревшее значение,
+#   которое хранится еще STALE_TTL секунд после срока (stale-while-revalidate);
+# - при промахе без устаревшего значения остальные ждут результат до
+#   LOCK_WAIT секунд, а не идут в БД все сразу (вызовы из потоков async-кода
+#   передают lock_wait=0: поток не должен засыпать в ожидании);
+# - блокировка снимается, только если она еще наша: в Redis сравнение и
+#   удаление - один Lua-скрипт.
+
+DEFAULT_CACHE_COMPUTE_SETTINGS = {
+    'LOCK_TIMEOUT': 10,   # Блокировка пересчета, с (больше самого долгого вычисления)
+    'LOCK_WAIT': 2.0,     # Сколько ждать чужого пересчета при промахе, с
+    'POLL_INTERVAL': 0.05,
+    'BETA': 1.0,          # XFetch: > 1 - пересчитывать раньше, 0 - только по сроку
+    'STALE_TTL': 60,      # Сколько хранить значение после срока, с
+    'JITTER': 0.1,        # Доля срока жизни, на которую он случайно укорачивается
+}
+
+
+def compute_options():
+    return dict(DEFAULT_CACHE_COMPUTE_SETTINGS, **getattr(settings, 'CACHE_GET_OR_COMPUTE', {}))
+
+
+def jittered_timeout(timeout, jitter):
+    """Срок жизни, случайно укороченный не больше чем на долю jitter"""
+    return timeout * random.uniform(1 - jitter, 1)
+
+
+def _should_refresh(delta, expires_at, beta, now):
+    # XFetch: now - delta * beta * ln(rand) >= expires_at; ln(rand) < 0
+    return now - delta * beta * math.log(1 - random.random()) >= expires_at
+
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def release_lock(lock_key, token):
+    """Удаляет блокировку, если ее значение - token (ее могли отдать другому процессу по LOCK_TIMEOUT)"""
+    try:
+        from django_redis import get_redis_connection
+        client = get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        # Кеш без Lua (locmem): между get и delete блокировку может взять другой процесс
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+        return
+
+    try:
+        # Значение сравнивается в том виде, в каком его записал cache.add
+        client.eval(RELEASE_LOCK_SCRIPT, 1, cache.make_key(lock_key), cache.client.encode(token))
+    except Exception as e:
+        logger.warning(f"Не удалось снять блокировку {lock_key}, она истечет сама: {e}")
+
+
+def _compute_and_store(key, compute, timeout, options):
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+
+    ttl = jittered_timeout(timeout, options['JITTER'])
+    get_two_tier_cache().set(key, (value, delta, time.time() + ttl), math.ceil(ttl + options['STALE_TTL']))
+    return value
+
+
+def get_or_compute(key, compute, timeout=300, lock_wait=None):
+    """
+    Значение из кеша или compute() с защитой от одновременного пересчета.
+    Записи get_or_compute читаются только через get_or_compute; ключи с
+    префиксами TWO_TIER_CACHE['PREFIXES'] читаются из памяти процесса (L1),
+    блокировка пересчета всегда берется в общем кеше.
+    lock_wait - сколько ждать чужого пересчета при промахе (по умолчанию
+    LOCK_WAIT); 0 - сразу вычислять самому
+    """
+    options = compute_options()
+    if lock_wait is None:
+        lock_wait = options['LOCK_WAIT']
+    tiered = get_two_tier_cache()
+    entry = tiered.get(key)
+    if not isinstance(entry, tuple) or len(entry) != 3:
+        entry = None  # Промах или значение, записанное напрямую через cache.set
+    if entry is not None:
+        value, delta, expires_at = entry
+        if not _should_refresh(delta, expires_at, options['BETA'], time.time()):
+            return value
+
+    lock_key = f'{key}:lock'
+    token = uuid.uuid4().hex
+    acquired = cache.add(lock_key, token, options['LOCK_TIMEOUT'])
+    if acquired is None:
+        # Кеш недоступен (django-redis с IGNORE_EXCEPTIONS) - просто вычисляем
+        return compute()
+
+    if acquired:
+        try:
+            return _compute_and_store(key, compute, timeout, options)
+        finally:
+            release_lock(lock_key, token)
+
+    if entry is not None:
+        # Пересчитывает другой процесс - отдаем устаревшее значение
+        return entry[0]
+
+    deadline = time.monotonic() + lock_wait
+    while time.monotonic() < deadline:
+        time.sleep(options['POLL_INTERVAL'])
+        entry = tiered.get(key)
+        if entry is not None:
+            return entry[0]
+
+    # Пересчет не успел завершиться - вычисляем сами, не дожидаясь блокировки
+    return _compute_and_store(key, compute, timeout, options)
+
+
 def get_cached_posts(page=1, page_size=5, timeout=300):
     """
     Кэширует список постов с пагинацией
     """
-    cache_key = get_cache_key('posts_list', page, page_size)
-    cached_posts = cache.get(cache_key)
+    cache_key = versioned_key(get_cache_key('posts_list', page, page_size), POSTS_NAMESPACE)
 
-    if cached_posts is None:
+    def load_posts():
         from blog.models import Post
         posts = Post.objects.filter(is_published=True).select_related('author').only(
             'title', 'created_at', 'author__username'
@@ -68,9 +270,53 @@ def get_cached_posts(page=1, page_size=5, timeout=300):
         # Пагинация
         start = (page - 1) * page_size
         end = start + page_size
-        cached_posts = posts[start:end]
+        return list(posts[start:end])
+
+    return get_or_compute(cache_key, load_posts, timeout)
+
+def get_cache_version(name):
+    """
+    Возвращает текущую версию (поколение) именованного набора данных.
+    Используется локальными кешами процессов, чтобы узнать об изменениях
+    в других процессах без перечитывания самих данных
+    """
+    return cache.get(f'version:{name}') or 0
+
+def bump_cache_version(name):
+    """
+    Увеличивает версию набора данных (одна атомарная операция INCR)
+    """
+    key = f'version:{name}'
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Ключа еще нет
+        cache.add(key, 1, None)
+        return get_cache_version(name)
+
+
+class VersionWatcher:
+    """
+    Следит за версией набора данных в кеше, обращаясь к кешу
+    не чаще одного раза в interval секунд
+    """
+
+    def __init__(self, name, interval=1.0):
+        self.name = name
+        self.interval = interval
+        self._version = None
+        self._checked_at = float('-inf')
+
+    def changed(self):
+        """True, если версия изменилась с прошлой проверки (или проверка первая)"""
+        now = time.monotonic()
+        if now - self._checked_at < self.interval:
+            return False
 
-        # Кэшируем результат
-        cache.set(cache_key, cached_posts, timeout)
+        self._checked_at = now
+        version = get_cache_version(self.name)
+        if version == self._version:
+            return False
 
-    return cached_posts
+        self._version = version
+        return True
@@ -2,11 +2,14 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from blog.models import Message, ChatRoom
-from django.core.cache import cache
+from blog.cache_utils import get_or_compute
 from django.conf import settings
 import logging
 from django.utils import timezone
-from blog.moderation_utils import moderate_message, record_user_message
+from blog.moderation_utils import check_user_ban
+from blog.moderation_executor import amoderate_message, get_moderation_executor
+from blog.message_buffer import get_message_buffer
+from blog.recent_messages import push_saved_messages
 import re
 
 logger = logging.getLogger(__name__)
@@ -26,6 +29,17 @@ class OptimizedChatConsumer(AsyncWebsocketConsumer):
 
         self.room_group_name = f'chat_{safe_room_name}'
 
+        # ✅ Забаненные пользователи не подключаются к комнате вовсе
+        if self.scope['user'].is_authenticated:
+            room = await self.get_or_create_room_cached()
+            is_banned, _ = await self.check_ban(room)
+            if is_banned:
+                await self.close(code=4003)
+                return
+
+        # ✅ Пул процессов модерации запускается заранее, а не на первом сообщении
+        get_moderation_executor()
+
         # Присоединяемся к группе комнаты
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -70,7 +84,8 @@ class OptimizedChatConsumer(AsyncWebsocketConsumer):
             message_content = message[:500]
 
             # Проверяем сообщение с помощью автоматической модерации
-            is_blocked, reason = await database_sync_to_async(moderate_message)(
+            # ✅ ОПТИМИЗАЦИЯ: проверки текста выполняются в пуле процессов, а не в потоке
+            is_blocked, reason = await amoderate_message(
                 self.scope['user'],
                 room,
                 message_content
@@ -83,8 +98,11 @@ class OptimizedChatConsumer(AsyncWebsocketConsumer):
                 }))
                 return
 
-            # ✅ ОПТИМИЗАЦИЯ: создаем сообщение и записываем факт отправки одновременно
-            await self.save_message_and_record(room, message_content)
+            # ✅ ОПТИМИЗАЦИЯ: факт отправки уже записан ограничителем частоты при модерации;
+            # с буфером записи сообщение рассылается сразу, а в БД попадает пачкой позже
+            buffer = get_message_buffer()
+            if buffer is None:
+                await self.save_message_now(room, message_content)
 
             # Отправляем сообщение в группу
             localized_time = timezone.localtime(timezone.now())
@@ -98,6 +116,9 @@ class OptimizedChatConsumer(AsyncWebsocketConsumer):
                 }
             )
 
+            if buffer is not None:
+                await self.buffer_message(buffer, room, message_content)
+
         except json.JSONDecodeError:
             await self.send(text_data=json.dumps({
                 'error': 'Некорректный формат данных'
@@ -125,33 +146,44 @@ class OptimizedChatConsumer(AsyncWebsocketConsumer):
         """
         ✅ ОПТИМИЗАЦИЯ: Кешированное получение комнаты (5 минут)
         """
-        cache_key = f'chat_room_{self.room_name}'
-        room = cache.get(cache_key)
-
-        if room is None:
+        def load_room():
             room, created = ChatRoom.objects.get_or_create(
                 name=self.room_name,
                 defaults={'topic': f'Чат для {self.room_name}'}
             )
-            cache.set(cache_key, room, 300)
+            return room
 
-        return room
+        # ✅ При истечении ключа комнату загружает одно подключение, а не все сразу;
+        # при промахе поток database_sync_to_async не ждет чужую загрузку (lock_wait=0)
+        return get_or_compute(f'chat_room_{self.room_name}', load_room, 300, lock_wait=0)
 
     @database_sync_to_async
-    def save_message_and_record(self, room, message_content):
+    def check_ban(self, room):
         """
-        ✅ ОПТИМИЗАЦИЯ: Объединяем две операции в одну транзакцию
+        ✅ ОПТИМИЗАЦИЯ: Проверка по индексу активных банов (БД - только при перезагрузке индекса)
+        """
+        return check_user_ban(self.scope['user'], room)
+
+    async def buffer_message(self, buffer, room, message_content):
         """
-        # Создаем сообщение
-        Message.objects.create(
+        ✅ ОПТИМИЗАЦИЯ: с включенным CHAT_MESSAGE_BUFFER уже разосланное сообщение
+        ставится в буфер без обращения к БД и записывается пачкой в фоне
+        """
+        message = Message(room=room, user=self.scope['user'], content=message_content, is_moderated=True)
+        # Буфер полон - ждем записи накопленного (потери ограничены MAX_PENDING)
+        while not buffer.add(message):
+            await database_sync_to_async(buffer.flush)()
+
+    @database_sync_to_async
+    def save_message_now(self, room, message_content):
+        """
+        ✅ ОПТИМИЗАЦИЯ: Сохраняем сообщение и добавляем его в буфер последних
+        сообщений комнаты вместо сброса кеша всей истории
+        """
+        message = Message.objects.create(
             room=room,
             user=self.scope['user'],
             content=message_content,
             is_moderated=True
         )
-
-        # Записываем факт отправки
-        record_user_message(self.scope['user'], room)
-
-        # Сбрасываем кеш сообщений для этой комнаты
-        cache.delete(f'chat_messages_{self.room_name}')
+        push_saved_messages([message])
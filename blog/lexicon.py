@@ -3,6 +3,8 @@
 
 import re
 
+from .text_normalizer import TEXT_NORMALIZER
+
 # ===================================================================
 # КАТЕГОРИЯ 1: СТРОГО ЗАПРЕЩЕННЫЕ СЛОВА (всегда блокируются)
 # ===================================================================
@@ -178,27 +180,13 @@ MODERATION_LEVELS = {
 def normalize_text(text):
     """
     Нормализует текст для более точной проверки:
+    - Сворачивает Unicode-формы (NFKC), убирает невидимые символы
+    - Заменяет похожие символы и leetspeak (x@й, xyй, д3бил) кириллицей
     - Убирает повторяющиеся символы
     - Убирает пробелы между буквами
-    - Убирает спецсимволы (х@й -> хай, х*й -> хй)
+    ✅ Таблицы замен строятся один раз из data/confusables.txt (см. text_normalizer.py)
     """
-    text = text.lower()
-
-    # Убираем повторяющиеся символы (оставляем макс 2)
-    text = re.sub(r'(.)\1{2,}', r'\1\1', text)
-
-    # Убираем пробелы между отдельными буквами (макс 1 символ)
-    text = re.sub(r'([а-яa-z])\s+([а-яa-z])', r'\1\2', text)
-
-    # Заменяем спецсимволы на буквы
-    replacements = {
-        '@': 'а', '*': '', '!': 'i', '1': 'i', '3': 'з', 
-        '4': 'ч', '6': 'б', '9': 'д', '0': 'о'
-    }
-    for old, new in replacements.items():
-        text = text.replace(old, new)
-
-    return text
+    return TEXT_NORMALIZER.normalize(text)
 
 def contains_prohibited_word(text, word):
     """
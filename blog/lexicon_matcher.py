@@ -0,0 +1,214 @@
+"""
+Многошаблонный поиск по словарю модерации (алгоритм Ахо-Корасик)
+
+Все списки из lexicon.py компилируются один раз при импорте в автоматы,
+и одно сообщение проверяется за один проход по каждому варианту текста
+вместо сотен вызовов contains_prohibited_word().
+"""
+from collections import deque, namedtuple
+
+from .lexicon import (
+    PROHIBITED_WORDS,
+    TOXIC_INDICATORS,
+    SPAM_INDICATORS,
+    normalize_text,
+)
+
+# Категории словаря
+PROHIBITED = 'prohibited'
+TOXIC = 'toxic'
+SPAM = 'spam'
+
+
+class AhoCorasickAutomaton:
+    """
+    Автомат Ахо-Корасик: находит все вхождения набора шаблонов
+    за один проход по тексту (O(длина текста + число совпадений)).
+
+    patterns - итерируемый объект пар (шаблон, полезная_нагрузка)
+    """
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for pattern, payload in patterns:
+            self._add(pattern, payload)
+
+        self._build()
+
+    def _add(self, pattern, payload):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state].append(payload)
+
+    def _build(self):
+        """Строит fail-ссылки обходом в ширину и сливает выходы"""
+        queue = deque(self._goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+
+                self._out[next_state].extend(self._out[self._fail[next_state]])
+
+        # Кортежи быстрее и неизменяемы после сборки
+        self._out = [tuple(out) for out in self._out]
+
+    def to_tables(self):
+        """Таблицы переходов, fail-ссылок и выходов (для артефакта без пересборки)"""
+        return {'goto': self._goto, 'fail': self._fail, 'out': self._out}
+
+    @classmethod
+    def from_tables(cls, tables):
+        """Восстанавливает собранный автомат из to_tables() (после JSON)"""
+        automaton = cls.__new__(cls)
+        automaton._goto = tables['goto']
+        automaton._fail = tables['fail']
+        automaton._out = [tuple(tuple(payload) for payload in out) for out in tables['out']]
+        return automaton
+
+    def find_all(self, text):
+        """Возвращает множество полезных нагрузок всех найденных шаблонов"""
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        found = set()
+        state = 0
+
+        for char in text:
+            while True:
+                next_state = goto[state].get(char)
+                if next_state is not None:
+                    state = next_state
+                    break
+                if not state:
+                    break
+                state = fail[state]
+
+            if out[state]:
+                found.update(out[state])
+
+        return found
+
+
+class LexiconHits(namedtuple('LexiconHits', ['prohibited', 'toxic', 'spam'])):
+    """
+    Результат проверки сообщения по словарю.
+    Каждое поле - кортеж найденных слов в порядке их следования в lexicon.py
+    """
+    __slots__ = ()
+
+    @property
+    def is_prohibited(self):
+        return bool(self.prohibited)
+
+    @property
+    def toxic_count(self):
+        return len(self.toxic)
+
+    @property
+    def is_spam(self):
+        return bool(self.spam)
+
+
+class LexiconMatcher:
+    """
+    Скомпилированный словарь модерации.
+
+    Повторяет семантику contains_prohibited_word() и check_spam():
+    - запрещенные и токсичные слова ищутся в нормализованном тексте
+      и в виде "х у й" (буквы через пробел) в тексте в нижнем регистре;
+    - спам-индикаторы ищутся как подстроки текста в нижнем регистре.
+    """
+
+    def __init__(self, prohibited_words, toxic_indicators, spam_indicators):
+        self._words = {
+            PROHIBITED: tuple(prohibited_words),
+            TOXIC: tuple(toxic_indicators),
+            SPAM: tuple(spam_indicators),
+        }
+
+        normalized_patterns = []
+        lowered_patterns = []
+
+        for category in (PROHIBITED, TOXIC):
+            for index, word in enumerate(self._words[category]):
+                word_lower = word.lower()
+                normalized_patterns.append((word_lower, (category, index)))
+                lowered_patterns.append((' '.join(word_lower), (category, index)))
+
+        for index, spam_word in enumerate(self._words[SPAM]):
+            lowered_patterns.append((spam_word, (SPAM, index)))
+
+        self._normalized_automaton = AhoCorasickAutomaton(normalized_patterns)
+        self._lowered_automaton = AhoCorasickAutomaton(lowered_patterns)
+
+    @property
+    def words(self):
+        """{категория: кортеж слов} в порядке компиляции"""
+        return self._words
+
+    def to_tables(self):
+        """Слова и таблицы обоих автоматов - данные без исполняемого кода"""
+        return {
+            'words': self._words,
+            'normalized': self._normalized_automaton.to_tables(),
+            'lowered': self._lowered_automaton.to_tables(),
+        }
+
+    @classmethod
+    def from_tables(cls, tables):
+        """Восстанавливает словарь из to_tables() без сборки автоматов"""
+        matcher = cls.__new__(cls)
+        matcher._words = {category: tuple(tables['words'][category]) for category in (PROHIBITED, TOXIC, SPAM)}
+        matcher._normalized_automaton = AhoCorasickAutomaton.from_tables(tables['normalized'])
+        matcher._lowered_automaton = AhoCorasickAutomaton.from_tables(tables['lowered'])
+        return matcher
+
+    def scan(self, normalized, lowered):
+        """
+        Проверяет заранее подготовленные варианты текста:
+        normalized - результат normalize_text(), lowered - text.lower()
+        """
+        found = self._normalized_automaton.find_all(normalized)
+        found |= self._lowered_automaton.find_all(lowered)
+
+        matched = {PROHIBITED: [], TOXIC: [], SPAM: []}
+        for category, index in sorted(found):
+            matched[category].append(self._words[category][index])
+
+        return LexiconHits(
+            prohibited=tuple(matched[PROHIBITED]),
+            toxic=tuple(matched[TOXIC]),
+            spam=tuple(matched[SPAM]),
+        )
+
+    def scan_text(self, text):
+        """Проверяет сырой текст сообщения"""
+        return self.scan(normalize_text(text), text.lower())
+
+
+# ✅ Компилируется один раз при импорте модуля
+LEXICON_MATCHER = LexiconMatcher(PROHIBITED_WORDS, TOXIC_INDICATORS, SPAM_INDICATORS)
+
+
+def scan_lexicon(text):
+    """Проверяет текст по всему словарю модерации за один проход"""
+    return LEXICON_MATCHER.scan_text(text)
@@ -0,0 +1,240 @@
+"""
+Версионированный словарь модерации с горячей перезагрузкой
+
+Источник словаря - таблица LexiconEntry (правится в админке).
+publish_lexicon() компилирует активные слова в LexiconMatcher и сохраняет
+его в файл-артефакт LEXICON_ARTIFACT_DIR/lexicon-<версия>.json, где версия -
+отпечаток содержимого. Текущая версия записывается в кеш.
+
+Артефакт - JSON со словами и таблицами автоматов, а не pickle: каталог
+артефактов общий для процессов, и подмененный файл не должен исполнять код
+при загрузке. Слова из файла сверяются с версией в его имени, поврежденный
+или чужой артефакт не загружается, а словарь компилируется из БД.
+
+Правки в админке публикуются через schedule_publish(): все изменения за
+LEXICON_PUBLISH_DELAY секунд собираются в одну компиляцию.
+
+Процессы (Daphne, Celery, пул модерации) проверяют версию не чаще раза
+в LEXICON_REFRESH_INTERVAL секунд. Новая версия загружается из готового
+артефакта в фоновом потоке (или компилируется из БД, если на этом хосте
+артефакта еще нет), а до окончания загрузки сообщения проверяет старый словарь.
+Пока версия ни разу не опубликована, используется словарь из lexicon.py.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .cache_utils import VersionWatcher, bump_cache_version
+from .lexicon_matcher import LEXICON_MATCHER, LexiconMatcher, PROHIBITED, TOXIC, SPAM
+
+logger = logging.getLogger(__name__)
+
+LEXICON_VERSION = 'lexicon'
+LEXICON_CURRENT_KEY = 'lexicon:current'
+BUILTIN_VERSION = 'builtin'
+
+
+def get_artifact_dir():
+    return Path(getattr(settings, 'LEXICON_ARTIFACT_DIR', Path(tempfile.gettempdir()) / 'blog_lexicon'))
+
+
+def artifact_path(version):
+    return get_artifact_dir() / f'lexicon-{version}.json'
+
+
+def load_lexicon_words():
+    """Активные слова из БД: {категория: кортеж слов в порядке добавления}"""
+    from .models import LexiconEntry
+
+    words = {PROHIBITED: [], TOXIC: [], SPAM: []}
+    rows = LexiconEntry.objects.filter(is_active=True).order_by('id').values_list('category', 'word')
+    for category, word in rows:
+        if category in words:
+            words[category].append(word)
+    return {category: tuple(category_words) for category, category_words in words.items()}
+
+
+def lexicon_version(words):
+    """Отпечаток содержимого словаря"""
+    fingerprint = '\n\n'.join(
+        category + '\n' + '\n'.join(words[category]) for category in (PROHIBITED, TOXIC, SPAM)
+    )
+    return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:16]
+
+
+def compile_artifact(words):
+    """
+    Компилирует словарь в артефакт. Файл пишется во временный и атомарно
+    переименовывается, так что читатели не видят его недописанным
+    """
+    version = lexicon_version(words)
+    path = artifact_path(version)
+    matcher = LexiconMatcher(words[PROHIBITED], words[TOXIC], words[SPAM])
+
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.lexicon-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': version, 'matcher': matcher.to_tables()}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    return version, matcher
+
+
+def load_artifact(version):
+    """
+    Загружает скомпилированный словарь версии version; компилирует из БД,
+    если файла нет. Возвращает: (версия, LexiconMatcher)
+    """
+    try:
+        with open(artifact_path(version), encoding='utf-8') as f:
+            matcher = LexiconMatcher.from_tables(json.load(f)['matcher'])
+        if lexicon_version(matcher.words) == version:
+            return version, matcher
+        logger.warning(f"Артефакт словаря {version} не совпадает с версией, словарь компилируется из БД")
+        artifact_path(version).unlink(missing_ok=True)
+    except FileNotFoundError:
+        pass
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Артефакт словаря {version} поврежден, словарь компилируется из БД: {e}")
+        artifact_path(version).unlink(missing_ok=True)
+
+    built_version, matcher = compile_artifact(load_lexicon_words())
+    if built_version != version:
+        # БД уже изменилась - берем свежее, следующая публикация выровняет версии
+        logger.info(f"Словарь {version} устарел, загружена версия {built_version}")
+    return built_version, matcher
+
+
+def publish_lexicon():
+    """Компилирует словарь из БД и оповещает все процессы о новой версии"""
+    version, matcher = compile_artifact(load_lexicon_words())
+    lexicon_store.swap(version, matcher)
+
+    if cache.get(LEXICON_CURRENT_KEY) != version:
+        cache.set(LEXICON_CURRENT_KEY, version, None)
+        bump_cache_version(LEXICON_VERSION)
+    return version
+
+
+_publish_timer = None
+_publish_lock = threading.Lock()
+
+
+def schedule_publish(delay=None):
+    """
+    Публикует словарь через delay секунд (LEXICON_PUBLISH_DELAY), если
+    публикация еще не запланирована. Изменения, зафиксированные до ее начала,
+    попадут в ту же версию; delay=0 - публикация сразу
+    """
+    global _publish_timer
+    if delay is None:
+        delay = getattr(settings, 'LEXICON_PUBLISH_DELAY', 2.0)
+    if not delay:
+        publish_lexicon()
+        return
+
+    with _publish_lock:
+        if _publish_timer is not None:
+            return
+        _publish_timer = threading.Timer(delay, _publish_scheduled)
+        _publish_timer.daemon = True
+        _publish_timer.start()
+
+
+def _publish_scheduled():
+    global _publish_timer
+    with _publish_lock:
+        # Изменения после этой точки запланируют следующую публикацию
+        _publish_timer = None
+    try:
+        publish_lexicon()
+    except Exception as e:
+        logger.error(f"Не удалось опубликовать словарь: {e}")
+    finally:
+        connection.close()
+
+
+class LexiconStore:
+    """Текущий скомпилированный словарь процесса"""
+
+    def __init__(self, refresh_interval=None):
+        if refresh_interval is None:
+            refresh_interval = getattr(settings, 'LEXICON_REFRESH_INTERVAL', 1.0)
+
+        self.refresh_interval = refresh_interval
+        self._current = (BUILTIN_VERSION, LEXICON_MATCHER)
+        self._watcher = VersionWatcher(LEXICON_VERSION, refresh_interval)
+        self._reload_lock = threading.Lock()
+
+    def get(self):
+        """Текущий словарь; о новой версии узнает не чаще раза в refresh_interval"""
+        if self._watcher.changed():
+            version = cache.get(LEXICON_CURRENT_KEY)
+            if version and version != self.version:
+                self._start_reload(version)
+        return self._current[1]
+
+    @property
+    def version(self):
+        return self._current[0]
+
+    def _start_reload(self, version):
+        if not self._reload_lock.acquire(blocking=False):
+            return  # Загрузка уже идет
+        threading.Thread(target=self._reload_in_background, args=(version,), daemon=True).start()
+
+    def _reload_in_background(self, version):
+        try:
+            self.reload(version)
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить словарь {version}: {e}")
+            # Новый наблюдатель повторит попытку при следующей проверке
+            self._watcher = VersionWatcher(LEXICON_VERSION, self.refresh_interval)
+        finally:
+            self._reload_lock.release()
+
+    def refresh(self):
+        """Сразу загружает опубликованную версию, не дожидаясь фоновой загрузки"""
+        version = cache.get(LEXICON_CURRENT_KEY)
+        if version and version != self.version:
+            self.reload(version)
+        return self.version
+
+    def reload(self, version):
+        """Загружает версию и подменяет словарь одной операцией присваивания"""
+        self.swap(*load_artifact(version))
+
+    def swap(self, version, matcher):
+        self._current = (version, matcher)
+
+    def reset(self):
+        """Возвращает словарь из lexicon.py (тесты)"""
+        self.swap(BUILTIN_VERSION, LEXICON_MATCHER)
+        self._watcher = VersionWatcher(LEXICON_VERSION, self.refresh_interval)
+
+
+lexicon_store = LexiconStore()
+
+
+def get_lexicon_matcher():
+    return lexicon_store.get()
+
+
+def get_lexicon_version():
+    """Версия словаря, которым сейчас проверяются сообщения"""
+    lexicon_store.get()
+    return lexicon_store.version
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Post, make_preview, make_slug
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сохраненные превью и slug постов (после изменения make_preview / make_slug)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Постов в одной пачке')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        processed = 0
+        changed = 0
+        last_id = 0
+
+        while True:
+            posts = list(
+                Post.objects.filter(pk__gt=last_id).order_by('pk')
+                .only('title', 'content', 'preview', 'slug')[:batch_size]
+            )
+            if not posts:
+                break
+
+            stale = []
+            for post in posts:
+                preview, slug = make_preview(post.content), make_slug(post.title)
+                if (post.preview, post.slug) != (preview, slug):
+                    post.preview, post.slug = preview, slug
+                    stale.append(post)
+            # bulk_update не вызывает save(): updated_at и счетчики реакций не трогаются
+            Post.objects.bulk_update(stale, ['preview', 'slug'])
+
+            processed += len(posts)
+            changed += len(stale)
+            last_id = posts[-1].pk
+            self.stdout.write(f'  обработано: {processed}')
+
+        self.stdout.write(self.style.SUCCESS(f'Постов: {processed}, обновлено: {changed}'))
@@ -0,0 +1,113 @@
+"""
+Бенчмарк записи сообщений чата: по одному INSERT на сообщение
+против отложенной записи пачками (blog.message_buffer)
+
+Всплеск из --messages сообщений отправляется одновременно, как из многих
+консьюмеров одного процесса. Время замеряется до момента, когда все
+сообщения записаны в БД. Выполняется во временной базе SQLite в памяти.
+
+Пример:
+    python manage.py benchmark_chat_writes --messages 5000 --max-batch 200
+"""
+import asyncio
+import time
+
+from channels.db import database_sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from blog.management.commands.benchmark_moderation import OFFLINE_SETTINGS
+from blog.message_buffer import MessageWriteBuffer
+from blog.models import ChatRoom, CustomUser, Message
+from blog.recent_messages import push_saved_messages
+
+
+def save_message_now(room, user, content):
+    """Путь без буфера - как OptimizedChatConsumer.save_message_now"""
+    message = Message.objects.create(room=room, user=user, content=content, is_moderated=True)
+    push_saved_messages([message])
+
+
+async def buffered_save(buffer, room, user, content):
+    """Путь с буфером - как OptimizedChatConsumer.buffer_message"""
+    message = Message(room=room, user=user, content=content, is_moderated=True)
+    while not buffer.add(message):
+        await database_sync_to_async(buffer.flush)()
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность записи сообщений чата без буфера и с буфером'
+
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000, help='Сообщений во всплеске')
+        parser.add_argument('--rooms', type=int, default=5, help='Комнат')
+        parser.add_argument('--users', type=int, default=20, help='Пользователей')
+        parser.add_argument('--flush-interval-ms', type=int, default=200)
+        parser.add_argument('--max-batch', type=int, default=100)
+        parser.add_argument('--max-pending', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Бенчмарк выполняется на SQLite: запустите с ENV_TYPE=local')
+
+        with override_settings(**OFFLINE_SETTINGS):
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                results = self._run(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        direct, buffered = results['per_message'], results['buffered']
+        self.stdout.write(f"{'Путь':<14}{'сообщений':>12}{'секунд':>10}{'сообщ./с':>12}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<14}{result['messages']:>12}{result['seconds']:>10.3f}{result['per_second']:>12.0f}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Ускорение с буфером: x{buffered['per_second'] / direct['per_second']:.1f}"
+        ))
+
+    def _run(self, options):
+        rooms = [ChatRoom.objects.create(name=f'bench_{i}') for i in range(options['rooms'])]
+        users = [
+            CustomUser.objects.create_user(username=f'bench_{i}', email=f'bench_{i}@example.com', password='x')
+            for i in range(options['users'])
+        ]
+        burst = [
+            (rooms[i % len(rooms)], users[i % len(users)], f'Сообщение номер {i}')
+            for i in range(options['messages'])
+        ]
+
+        results = {}
+
+        async def per_message():
+            save = database_sync_to_async(save_message_now)
+            await asyncio.gather(*(save(*message) for message in burst))
+
+        results['per_message'] = self._measure(per_message, len(burst))
+
+        buffer = MessageWriteBuffer(
+            flush_interval_ms=options['flush_interval_ms'],
+            max_batch=options['max_batch'],
+            max_pending=options['max_pending'],
+        )
+
+        async def buffered():
+            await asyncio.gather(*(buffered_save(buffer, *message) for message in burst))
+            # Время - до записи последнего сообщения
+            await database_sync_to_async(buffer.close)()
+
+        results['buffered'] = self._measure(buffered, len(burst))
+
+        if Message.objects.count() != len(burst) * 2:
+            raise CommandError('Записаны не все сообщения')
+        return results
+
+    def _measure(self, func, messages):
+        started = time.perf_counter()
+        asyncio.run(func())
+        seconds = time.perf_counter() - started
+        return {'messages': messages, 'seconds': seconds, 'per_second': messages / seconds}
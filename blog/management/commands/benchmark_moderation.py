@@ -0,0 +1,153 @@
+"""
+Бенчмарк модерации сообщений чата
+
+Выполняется без внешних сервисов: во временной базе SQLite в памяти,
+с локальным кешем и ограничением частоты в памяти процесса.
+
+Примеры:
+    python manage.py benchmark_moderation --output bench.json
+    python manage.py benchmark_moderation --save-baseline moderation_baseline.json
+    python manage.py benchmark_moderation --baseline moderation_baseline.json
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from blog.moderation_benchmark import (
+    build_corpus, load_corpus, run_benchmark, compare_with_baseline,
+)
+
+OFFLINE_SETTINGS = {
+    'CACHES': {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'},
+        'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-sessions'},
+    },
+    'MODERATION_RATE_LIMITER': 'blog.rate_limiting.InMemoryRateLimiter',
+    'MODERATION_VERDICT_CACHE': {'MAX_SIZE': 10000, 'SHARED_TIMEOUT': 0},
+    # Счетчики статистики считаются в памяти, но не сбрасываются в БД во время замеров
+    'MODERATION_STATS': {'FLUSH_INTERVAL': 0},
+    'CHAT_RECENT_MESSAGES': {'BACKEND': 'blog.recent_messages.InMemoryRecentMessages'},
+}
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк модерации: задержки p50/p95/p99, пропускная способность и память по этапам'
+
+    # Команде не нужны URL и шаблоны
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5, help='Проходов по корпусу')
+        parser.add_argument('--warmup', type=int, default=1, help='Проходов прогрева')
+        parser.add_argument('--seed', type=int, default=42, help='Seed генератора корпуса')
+        parser.add_argument('--per-category', type=int, default=40, help='Сообщений на категорию')
+        parser.add_argument('--corpus', help='JSON-файл с корпусом вместо сгенерированного')
+        parser.add_argument('--dump-corpus', help='Сохранить сгенерированный корпус в JSON-файл')
+        parser.add_argument('--stages', help='Этапы через запятую (по умолчанию - все)')
+        parser.add_argument('--no-allocations', action='store_true', help='Не замерять память')
+        parser.add_argument('--output', help='Сохранить отчет в JSON-файл')
+        parser.add_argument('--baseline', help='Сравнить с сохраненным отчетом')
+        parser.add_argument('--save-baseline', help='Сохранить отчет как новый эталон')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Допустимое ухудшение относительно эталона (доля)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Бенчмарк выполняется на SQLite: запустите с ENV_TYPE=local')
+
+        if options['corpus']:
+            with open(options['corpus'], encoding='utf-8') as f:
+                corpus = load_corpus(json.load(f))
+        else:
+            corpus = build_corpus(seed=options['seed'], per_category=options['per_category'])
+
+        if options['dump_corpus']:
+            self._write_json(options['dump_corpus'], [message._asdict() for message in corpus])
+
+        stages = set(options['stages'].split(',')) if options['stages'] else None
+
+        with override_settings(**OFFLINE_SETTINGS):
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                report = self._run(corpus, stages, options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self._print_report(report)
+
+        if options['output']:
+            self._write_json(options['output'], report)
+        if options['save_baseline']:
+            self._write_json(options['save_baseline'], report)
+            self.stdout.write(self.style.SUCCESS(f"Эталон сохранен: {options['save_baseline']}"))
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            regressions = compare_with_baseline(report, baseline, options['threshold'])
+            if regressions:
+                for regression in regressions:
+                    self.stdout.write(self.style.ERROR(
+                        f"  {regression['stage']}: {regression['metric']} "
+                        f"{regression['baseline']:.1f} -> {regression['current']:.1f} "
+                        f"({regression['change']:+.0%})"
+                    ))
+                raise CommandError(f'Найдено регрессий: {len(regressions)}')
+            self.stdout.write(self.style.SUCCESS('Регрессий относительно эталона нет'))
+
+    def _run(self, corpus, stages, options):
+        from blog.ban_index import get_ban_index
+        from blog.models import ChatRoom, CustomUser, ModerationSettings, UserBan
+        from blog.moderation_policy import get_moderation_policy, policy_cache
+
+        # Индексы процесса могли быть загружены из основной базы
+        get_ban_index().invalidate()
+        policy_cache.invalidate()
+
+        user = CustomUser.objects.create_user(
+            username='benchmark', email='benchmark@example.com', password='benchmark'
+        )
+        room = ChatRoom.objects.create(name='benchmark')
+        ModerationSettings.objects.create(
+            room=room,
+            enabled=True,
+            blocked_words="редиска\nкабачок\nбаклажан",
+            # Лимит частоты не должен срабатывать во время замеров
+            max_messages_per_minute=10 ** 9,
+            enable_toxicity_filter=True,
+        )
+
+        # Несколько активных банов других пользователей, чтобы индекс не был пустым
+        for i in range(20):
+            banned = CustomUser.objects.create_user(
+                username=f'banned{i}', email=f'banned{i}@example.com', password='benchmark'
+            )
+            UserBan.objects.create(user=banned, room=room if i % 2 else None, reason='benchmark', is_permanent=True)
+
+        policy = get_moderation_policy(room)
+        self.stdout.write(f'Корпус: {len(corpus)} сообщений, проходов: {options["iterations"]}')
+
+        return run_benchmark(
+            corpus, user, room, policy,
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            stages=stages,
+            allocations=not options['no_allocations'],
+        )
+
+    def _print_report(self, report):
+        self.stdout.write(
+            f"{'Этап':<28}{'оп/с':>12}{'p50 мкс':>10}{'p95 мкс':>10}{'p99 мкс':>10}{'память Б':>11}"
+        )
+        for name, stage in report['stages'].items():
+            self.stdout.write(
+                f"{name:<28}{stage['ops_per_sec']:>12.0f}{stage['p50_us']:>10.1f}"
+                f"{stage['p95_us']:>10.1f}{stage['p99_us']:>10.1f}"
+                f"{stage.get('alloc_mean_bytes', 0):>11.0f}"
+            )
+
+    def _write_json(self, path, data):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
@@ -10,10 +10,10 @@ class Command(BaseCommand):
             self.style.NOTICE('Начинаем очистку истекших банов...')
         )
         
-        cleanup_expired_bans()
+        deactivated_count = cleanup_expired_bans()
         
         self.stdout.write(
             self.style.SUCCESS(
-                'Очистка истекших банов завершена'
+                f'Очистка истекших банов завершена. Деактивировано банов: {deactivated_count}'
             )
         )
\ No newline at end of file
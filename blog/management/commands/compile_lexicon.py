@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from blog.lexicon_store import publish_lexicon, artifact_path
+
+
+class Command(BaseCommand):
+    help = 'Компилирует словарь модерации из БД в артефакт и публикует новую версию для всех процессов'
+
+    def handle(self, *args, **options):
+        version = publish_lexicon()
+        self.stdout.write(
+            self.style.SUCCESS(f'Словарь опубликован: версия {version} ({artifact_path(version)})')
+        )
@@ -14,18 +14,18 @@ class Command(BaseCommand):
         self.stdout.write(
             self.style.NOTICE('Проверяем и деактивируем истекшие баны...')
         )
-        cleanup_expired_bans()
+        deactivated_count = cleanup_expired_bans()
         self.stdout.write(
-            self.style.SUCCESS('Проверка истекших банов завершена')
+            self.style.SUCCESS(f'Проверка истекших банов завершена. Деактивировано банов: {deactivated_count}')
         )
         
         # Очистка старых записей о частоте сообщений
         self.stdout.write(
             self.style.NOTICE('Очищаем старые записи о частоте сообщений...')
         )
-        cleanup_old_message_rates()
+        deleted_count = cleanup_old_message_rates()
         self.stdout.write(
-            self.style.SUCCESS('Очистка старых записей завершена')
+            self.style.SUCCESS(f'Очистка старых записей завершена. Удалено записей: {deleted_count}')
         )
         
         self.stdout.write(
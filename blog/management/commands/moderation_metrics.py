@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from blog.moderation_metrics import collect_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Выводит перцентили длительности этапов модерации по последним снимкам всех процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Вывести в формате JSON')
+
+    def handle(self, *args, **options):
+        histograms, processes = collect_snapshots()
+        summary = {stage: histogram.summary() for stage, histogram in sorted(histograms.items())}
+
+        if options['json']:
+            self.stdout.write(json.dumps({'processes': processes, 'stages': summary}, indent=2))
+            return
+
+        if not summary:
+            self.stdout.write(self.style.WARNING(
+                'Нет данных: процессы еще не сбрасывали метрики (см. MODERATION_METRICS)'
+            ))
+            return
+
+        self.stdout.write(f'Процессов: {processes}')
+        self.stdout.write(
+            f"{'Этап':<22}{'замеров':>10}{'сред. мс':>10}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'макс. мс':>10}"
+        )
+        for stage, stats in summary.items():
+            self.stdout.write(
+                f"{stage:<22}{stats['count']:>10}{stats['mean_ms']:>10.3f}{stats['p50_ms']:>10.3f}"
+                f"{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}{stats['max_ms']:>10.3f}"
+            )
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.message_search import get_message_search, rebuild_message_search
+from blog.models import ChatRoom
+
+
+class Command(BaseCommand):
+    help = 'Заполняет поисковый индекс сообщений чата существующей историей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', action='append', dest='rooms', default=[],
+                            help='Название комнаты (можно указать несколько раз)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Сообщений в пачке')
+        parser.add_argument('--clear', action='store_true',
+                            help='Сначала очистить индекс целиком (только без --room)')
+
+    def handle(self, *args, **options):
+        room_ids = None
+        if options['rooms']:
+            if options['clear']:
+                raise CommandError('--clear очищает индекс всех комнат, его нельзя сочетать с --room')
+            rooms = dict(ChatRoom.objects.filter(name__in=options['rooms']).values_list('name', 'pk'))
+            missing = set(options['rooms']) - set(rooms)
+            if missing:
+                raise CommandError(f"Комнаты не найдены: {', '.join(sorted(missing))}")
+            room_ids = list(rooms.values())
+
+        self.batches_done = 0
+        self.stdout.write(f'Бэкенд поиска: {type(get_message_search()).__name__}')
+        started = time.perf_counter()
+        processed = rebuild_message_search(
+            room_ids=room_ids,
+            batch_size=options['batch_size'],
+            clear=options['clear'],
+            progress=self.progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {processed} сообщений за {time.perf_counter() - started:.1f} с'
+        ))
+
+    def progress(self, processed):
+        self.batches_done += 1
+        if self.batches_done % 10 == 0:
+            self.stdout.write(f'  проиндексировано: {processed}')
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.post_search import get_post_search, rebuild_post_search
+
+
+class Command(BaseCommand):
+    help = 'Заполняет поисковый индекс постов существующими постами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Постов в пачке')
+        parser.add_argument('--clear', action='store_true', help='Сначала очистить индекс')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Бэкенд поиска: {type(get_post_search()).__name__}')
+        started = time.perf_counter()
+        processed = rebuild_post_search(batch_size=options['batch_size'], clear=options['clear'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {processed} постов за {time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from blog.reactions import reconcile_reaction_counts
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счетчики лайков и дизлайков постов с реакциями и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--post', type=int, action='append', dest='posts', default=[],
+                            help='id поста (можно указать несколько раз)')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        drifted = reconcile_reaction_counts(post_ids=options['posts'] or None, dry_run=options['dry_run'])
+
+        for pk, (likes, dislikes), (actual_likes, actual_dislikes) in drifted:
+            self.stdout.write(
+                f'  пост {pk}: лайки {likes} -> {actual_likes}, дизлайки {dislikes} -> {actual_dislikes}'
+            )
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Расхождений: {len(drifted)} (не исправлены, --dry-run)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Исправлено постов: {len(drifted)}'))
@@ -0,0 +1,91 @@
+import json
+import os
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from blog.models import ChatRoom
+from blog.moderation_stats import REASON_LABELS
+from blog.remoderation import remoderate_messages
+
+
+def parse_moment(value):
+    """Дата (2026-01-31) или дата и время (2026-01-31T12:00) в текущем часовом поясе"""
+    moment = parse_datetime(value)
+    if moment is None:
+        date = parse_date(value)
+        if date is None:
+            raise CommandError(f'Некорректная дата: {value}')
+        moment = datetime.combine(date, datetime.min.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = 'Перепроверяет сохраненные сообщения чата текущим словарем и настройками комнат'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', action='append', dest='rooms', default=[],
+                            help='Название комнаты (можно указать несколько раз)')
+        parser.add_argument('--since', help='Сообщения, созданные начиная с даты')
+        parser.add_argument('--until', help='Сообщения, созданные до даты')
+        parser.add_argument('--level', default='moderate', choices=['strict', 'moderate', 'relaxed'],
+                            help='Уровень строгости')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Сообщений в пачке')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Процессов для проверок (0 - в текущем процессе)')
+        parser.add_argument('--dry-run', action='store_true', help='Только отчет, без записи')
+        parser.add_argument('--resume', action='store_true', help='Продолжить с контрольной точки')
+        parser.add_argument('--no-unblock', action='store_true',
+                            help='Не снимать блокировку с сообщений, которые теперь проходят проверку')
+        parser.add_argument('--json', action='store_true', help='Вывести отчет в формате JSON')
+
+    def handle(self, *args, **options):
+        self.batches_done = 0
+        room_ids = None
+        if options['rooms']:
+            rooms = dict(ChatRoom.objects.filter(name__in=options['rooms']).values_list('name', 'pk'))
+            missing = set(options['rooms']) - set(rooms)
+            if missing:
+                raise CommandError(f"Комнаты не найдены: {', '.join(sorted(missing))}")
+            room_ids = list(rooms.values())
+
+        report = remoderate_messages(
+            resume=options['resume'],
+            room_ids=room_ids,
+            since=parse_moment(options['since']) if options['since'] else None,
+            until=parse_moment(options['until']) if options['until'] else None,
+            moderation_level=options['level'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            dry_run=options['dry_run'],
+            unblock=not options['no_unblock'],
+            progress=None if options['json'] else self.show_progress,
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+            return
+
+        title = 'Отчет (без записи)' if report['dry_run'] else 'Повторная модерация завершена'
+        self.stdout.write(self.style.SUCCESS(
+            f"{title}: проверено {report['scanned']} сообщений за {report['elapsed_s']:.1f} с, "
+            f"изменено {report['changed']} (заблокировано {report['blocked']}, "
+            f"разблокировано {report['unblocked']}), пропущено {report['skipped']}"
+        ))
+        for reason, count in sorted(report['reasons'].items(), key=lambda item: -item[1]):
+            self.stdout.write(f'  {REASON_LABELS.get(reason, reason)}: {count}')
+        for sample in report['samples']:
+            verdict = f"заблокировать: {sample['reason']}" if sample['is_blocked'] else 'разблокировать'
+            self.stdout.write(f"  #{sample['id']} {sample['content']!r} -> {verdict}")
+
+    def show_progress(self, report):
+        self.batches_done += 1
+        if self.batches_done % 10:
+            return
+        self.stdout.write(
+            f"  ... до id {report['last_id']}: проверено {report['scanned']}, изменено {report['changed']}"
+        )
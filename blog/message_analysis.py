@@ -0,0 +1,58 @@
+"""
+Предварительный анализ сообщения для модерации
+
+Сообщение нормализуется и разбирается один раз, после чего все проверки
+check_* в moderation_utils.py работают с готовым объектом MessageAnalysis.
+"""
+from functools import cached_property
+
+from .lexicon import normalize_text
+from .lexicon_store import get_lexicon_matcher
+
+class MessageAnalysis:
+    """
+    Подготовленные варианты текста сообщения:
+    - content: исходный текст
+    - lowered: текст в нижнем регистре
+    - normalized: результат normalize_text()
+    - caps_ratio: доля заглавных букв
+    - lexicon_hits: совпадения с текущей версией словаря модерации
+
+    caps_ratio и lexicon_hits вычисляются лениво и не более одного раза.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.lowered = content.lower()
+        self.normalized = normalize_text(content)
+
+    def __repr__(self):
+        return f'<MessageAnalysis {self.content[:30]!r}>'
+
+    @cached_property
+    def caps_ratio(self):
+        if not self.content:
+            return 0.0
+        return sum(1 for c in self.content if c.isupper()) / len(self.content)
+
+    @cached_property
+    def lexicon_hits(self):
+        return get_lexicon_matcher().scan(self.normalized, self.lowered)
+
+    def as_dict(self):
+        """Представление для отладки (test_moderation)"""
+        hits = self.lexicon_hits
+        return {
+            'content': self.content,
+            'lowered': self.lowered,
+            'normalized': self.normalized,
+            'caps_ratio': self.caps_ratio,
+            'prohibited_words': list(hits.prohibited),
+            'toxic_indicators': list(hits.toxic),
+            'spam_indicators': list(hits.spam),
+        }
+
+
+def analyze_message(content):
+    """Строит MessageAnalysis для текста сообщения"""
+    return MessageAnalysis(content or '')
@@ -0,0 +1,208 @@
+"""
+Отложенная запись сообщений чата (write-behind)
+
+Без буфера консьюмер сохраняет каждое сообщение отдельным INSERT в потоке БД.
+С буфером (CHAT_MESSAGE_BUFFER['ENABLED']) сообщение рассылается сразу, а в
+БД попадает пачкой через bulk_create из фонового потока процесса:
+- пачка пишется каждые FLUSH_INTERVAL_MS миллисекунд или сразу, как только
+  накопилось MAX_BATCH сообщений;
+- в буфере не больше MAX_PENDING сообщений: когда он полон, консьюмер сам
+  дожидается записи (backpressure), так что при аварийном завершении
+  процесса теряется не больше MAX_PENDING сообщений;
+- при штатной остановке процесса (atexit) буфер дописывается полностью;
+- пачка, которую не удалось записать из-за ошибки БД, возвращается в начало
+  буфера; если БД отвергла отдельные строки (IntegrityError / DataError -
+  например, комнату или пользователя удалили), пачка пишется по одному
+  сообщению, а отвергнутые сообщения логируются и отбрасываются, чтобы одна
+  плохая строка не останавливала запись остальных;
+- записанные сообщения добавляются в буферы последних сообщений комнат
+  (blog.recent_messages) и в поисковый индекс (blog.message_search).
+
+created_at сообщения - время записи пачки: оно отстает от отправки не больше
+чем на FLUSH_INTERVAL_MS, порядок сообщений сохраняется.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+from django.dispatch import receiver
+
+from .message_search import index_messages
+from .performance_utils import invalidate_messages_cache
+from .recent_messages import push_saved_messages
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MESSAGE_BUFFER_SETTINGS = {
+    'ENABLED': False,
+    'FLUSH_INTERVAL_MS': 200,
+    'MAX_BATCH': 100,
+    'MAX_PENDING': 1000,
+}
+
+
+class MessageWriteBuffer:
+    """Буфер несохраненных сообщений процесса с фоновой записью пачками"""
+
+    def __init__(self, flush_interval_ms=200, max_batch=100, max_pending=1000):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+
+        self._pending = []  # Несохраненные Message в порядке отправки
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._stopped = False
+        self.flushed = 0
+        self.dropped = 0
+
+    @classmethod
+    def from_settings(cls, config):
+        return cls(
+            flush_interval_ms=config['FLUSH_INTERVAL_MS'],
+            max_batch=config['MAX_BATCH'],
+            max_pending=config['MAX_PENDING'],
+        )
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+    def add(self, message):
+        """
+        Ставит сообщение в очередь на запись без обращения к БД.
+        Возвращает False, если буфер полон - тогда нужно вызвать flush()
+        """
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                return False
+            self._pending.append(message)
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+        if self._flusher is None and self.flush_interval:
+            self._start_flusher()
+        return True
+
+    def _start_flusher(self):
+        with self._cond:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name='chat-message-buffer', daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                if not self._stopped and len(self._pending) < self.max_batch:
+                    self._cond.wait(self.flush_interval)
+                if self._stopped:
+                    return
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Не удалось записать сообщения чата, повтор через {self.flush_interval} с: {e}")
+
+    def flush(self):
+        """Записывает все накопленные сообщения. Возвращает: количество записанных"""
+        from .models import Message
+
+        with self._flush_lock:
+            with self._cond:
+                pending, self._pending = self._pending, []
+
+            written = 0  # Обработано сообщений из pending: записано или отброшено
+            saved = []
+            try:
+                while written < len(pending):
+                    batch = pending[written:written + self.max_batch]
+                    try:
+                        with transaction.atomic():
+                            Message.objects.bulk_create(batch)
+                    except (IntegrityError, DataError) as e:
+                        logger.warning(f"Пачка сообщений чата отвергнута БД, запись по одному: {e}")
+                        for message in batch:
+                            if self._write_one(message):
+                                saved.append(message)
+                            written += 1
+                        continue
+                    saved.extend(batch)
+                    written += len(batch)
+            except Exception:
+                with self._cond:
+                    self._pending[:0] = pending[written:]
+                raise
+            finally:
+                if saved:
+                    push_saved_messages(saved)
+                    # bulk_create не отправляет post_save - индекс и кеш комнат обновляются здесь
+                    index_messages([message.pk for message in saved])
+                    for room_id in {message.room_id for message in saved}:
+                        invalidate_messages_cache(room_id)
+                self.flushed += len(saved)
+
+            return len(saved)
+
+    def _write_one(self, message):
+        """
+        Записывает одно сообщение из отвергнутой пачки. Возвращает False, если БД
+        отвергла и его (сообщение отбрасывается); ошибки соединения пробрасываются
+        """
+        from .models import Message
+
+        # bulk_create отвергнутой пачки мог успеть присвоить id
+        message.pk = None
+        message._state.adding = True
+        try:
+            with transaction.atomic():
+                Message.objects.bulk_create([message])
+        except (IntegrityError, DataError) as e:
+            self.dropped += 1
+            logger.error(
+                f"Сообщение чата отброшено (комната {message.room_id}, пользователь {message.user_id}): {e}"
+            )
+            return False
+        return True
+
+    def close(self):
+        """Останавливает фоновый поток и дописывает буфер (штатная остановка процесса)"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=max(self.flush_interval * 2, 1))
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"При остановке не записано сообщений чата: {len(self)} ({e})")
+
+
+_message_buffer = None
+_message_buffer_lock = threading.Lock()
+
+
+def get_message_buffer():
+    """Буфер текущего процесса; None, если отложенная запись выключена"""
+    global _message_buffer
+    if _message_buffer is None:
+        config = dict(DEFAULT_MESSAGE_BUFFER_SETTINGS, **getattr(settings, 'CHAT_MESSAGE_BUFFER', {}))
+        if not config['ENABLED']:
+            return None
+        with _message_buffer_lock:
+            if _message_buffer is None:
+                _message_buffer = MessageWriteBuffer.from_settings(config)
+    return _message_buffer
+
+
+@receiver(setting_changed)
+def reset_message_buffer(setting, **kwargs):
+    """Сбрасывает буфер при override_settings в тестах"""
+    global _message_buffer
+    if setting == 'CHAT_MESSAGE_BUFFER':
+        _message_buffer = None
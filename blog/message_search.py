@@ -0,0 +1,332 @@
+"""
+Полнотекстовый поиск по сообщениям чата
+
+Вместо content__icontains (полный просмотр сообщений комнаты) поиск идет
+по индексу, поэтому время ответа зависит от числа совпадений, а не от
+размера истории. Бэкенд выбирается настройкой CHAT_MESSAGE_SEARCH['BACKEND']:
+- blog.message_search.SQLiteMessageSearch - виртуальная таблица FTS5
+  (локальная разработка); русская морфология - blog.russian_stemmer;
+- blog.message_search.PostgresMessageSearch - tsvector + GIN с
+  конфигурацией CHAT_MESSAGE_SEARCH['CONFIG'] ('russian');
+- blog.message_search.DatabaseMessageSearch - icontains без индекса;
+- None (по умолчанию) - по типу базы данных.
+
+Индекс содержит текст сообщения и имя автора (с меньшим весом). Он
+обновляется после фиксации транзакции при сохранении и удалении сообщения
+(blog/signals.py), после записи пачки из MessageWriteBuffer и после
+повторной модерации. Заблокированные сообщения в индекс не попадают.
+Заполнить индекс для существующей истории:
+    python manage.py rebuild_message_search
+
+Результаты упорядочены по релевантности (bm25 / ts_rank), затем по id.
+Страницы листаются курсором (релевантность, id); если между запросами
+страниц в комнату пишут, релевантность может немного сдвинуться.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.core import signing
+from django.core.signals import setting_changed
+from django.db import connection
+from django.db.models import Q
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .pagination import CursorError, CursorPage, paginate_by_cursor
+from .russian_stemmer import stem, stem_words
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MESSAGE_SEARCH_SETTINGS = {
+    'BACKEND': None,
+    'CONFIG': 'russian',
+}
+
+BACKENDS_BY_VENDOR = {
+    'sqlite': 'blog.message_search.SQLiteMessageSearch',
+    'postgresql': 'blog.message_search.PostgresMessageSearch',
+}
+
+SEARCH_CURSOR_SALT = 'blog.message_search.cursor'
+MAX_TERMS = 8  # Длинный запрос не превращается в десятки условий MATCH
+
+TERM_RE = re.compile(r'\w+')
+
+
+def search_terms(query):
+    """Слова запроса (не больше MAX_TERMS) в нижнем регистре"""
+    return [term.lower().replace('ё', 'е') for term in TERM_RE.findall(query)][:MAX_TERMS]
+
+
+def encode_search_cursor(score, pk):
+    return signing.dumps([score, pk], salt=SEARCH_CURSOR_SALT, compress=True)
+
+
+def decode_search_cursor(token):
+    """Возвращает: (релевантность, id)"""
+    try:
+        score, pk = signing.loads(token, salt=SEARCH_CURSOR_SALT)
+        return float(score), int(pk)
+    except (signing.BadSignature, ValueError, TypeError) as e:
+        raise CursorError(str(e)) from e
+
+
+def message_queryset():
+    from .models import Message
+    return Message.objects.filter(is_blocked=False).select_related('user').only(
+        'content', 'created_at', 'room_id', 'user__username'
+    )
+
+
+class BaseMessageSearch:
+    """Общий интерфейс поиска по сообщениям"""
+
+    def __init__(self, config='russian'):
+        self.config = config
+
+    @classmethod
+    def from_settings(cls, options):
+        return cls(config=options['CONFIG'])
+
+    def index(self, message_ids):
+        """Добавляет или обновляет сообщения в индексе (заблокированные удаляет)"""
+
+    def remove(self, message_ids):
+        """Удаляет сообщения из индекса"""
+
+    def clear(self):
+        """Очищает индекс целиком (перед полной перестройкой)"""
+
+    def search(self, room, query, cursor=None, per_page=50):
+        """Страница результатов поиска в комнате (CursorPage); cursor - next_cursor прошлой страницы"""
+        raise NotImplementedError
+
+
+class DatabaseMessageSearch(BaseMessageSearch):
+    """Поиск без индекса: icontains по тексту и имени автора, от новых к старым"""
+
+    def search(self, room, query, cursor=None, per_page=50):
+        queryset = message_queryset().filter(room=room).filter(
+            Q(content__icontains=query) | Q(user__username__icontains=query)
+        )
+        return paginate_by_cursor(queryset, cursor, per_page)
+
+
+class IndexedMessageSearch(BaseMessageSearch):
+    """Поиск по индексу: подкласс возвращает id и релевантность совпадений"""
+
+    def ranked_ids(self, room_id, terms, after, limit):
+        """
+        [(id, релевантность), ...] по убыванию релевантности, затем id.
+        after - (релевантность, id) последнего показанного результата или None
+        """
+        raise NotImplementedError
+
+    def search(self, room, query, cursor=None, per_page=50):
+        terms = search_terms(query)
+        if not terms:
+            return CursorPage([])
+
+        after = decode_search_cursor(cursor) if cursor else None
+        ranked = self.ranked_ids(room.pk, terms, after, per_page + 1)
+        has_more = len(ranked) > per_page
+        ranked = ranked[:per_page]
+
+        # Индекс обновляется после фиксации - сообщение могло быть уже заблокировано
+        messages = message_queryset().in_bulk([pk for pk, _ in ranked])
+        return CursorPage(
+            [messages[pk] for pk, _ in ranked if pk in messages],
+            next_cursor=encode_search_cursor(ranked[-1][1], ranked[-1][0]) if has_more else None,
+        )
+
+    def documents(self, message_ids):
+        """[(id, room_id, текст, имя автора), ...] незаблокированных сообщений"""
+        return list(
+            message_queryset().filter(pk__in=message_ids).values_list('pk', 'room_id', 'content', 'user__username')
+        )
+
+
+class SQLiteMessageSearch(IndexedMessageSearch):
+    """
+    Таблица FTS5 blog_message_fts(room, body, author), rowid = id сообщения.
+    В body и author хранятся основы слов, комната - токен "r<id>" в колонке
+    room, так что условие на комнату тоже выполняется по индексу FTS5
+    """
+
+    table = 'blog_message_fts'
+
+    def index(self, message_ids):
+        message_ids = list(message_ids)
+        if not message_ids:
+            return
+        documents = self.documents(message_ids)
+        with connection.cursor() as cursor:
+            self._delete(cursor, message_ids)
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, room, body, author) VALUES (%s, %s, %s, %s)',
+                [
+                    (pk, f'r{room_id}', ' '.join(stem_words(content)), ' '.join(stem_words(username)))
+                    for pk, room_id, content, username in documents
+                ],
+            )
+
+    def remove(self, message_ids):
+        message_ids = list(message_ids)
+        if message_ids:
+            with connection.cursor() as cursor:
+                self._delete(cursor, message_ids)
+
+    def _delete(self, cursor, message_ids):
+        placeholders = ', '.join(['%s'] * len(message_ids))
+        cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', message_ids)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def match_expression(self, room_id, terms):
+        # Слова - \w+ в кавычках, спецсинтаксис FTS5 в запрос не попадает; "*" - поиск по началу основы
+        words = ' AND '.join(f'{{body author}} : "{stem(term)}"*' for term in terms)
+        return f'room : "r{room_id}" AND ({words})'
+
+    def ranked_ids(self, room_id, terms, after, limit):
+        # bm25 тем меньше, чем лучше совпадение; веса колонок: room 0, body 1, author 0.5
+        sql = (
+            f'SELECT id, score FROM ('
+            f'SELECT rowid AS id, -bm25({self.table}, 0.0, 1.0, 0.5) AS score '
+            f'FROM {self.table} WHERE {self.table} MATCH %s)'
+        )
+        params = [self.match_expression(room_id, terms)]
+        if after is not None:
+            sql += ' WHERE score < %s OR (score = %s AND id < %s)'
+            params += [after[0], after[0], after[1]]
+        sql += ' ORDER BY score DESC, id DESC LIMIT %s'
+        params.append(limit)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class PostgresMessageSearch(IndexedMessageSearch):
+    """
+    Таблица blog_message_search(message_id, room_id, document tsvector) с GIN
+    по document и btree по room_id: текст - вес A, имя автора - вес B
+    """
+
+    table = 'blog_message_search'
+
+    def index(self, message_ids):
+        message_ids = list(message_ids)
+        if not message_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE message_id = ANY(%s)', [message_ids])
+            cursor.execute(
+                f'INSERT INTO {self.table} (message_id, room_id, document) '
+                f'SELECT m.id, m.room_id, '
+                f'setweight(to_tsvector(%s::regconfig, m.content), \'A\') || '
+                f'setweight(to_tsvector(%s::regconfig, u.username), \'B\') '
+                f'FROM blog_message m JOIN blog_customuser u ON u.id = m.user_id '
+                f'WHERE m.id = ANY(%s) AND NOT m.is_blocked',
+                [self.config, self.config, message_ids],
+            )
+
+    def remove(self, message_ids):
+        message_ids = list(message_ids)
+        if message_ids:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {self.table} WHERE message_id = ANY(%s)', [message_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {self.table}')
+
+    def tsquery(self, terms):
+        # to_tsquery сам приводит слова к основам; ":*" - поиск по началу основы
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def ranked_ids(self, room_id, terms, after, limit):
+        sql = (
+            f'SELECT id, score FROM ('
+            f'SELECT s.message_id AS id, ts_rank(s.document, q)::float8 AS score '
+            f'FROM {self.table} s, to_tsquery(%s::regconfig, %s) q '
+            f'WHERE s.room_id = %s AND s.document @@ q) ranked'
+        )
+        params = [self.config, self.tsquery(terms), room_id]
+        if after is not None:
+            sql += ' WHERE score < %s OR (score = %s AND id < %s)'
+            params += [after[0], after[0], after[1]]
+        sql += ' ORDER BY score DESC, id DESC LIMIT %s'
+        params.append(limit)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+_message_search = None
+
+
+def get_message_search():
+    """Возвращает бэкенд поиска из настройки CHAT_MESSAGE_SEARCH (один на процесс)"""
+    global _message_search
+    if _message_search is None:
+        options = dict(DEFAULT_MESSAGE_SEARCH_SETTINGS, **getattr(settings, 'CHAT_MESSAGE_SEARCH', {}))
+        backend = options['BACKEND'] or BACKENDS_BY_VENDOR.get(
+            connection.vendor, 'blog.message_search.DatabaseMessageSearch'
+        )
+        _message_search = import_string(backend).from_settings(options)
+    return _message_search
+
+
+def index_messages(message_ids):
+    """Обновляет сообщения в индексе; ошибка индекса не мешает отправке сообщений"""
+    try:
+        get_message_search().index(message_ids)
+    except Exception as e:
+        logger.warning(f"Не удалось обновить поисковый индекс сообщений: {e}")
+
+
+def remove_messages(message_ids):
+    try:
+        get_message_search().remove(message_ids)
+    except Exception as e:
+        logger.warning(f"Не удалось удалить сообщения из поискового индекса: {e}")
+
+
+def rebuild_message_search(room_ids=None, batch_size=1000, clear=False, progress=None):
+    """
+    Заполняет индекс существующими сообщениями пачками по возрастанию id.
+    Возвращает: количество обработанных сообщений
+    """
+    from .models import Message
+
+    search = get_message_search()
+    if clear:
+        search.clear()
+
+    queryset = Message.objects.order_by('pk')
+    if room_ids:
+        queryset = queryset.filter(room_id__in=room_ids)
+
+    processed = 0
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_id).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return processed
+        search.index(ids)
+        processed += len(ids)
+        last_id = ids[-1]
+        if progress:
+            progress(processed)
+
+
+@receiver(setting_changed)
+def reset_message_search(setting, **kwargs):
+    """Сбрасывает бэкенд при override_settings в тестах"""
+    global _message_search
+    if setting == 'CHAT_MESSAGE_SEARCH':
+        _message_search = None
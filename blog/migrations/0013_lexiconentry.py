@@ -0,0 +1,99 @@
+# Generated by Django 5.2.9 on 2026-10-17 06:22
+
+from django.db import migrations, models
+
+# Словари из lexicon.py на момент миграции: миграция не должна зависеть
+# от того, как файл изменится потом
+
+PROHIBITED_WORDS = [
+    'блядь', 'бля', 'блять', 'сука', 'пизда', 'пиздец', 'ебать', 'ебаный', 'хуй', 'хер', 'хуйня',
+    'хрен', 'говно', 'говнюк', 'жопа', 'залупа', 'мудак', 'мудила', 'чмо', 'чмошник', 'ссука',
+    'ссыкло', 'гандон', 'пидор', 'пидар', 'пидорас', 'пидр', 'еблан', 'ебланище', 'дрочер',
+    'долбоёб', 'долбаёб', 'ублюдок', 'падла', 'сволочь', 'тварь', 'идиот', 'дурак', 'дебил', 'даун',
+    'кретин', 'имбецил', 'придурок', 'тупица', 'олигофрен', 'умственно отсталый', 'дебилоид',
+    'урод', 'уродина', 'мразь', 'мерзавец', 'подлец', 'шлюха', 'бомж', 'проститутка', 'потаскуха',
+    'козел', 'козлина', 'скотина', 'быдло', 'лох', 'лошара', 'лузер', 'неудачник', 'ничтожество',
+    'отброс', 'гомик', 'лгбт', 'бл@', 'бл*ть', 'п@зда', 'п*зда', 'ху@', 'х*й', 'еб@ть', 'еб*ть',
+    'б[л]', 'п[и]зда', 'х[у]й', 'еб[а]ть', 'бляяяя', 'пздц', 'хйня', 'епрст', 'ёпрст',
+    'ёб твою мать', 'ёбаный рот', 'ёба', 'нигер', 'чурка', 'хохол', 'жид', 'жидовка', 'азиат',
+    'узкоглазый', 'черножопый', 'москаль', 'кацап', 'клюквенная морда', 'пиндос', 'янки',
+    'америкос', 'европеец', 'узбек', 'таджик', 'чучмек', 'убью', 'убить', 'убийство', 'зарежу',
+    'прибью', 'пристрелю', 'повешу', 'задушу', 'сдохни', 'подохни', 'издохни', 'умри', 'сгинь',
+    'кидать камни', 'бить', 'избить', 'изнасилую', 'расправлюсь', 'хайль гитлер', '1488', '88',
+    'зиг хайль', 'adolf hitler', 'нсдап', 'свастика', 'фашист', 'фашисты', 'нацисты', 'нацизм',
+    'гитлер',
+]
+
+TOXIC_INDICATORS = [
+    'дурак', 'тупой', 'глупый', 'идиот', 'кретин', 'дебил', 'придурок', 'тупица', 'олух', 'болван',
+    'остолоп', 'дурень', 'глупец', 'бестолочь', 'недоумок', 'тормоз', 'невежда', 'профан', 'урод',
+    'уродина', 'страшилище', 'чмо', 'толстяк', 'жирдяй', 'худышка', 'коротышка', 'уродливый',
+    'мерзкий', 'отвратительный', 'гадкий', 'противный', 'мерзость', 'скотина', 'свинья', 'заткнись',
+    'заткни пасть', 'заткни варежку', 'закрой рот', 'заткни свою хлебало', 'молчи', 'отвали',
+    'проваливай', 'убирайся', 'иди отсюда', 'катись', 'вали', 'отстань', 'отцепись', 'лох',
+    'лошара', 'лузер', 'неудачник', 'нищеброд', 'попрошайка', 'халявщик', 'дармоед', 'тунеядец',
+    'бездельник', 'лентяй', 'паразит', 'приспособленец', 'подхалим', 'подлиза', 'подхалимаж',
+    'черт', 'чёрт', 'черт возьми', 'чёрт возьми', 'черт побери', 'блин', 'блинчик', 'ёлки-палки',
+    'ёшкин кот', 'ёпрст', 'ядрёна мать', 'японский городовой', 'твою мать', 'твою дивизию',
+    'трахаться', 'трахать', 'трахнуть', 'переспать', 'шлюха', 'потаскуха', 'проститутка', 'путана',
+    'блядина', 'блядовать', 'развратник', 'развратница', 'шалава', 'шалашовка', 'ударю',
+    'набью морду', 'навешаю люлей', 'получишь', 'огребешь', 'прибью', 'побью', 'дам в морду',
+    'дам леща', 'заезжу', 'получишь по морде', 'настучу', 'избить', 'поломать', 'понаехали',
+    'приезжие', 'нерусский', 'чужаки', 'мигранты-уроды', 'гастарбайтеры', 'понаехавшие',
+    'откуда понаехали', 'кремлебот', 'либераст', 'либерашка', 'ватник', 'вата', 'ольгинский',
+    'ольгинец', 'навальнята', 'майданутый', 'бандеровец', 'укроп', 'хохлы', 'кацапы', 'москали',
+    'рашка', 'рашист', 'путлер', 'еретик', 'богохульник', 'безбожник', 'сатанист', 'извращенец',
+    'бесноватый', 'отступник', 'неверный', 'язычник',
+]
+
+SPAM_INDICATORS = [
+    'легкие деньги', 'без вложений', 'пассивный доход', 'быстрые деньги', 'миллион за месяц',
+    'финансовая свобода', 'удвоить капитал', 'гарантированный доход', 'млм', 'сетевой маркетинг',
+    'реферальная программа', 'пригласи друга', 'многоуровневый маркетинг', 'казино онлайн', 'слоты',
+    'игровые автоматы', 'букмекерская контора', 'выиграть в казино', 'джекпот',
+    'бонус при регистрации', 'фриспины', 'перейди по ссылке', 'кликни здесь', 'жми сюда',
+    'зарегистрируйся здесь', 'получи бонус', 'скидка 90%', 'акция только сегодня', 'успей купить',
+    'купить наркотики', 'закладки', 'марки', 'соли', 'порошок', 'трава', 'план', 'гашиш', 'героин',
+    'кокаин', 'амфетамин', 'экстази', 'фен', 'мефедрон', 'психотропы', 'стимуляторы', 'виагра',
+    'сиалис', 'таблетки для потенции', 'дженерики', 'лекарства без рецепта', 'аптека онлайн',
+]
+
+
+def seed_lexicon(apps, schema_editor):
+    """Переносит словари в таблицу (в порядке из lexicon.py)"""
+    LexiconEntry = apps.get_model('blog', 'LexiconEntry')
+    entries = []
+    for category, words in (
+        ('prohibited', PROHIBITED_WORDS),
+        ('toxic', TOXIC_INDICATORS),
+        ('spam', SPAM_INDICATORS),
+    ):
+        entries.extend(LexiconEntry(category=category, word=word) for word in words)
+    LexiconEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_alter_userban_created_at_alter_userban_expires_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LexiconEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('prohibited', 'Строго запрещенное'), ('toxic', 'Токсичное'), ('spam', 'Спам')], max_length=20, verbose_name='Категория')),
+                ('word', models.CharField(max_length=200, verbose_name='Слово или фраза')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активно')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Слово словаря модерации',
+                'verbose_name_plural': 'Словарь модерации',
+                'ordering': ['category', 'id'],
+                'constraints': [models.UniqueConstraint(fields=('category', 'word'), name='unique_lexicon_entry')],
+            },
+        ),
+        migrations.RunPython(seed_lexicon, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.9 on 2026-10-17 06:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_lexiconentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModerationStatsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(verbose_name='Час')),
+                ('reason', models.CharField(blank=True, default='', max_length=32, verbose_name='Причина блокировки')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Сообщений')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='moderation_stats', to='blog.chatroom', verbose_name='Комната')),
+            ],
+            options={
+                'verbose_name': 'Статистика модерации за час',
+                'verbose_name_plural': 'Статистика модерации',
+                'ordering': ['-hour'],
+                'constraints': [models.UniqueConstraint(fields=('room', 'hour', 'reason'), name='unique_moderation_stats_rollup')],
+            },
+        ),
+    ]
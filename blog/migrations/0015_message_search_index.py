@@ -0,0 +1,49 @@
+"""
+Поисковый индекс сообщений чата (blog.message_search)
+
+Схема зависит от базы данных: на SQLite - виртуальная таблица FTS5, на
+PostgreSQL - таблица с tsvector и GIN-индексом. Индекс заполняется командой
+python manage.py rebuild_message_search.
+"""
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS blog_message_fts "
+            "USING fts5(room, body, author, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE IF NOT EXISTS blog_message_search ("
+            "message_id bigint PRIMARY KEY REFERENCES blog_message (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "room_id bigint NOT NULL, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS blog_message_search_document ON blog_message_search USING GIN (document)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS blog_message_search_room ON blog_message_search (room_id)"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS blog_message_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS blog_message_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0014_moderationstatsrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
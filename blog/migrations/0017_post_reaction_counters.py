@@ -0,0 +1,44 @@
+# Generated by Django 5.2.9 on 2026-10-17 06:48
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_reaction_counters(apps, schema_editor):
+    """Начальные значения счетчиков из существующих реакций"""
+    Post = apps.get_model('blog', 'Post')
+    PostReaction = apps.get_model('blog', 'PostReaction')
+
+    def actual_count(reaction_type):
+        return Coalesce(
+            Subquery(
+                PostReaction.objects.filter(post=OuterRef('pk'), reaction_type=reaction_type)
+                .order_by().values('post').annotate(count=Count('pk')).values('count'),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    Post.objects.update(like_count=actual_count('like'), dislike_count=actual_count('dislike'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0016_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='dislike_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Дизлайки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Лайки'),
+        ),
+        migrations.RunPython(fill_reaction_counters, migrations.RunPython.noop),
+    ]
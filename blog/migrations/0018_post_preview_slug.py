@@ -0,0 +1,60 @@
+# Generated by Django 5.2.9 on 2026-10-17 06:53
+
+import re
+
+from django.db import migrations, models
+
+
+# Копии blog.models.make_preview / make_slug на момент миграции:
+# миграция не должна меняться вместе с моделью
+def make_preview(content):
+    if not content:
+        return ''
+    if len(content) <= 300:
+        return content
+    end = content.find('.', 200, 301)
+    if end == -1:
+        end = 300
+    return content[:end + 1]
+
+
+def make_slug(title):
+    slug = re.sub(r'[^\w\s-]', '', title).strip().lower()
+    slug = re.sub(r'[-\s]+', '-', slug)
+    return slug or 'post'
+
+
+def fill_preview_and_slug(apps, schema_editor):
+    """Превью и slug существующих постов, пачками по возрастанию id"""
+    Post = apps.get_model('blog', 'Post')
+    last_id = 0
+    while True:
+        posts = list(Post.objects.filter(pk__gt=last_id).order_by('pk').only('title', 'content')[:500])
+        if not posts:
+            return
+        for post in posts:
+            post.preview = make_preview(post.content)
+            post.slug = make_slug(post.title)
+        Post.objects.bulk_update(posts, ['preview', 'slug'])
+        last_id = posts[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0017_post_reaction_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='preview',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Превью'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='slug',
+            field=models.SlugField(allow_unicode=True, blank=True, default='', editable=False, max_length=200, verbose_name='Slug'),
+        ),
+        migrations.RunPython(fill_preview_and_slug, migrations.RunPython.noop),
+    ]
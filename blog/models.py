@@ -1,8 +1,34 @@
+import re
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.urls import reverse
 from django.utils import timezone
 
+PREVIEW_LENGTH = 300
+SLUG_STRIP_RE = re.compile(r'[^\w\s-]')
+SLUG_DASH_RE = re.compile(r'[-\s]+')
+
+
+def make_preview(content):
+    """Первые 300 символов текста или текст до конца предложения после 200-го символа"""
+    if not content:
+        return ''
+    if len(content) <= PREVIEW_LENGTH:
+        return content
+    end = content.find('.', 200, PREVIEW_LENGTH + 1)
+    if end == -1:
+        end = PREVIEW_LENGTH
+    return content[:end + 1]
+
+
+def make_slug(title):
+    """Slug из заголовка: не-буквы и не-цифры заменяются дефисами"""
+    slug = SLUG_STRIP_RE.sub('', title).strip().lower()
+    slug = SLUG_DASH_RE.sub('-', slug)
+    return slug or 'post'
+
+
 class CustomUser(AbstractUser):
     email = models.EmailField('email address', unique=True)
     
@@ -21,6 +47,12 @@ class Post(models.Model):
     created_at = models.DateTimeField('Дата создания', auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField('Дата обновления', auto_now=True)
     is_published = models.BooleanField('Опубликовано', default=True, db_index=True)
+    # ✅ Превью и slug вычисляются при сохранении: карточкам на главной не нужен content
+    preview = models.TextField('Превью', blank=True, default='', editable=False)
+    slug = models.SlugField('Slug', max_length=200, allow_unicode=True, blank=True, default='', editable=False)
+    # ✅ Счетчики реакций ведет blog.reactions (F()-выражения), без агрегатов по PostReaction
+    like_count = models.PositiveIntegerField('Лайки', default=0, editable=False)
+    dislike_count = models.PositiveIntegerField('Дизлайки', default=0, editable=False)
 
     class Meta:
         verbose_name = 'Пост'
@@ -35,34 +67,40 @@ class Post(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.preview = make_preview(self.content)
+            self.slug = make_slug(self.title)
+            # Счетчики реакций меняет только blog.reactions: сохранение отредактированного
+            # поста не должно перезаписывать их значениями, прочитанными до правки
+            if not self._state.adding:
+                kwargs['update_fields'] = [
+                    field.attname for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in ('like_count', 'dislike_count')
+                ]
+        else:
+            update_fields = set(update_fields)
+            if 'content' in update_fields:
+                self.preview = make_preview(self.content)
+                update_fields.add('preview')
+            if 'title' in update_fields:
+                self.slug = make_slug(self.title)
+                update_fields.add('slug')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('blog:post_detail', kwargs={'pk': self.pk})
 
     def get_preview(self):
-        # Возвращаем первые 300 символов или до первого абзаца
-        if self.content:
-            if len(self.content) <= 300:
-                return self.content
-            else:
-                # Попробуем найти конец абзаца
-                end = self.content.find('.', 200)
-                if end == -1 or end > 300:
-                    end = 300
-                return self.content[:end+1]
-        return ''
+        # ✅ Превью хранится в поле preview (см. make_preview)
+        return self.preview
 
     @property
     def is_premium_content(self):
         return True  # Всегда премиум-контент для демонстрации функционала подписки
 
-    @property
-    def slug(self):
-        # Создаем slug из заголовка
-        import re
-        # Заменяем все не-буквы и не-цифры на дефисы
-        slug = re.sub(r'[^\w\s-]', '', self.title).strip().lower()
-        slug = re.sub(r'[-\s]+', '-', slug)
-        return slug or 'post'
 
 class PostReaction(models.Model):
     REACTION_CHOICES = [
@@ -202,4 +240,50 @@ class UserBan(models.Model):
             self.is_active = False
             self.save()
             return True
-        return False
\ No newline at end of file
+        return False
+
+class LexiconEntry(models.Model):
+    """Слово словаря модерации (исходные данные для скомпилированного словаря)"""
+    PROHIBITED = 'prohibited'
+    TOXIC = 'toxic'
+    SPAM = 'spam'
+    CATEGORY_CHOICES = [
+        (PROHIBITED, 'Строго запрещенное'),
+        (TOXIC, 'Токсичное'),
+        (SPAM, 'Спам'),
+    ]
+
+    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, verbose_name="Категория")
+    word = models.CharField(max_length=200, verbose_name="Слово или фраза")
+    is_active = models.BooleanField(default=True, verbose_name="Активно")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+
+    class Meta:
+        verbose_name = 'Слово словаря модерации'
+        verbose_name_plural = 'Словарь модерации'
+        ordering = ['category', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'word'], name='unique_lexicon_entry'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_category_display()}: {self.word}'
+
+
+class ModerationStatsRollup(models.Model):
+    """Счетчик вердиктов модерации комнаты за час (см. blog/moderation_stats.py)"""
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='moderation_stats', verbose_name="Комната")
+    hour = models.DateTimeField(verbose_name="Час")
+    reason = models.CharField(max_length=32, blank=True, default='', verbose_name="Причина блокировки")  # '' - сообщение пропущено
+    count = models.PositiveIntegerField(default=0, verbose_name="Сообщений")
+
+    class Meta:
+        verbose_name = 'Статистика модерации за час'
+        verbose_name_plural = 'Статистика модерации'
+        ordering = ['-hour']
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'hour', 'reason'], name='unique_moderation_stats_rollup'),
+        ]
+
+    def __str__(self):
+        return f'{self.room_id} {self.hour:%d.%m.%Y %H:00} {self.reason or "passed"}: {self.count}'
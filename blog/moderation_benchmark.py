@@ -0,0 +1,273 @@
+"""
+Бенчмарк системы модерации
+
+Воспроизводимый корпус сообщений (чистые, токсичные, спам, обфусцированные,
+длинные) прогоняется через moderate_message(), test_moderation() и каждую
+проверку check_* по отдельности. Для каждого этапа считаются пропускная
+способность, задержки p50/p95/p99 и память, выделяемая за вызов.
+
+Отчет - словарь, пригодный для JSON; compare_with_baseline() сравнивает его
+с сохраненным отчетом и возвращает список регрессий.
+Запуск: python manage.py benchmark_moderation
+"""
+import platform
+import random
+import time
+import tracemalloc
+from collections import Counter, namedtuple
+
+import django
+
+from .lexicon import PROHIBITED_WORDS, TOXIC_INDICATORS, SPAM_INDICATORS, MODERATION_SETTINGS, normalize_text
+from .message_analysis import analyze_message
+
+CATEGORIES = ('clean', 'toxic', 'spam', 'obfuscated', 'long')
+
+CLEAN_PHRASES = [
+    "Привет всем, как дела?",
+    "Кто-нибудь смотрел вчерашний матч?",
+    "Спасибо за статью, было интересно",
+    "Завтра обещают дождь, возьмите зонты",
+    "Я только что вернулся из отпуска",
+    "Подскажите хорошую книгу по Python",
+    "Сегодня на работе был сложный день",
+    "Давайте соберемся в субботу вечером",
+    "У меня наконец заработал новый сервер",
+    "Отличная идея, я поддерживаю",
+    "Какой у вас любимый фильм?",
+    "Во сколько начинается встреча?",
+]
+
+# Похожие латинские буквы и замены символов, которыми обходят фильтры
+LOOKALIKES = {'а': 'a', 'е': 'e', 'о': 'o', 'р': 'p', 'с': 'c', 'х': 'x', 'у': 'y'}
+MASK_CHARS = '@*'
+
+CorpusMessage = namedtuple('CorpusMessage', ['category', 'text'])
+
+
+def _single_words(words):
+    return [word for word in words if ' ' not in word and word.isalpha()]
+
+
+def _obfuscate(word, rng):
+    """Один из приемов обхода фильтра: буквы через пробел, маски, латиница, повторы"""
+    technique = rng.randrange(4)
+    if technique == 0:
+        return ' '.join(word)
+    if technique == 1:
+        vowels = [i for i, char in enumerate(word) if char in 'аеёиоуыэюя']
+        if vowels:
+            i = rng.choice(vowels)
+            return word[:i] + rng.choice(MASK_CHARS) + word[i + 1:]
+        return word
+    if technique == 2:
+        return ''.join(LOOKALIKES.get(char, char) for char in word)
+    i = rng.randrange(len(word))
+    return word[:i] + word[i] * rng.randint(2, 4) + word[i:]
+
+
+def build_corpus(seed=42, per_category=40):
+    """
+    Генерирует корпус сообщений. При одинаковых seed и per_category
+    корпус всегда один и тот же
+    """
+    rng = random.Random(seed)
+    prohibited = _single_words(PROHIBITED_WORDS)
+    toxic = _single_words(TOXIC_INDICATORS)
+    max_length = MODERATION_SETTINGS['max_message_length']
+
+    corpus = [
+        # Обязательные образцы обфускации
+        CorpusMessage('obfuscated', "х у й"),
+        CorpusMessage('obfuscated', "х@й"),
+    ]
+    for _ in range(per_category):
+        corpus.append(CorpusMessage('clean', rng.choice(CLEAN_PHRASES)))
+
+        words = rng.sample(toxic, 2)
+        corpus.append(CorpusMessage('toxic', f"{rng.choice(CLEAN_PHRASES)} Ты {words[0]} и {words[1]}"))
+
+        spam = rng.choice(SPAM_INDICATORS)
+        corpus.append(CorpusMessage('spam', f"{spam.capitalize()}! Пиши в личку, {rng.choice(CLEAN_PHRASES).lower()}"))
+
+        obfuscated = _obfuscate(rng.choice(prohibited), rng)
+        corpus.append(CorpusMessage('obfuscated', f"ну ты и {obfuscated}"))
+
+        # Длинные сообщения около лимита длины, часть - сверх лимита
+        target = rng.randint(max_length // 2, max_length + 200)
+        text = ""
+        while len(text) < target:
+            text += rng.choice(CLEAN_PHRASES) + ". "
+        corpus.append(CorpusMessage('long', text[:target].strip()))
+
+    return corpus
+
+
+def load_corpus(data):
+    """Корпус из JSON: список строк или объектов {"category": ..., "text": ...}"""
+    corpus = []
+    for item in data:
+        if isinstance(item, str):
+            corpus.append(CorpusMessage('custom', item))
+        else:
+            corpus.append(CorpusMessage(item.get('category', 'custom'), item['text']))
+    return corpus
+
+
+def percentile(samples, percent):
+    """Перцентиль по отсортированному списку (как в LatencyStats)"""
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+# prepare(text) -> аргументы вызова (вне замера), before_call() - подготовка перед каждым вызовом
+Stage = namedtuple('Stage', ['name', 'func', 'prepare', 'before_call'])
+
+
+def _warm_analysis(text):
+    """Разбор сообщения со всеми лениво вычисляемыми полями, которые читают проверки"""
+    analysis = analyze_message(text)
+    analysis.lexicon_hits
+    analysis.caps_ratio
+    return analysis
+
+
+def build_stages(user, room, policy):
+    """Этапы модерации: каждая проверка отдельно и вся цепочка целиком"""
+    from . import moderation_utils as mu
+    from .verdict_cache import get_verdict_cache
+
+    def by_analysis(text):
+        return (_warm_analysis(text),)
+
+    return [
+        Stage('normalize_text', normalize_text, lambda text: (text,), None),
+        Stage('analyze_message', _warm_analysis, lambda text: (text,), None),
+        Stage('check_message_length', mu.check_message_length, by_analysis, None),
+        Stage('check_prohibited_words', mu.check_prohibited_words, by_analysis, None),
+        Stage('check_blocked_words', mu.check_blocked_words,
+              lambda text: (_warm_analysis(text), policy), None),
+        Stage('check_toxicity', mu.check_toxicity, by_analysis, None),
+        Stage('check_spam', mu.check_spam, by_analysis, None),
+        Stage('check_suspicious_patterns', mu.check_suspicious_patterns, by_analysis, None),
+        Stage('check_user_ban', mu.check_user_ban, lambda text: (user, room), None),
+        Stage('check_message_rate', mu.check_message_rate,
+              lambda text: (user, room, policy.max_messages_per_minute), None),
+        Stage('check_message_content', mu.check_message_content, lambda text: (text, policy), None),
+        Stage('test_moderation', mu.test_moderation, lambda text: (text,), None),
+        # Без кеша вердиктов - полная стоимость проверки
+        Stage('moderate_message', mu.moderate_message,
+              lambda text: (user, room, text), get_verdict_cache().clear),
+        # С кешем вердиктов - повтор уже проверенного текста
+        Stage('moderate_message_cached', mu.moderate_message, lambda text: (user, room, text), None),
+    ]
+
+
+def measure_stage(stage, texts, iterations=5, warmup=1, allocations=True):
+    """Замеряет один этап на всем корпусе"""
+    calls = [stage.prepare(text) for text in texts]
+    func, before_call = stage.func, stage.before_call
+
+    for _ in range(warmup):
+        for args in calls:
+            if before_call:
+                before_call()
+            func(*args)
+
+    samples = []
+    perf_counter = time.perf_counter
+    for _ in range(iterations):
+        for args in calls:
+            if before_call:
+                before_call()
+            started = perf_counter()
+            func(*args)
+            samples.append(perf_counter() - started)
+
+    samples.sort()
+    total = sum(samples)
+    result = {
+        'calls': len(samples),
+        'total_s': total,
+        'ops_per_sec': len(samples) / total if total else 0.0,
+        'mean_us': total / len(samples) * 1e6 if samples else 0.0,
+        'p50_us': percentile(samples, 50) * 1e6,
+        'p95_us': percentile(samples, 95) * 1e6,
+        'p99_us': percentile(samples, 99) * 1e6,
+    }
+
+    if allocations:
+        # Отдельный проход: tracemalloc замедляет вызовы и испортил бы задержки
+        peaks = []
+        tracemalloc.start()
+        try:
+            for args in calls:
+                if before_call:
+                    before_call()
+                tracemalloc.reset_peak()
+                current, _ = tracemalloc.get_traced_memory()
+                func(*args)
+                peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        finally:
+            tracemalloc.stop()
+        result['alloc_mean_bytes'] = sum(peaks) / len(peaks) if peaks else 0.0
+        result['alloc_max_bytes'] = max(peaks, default=0)
+
+    return result
+
+
+def run_benchmark(corpus, user, room, policy, iterations=5, warmup=1, stages=None, allocations=True):
+    """Прогоняет корпус через все (или выбранные) этапы и возвращает отчет"""
+    texts = [message.text for message in corpus]
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'machine': platform.machine(),
+            'iterations': iterations,
+            'warmup': warmup,
+            'corpus_size': len(corpus),
+            'corpus': dict(Counter(message.category for message in corpus)),
+        },
+        'stages': {},
+    }
+
+    for stage in build_stages(user, room, policy):
+        if stages and stage.name not in stages:
+            continue
+        report['stages'][stage.name] = measure_stage(
+            stage, texts, iterations=iterations, warmup=warmup, allocations=allocations
+        )
+
+    return report
+
+
+def compare_with_baseline(report, baseline, threshold=0.2):
+    """
+    Сравнивает отчет с сохраненным. Регрессия - рост p95 или падение
+    пропускной способности больше чем на threshold (доля)
+    """
+    regressions = []
+    for name, current in report['stages'].items():
+        previous = baseline.get('stages', {}).get(name)
+        if not previous:
+            continue
+
+        if previous['p95_us'] and current['p95_us'] > previous['p95_us'] * (1 + threshold):
+            regressions.append({
+                'stage': name, 'metric': 'p95_us',
+                'baseline': previous['p95_us'], 'current': current['p95_us'],
+                'change': current['p95_us'] / previous['p95_us'] - 1,
+            })
+
+        if previous['ops_per_sec'] and current['ops_per_sec'] < previous['ops_per_sec'] * (1 - threshold):
+            regressions.append({
+                'stage': name, 'metric': 'ops_per_sec',
+                'baseline': previous['ops_per_sec'], 'current': current['ops_per_sec'],
+                'change': current['ops_per_sec'] / previous['ops_per_sec'] - 1,
+            })
+
+    return regressions
@@ -0,0 +1,340 @@
+"""
+Выполнение проверок текста сообщений в отдельных процессах
+
+Проверки текста (словарь, регулярные выражения) нагружают CPU и держат GIL,
+поэтому в пуле потоков они тормозят отправку сообщений другим консьюмерам.
+ModerationExecutor выполняет check_message_content() в пуле процессов:
+- словарь и скомпилированные выражения загружаются один раз в каждом процессе;
+- очередь ограничена (MAX_PENDING) с учетом проверок, которые еще идут
+  после таймаута; ожидание - TIMEOUT секунд;
+- при переполнении, таймауте или сбое пула применяется политика FAIL_MODE:
+  'open' - пропустить сообщение, 'closed' - заблокировать;
+- задержка каждой задачи доступна через stats();
+- для сообщений из выборки метрик (moderation_metrics.start_timer) воркер
+  засекает этапы проверки сам и возвращает замеры вместе с вердиктом, а
+  родительский процесс добавляет их в таймер сообщения.
+
+Проверки, которым нужна БД (бан, настройки комнаты, частота), остаются
+асинхронными в консьюмере - см. amoderate_message().
+
+Модуль не импортирует модели на верхнем уровне: он загружается в дочерних
+процессах до django.setup().
+"""
+import asyncio
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .moderation_metrics import NULL_TIMER, StageTimer
+from .verdict_cache import get_verdict_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXECUTOR_SETTINGS = {
+    'WORKERS': 2,              # 0 - проверять в пуле потоков, как раньше
+    'MAX_PENDING': 200,        # Максимум задач в очереди на процесс-воркер Daphne
+    'TIMEOUT': 2.0,            # Секунд на проверку одного сообщения
+    'FAIL_MODE': 'open',       # 'open' - пропустить, 'closed' - заблокировать
+    'START_METHOD': 'spawn',   # Не форкаем процесс с запущенным event loop
+}
+
+FAIL_CLOSED_REASON = "Модерация временно недоступна, попробуйте позже"
+
+
+class ModerationUnavailable(Exception):
+    """Проверка не выполнена: очередь переполнена, истек таймаут или пул сломан"""
+
+
+def _init_worker():
+    """Инициализация процесса пула: Django и словарь модерации загружаются один раз"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog_project.settings')
+
+    import django
+    django.setup()
+
+    from . import moderation_utils  # noqa: F401 - компилирует словарь
+
+
+def _warm_up_task():
+    return os.getpid()
+
+
+def _check_content_task(content, policy, moderation_level, timed=False):
+    """Возвращает: (вердикт, [(этап, секунды), ...]); замеры - только если timed"""
+    from .moderation_utils import check_message_content
+
+    if not timed:
+        return check_message_content(content, policy, moderation_level), []
+    # Приемник метрик - в родительском процессе: таймер воркера только копит замеры
+    timer = StageTimer(sink=None)
+    return check_message_content(content, policy, moderation_level, timer), timer.durations
+
+
+class LatencyStats:
+    """Задержки последних задач (секунды) и счетчики отказов"""
+
+    def __init__(self, size=1000):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failures = {}
+
+    def add(self, duration):
+        with self._lock:
+            self._samples.append(duration)
+            self.completed += 1
+
+    def fail(self, reason):
+        with self._lock:
+            self.failures[reason] = self.failures.get(reason, 0) + 1
+
+    def percentile(self, percent):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def as_dict(self):
+        return {
+            'completed': self.completed,
+            'failures': dict(self.failures),
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+        }
+
+
+class ModerationExecutor:
+    """Пул процессов для проверок текста с ограниченной очередью"""
+
+    def __init__(self, workers=2, max_pending=200, timeout=2.0, fail_mode='open', start_method='spawn'):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.fail_mode = fail_mode
+        self.start_method = start_method
+
+        self.latency = LatencyStats()
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        config = dict(DEFAULT_EXECUTOR_SETTINGS, **getattr(settings, 'MODERATION_EXECUTOR', {}))
+        return cls(
+            workers=config['WORKERS'],
+            max_pending=config['MAX_PENDING'],
+            timeout=config['TIMEOUT'],
+            fail_mode=config['FAIL_MODE'],
+            start_method=config['START_METHOD'],
+        )
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker,
+                )
+            return self._pool
+
+    def warm_up(self):
+        """Запускает процессы пула заранее, чтобы первые сообщения не ждали их старта"""
+        if self.workers <= 0:
+            return
+        pool = self._get_pool()
+        for _ in range(self.workers):
+            pool.submit(_warm_up_task)
+
+    def _reset_pool(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        self._reset_pool()
+
+    def _fallback(self, reason):
+        """Вердикт, когда проверка не выполнена (переполнение, таймаут, сбой)"""
+        self.latency.fail(reason)
+        logger.warning(f"Модерация не выполнена ({reason}), режим fail-{self.fail_mode}")
+        if self.fail_mode == 'closed':
+            return True, FAIL_CLOSED_REASON
+        return False, ""
+
+    async def run(self, content, policy, moderation_level='moderate', timer=NULL_TIMER):
+        """
+        Проверяет текст сообщения. Возвращает: (is_blocked, reason)
+        ✅ Повторы уже проверенного текста отдаются из кеша вердиктов без пула;
+        замеры этапов проверки добавляются в timer
+        """
+        verdict_cache = get_verdict_cache()
+        key = verdict_cache.make_key(content, policy, moderation_level)
+
+        verdict = verdict_cache.get_local(key)
+        if verdict is None and verdict_cache.shared:
+            verdict = await sync_to_async(verdict_cache.get_shared, thread_sensitive=False)(key)
+        if verdict is not None:
+            return verdict
+        verdict_cache.record_miss()
+
+        try:
+            verdict, durations = await self._run(content, policy, moderation_level, timer is not NULL_TIMER)
+        except ModerationUnavailable as e:
+            # Вердикт по политике отказа не кешируется
+            return self._fallback(str(e))
+        timer.extend(durations)
+
+        verdict_cache.set_local(key, verdict)
+        if verdict_cache.shared:
+            await sync_to_async(verdict_cache.set_shared, thread_sensitive=False)(key, verdict)
+        return verdict
+
+    async def _run(self, content, policy, moderation_level, timed=False):
+        """Выполняет проверку или выбрасывает ModerationUnavailable. Возвращает: (вердикт, замеры)"""
+        if self.workers <= 0:
+            started = time.perf_counter()
+            result = await sync_to_async(_check_content_task, thread_sensitive=False)(
+                content, policy, moderation_level, timed
+            )
+            self.latency.add(time.perf_counter() - started)
+            return result
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                queue_full = True
+            else:
+                queue_full = False
+                self._pending += 1
+        if queue_full:
+            raise ModerationUnavailable('queue_full')
+
+        started = time.perf_counter()
+        try:
+            future = self._get_pool().submit(_check_content_task, content, policy, moderation_level, timed)
+        except BrokenProcessPool:
+            self._release()
+            self._reset_pool()
+            raise ModerationUnavailable('broken_pool')
+        except BaseException:
+            self._release()
+            raise
+        # Задача занимает место в очереди, пока не завершится: cancel() после
+        # таймаута не останавливает уже запущенную проверку
+        future.add_done_callback(self._release)
+
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise ModerationUnavailable('timeout')
+        except BrokenProcessPool:
+            self._reset_pool()
+            raise ModerationUnavailable('broken_pool')
+
+        self.latency.add(time.perf_counter() - started)
+        return result
+
+    def _release(self, future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self):
+        stats = self.latency.as_dict()
+        stats['pending'] = self._pending
+        stats['workers'] = self.workers
+        return stats
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_moderation_executor():
+    """Исполнитель проверок текущего процесса (создается при первом подключении)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ModerationExecutor.from_settings()
+            _executor.warm_up()
+            atexit.register(_executor.shutdown)
+        return _executor
+
+
+async def amoderate_message(user, room, content, moderation_level='moderate'):
+    """
+    ✅ Асинхронная версия moderate_message для консьюмера:
+    бан, настройки и частота проверяются в потоке БД,
+    текст сообщения - в пуле процессов
+
+    Возвращает: (is_blocked, reason)
+    """
+    from .moderation_metrics import start_timer
+    from .moderation_stats import record_moderation_verdict
+
+    timer = start_timer()
+    try:
+        verdict = await _amoderate_message(user, room, content, moderation_level, timer)
+    except Exception as e:
+        logger.error(f"Ошибка при модерации сообщения: {e}", exc_info=True)
+        verdict = (False, "")
+    finally:
+        timer.finish()
+
+    # Только счетчик в памяти процесса - в БД его сбрасывает фоновый поток
+    record_moderation_verdict(room, *verdict)
+    return verdict
+
+
+async def _amoderate_message(user, room, content, moderation_level, timer):
+    from channels.db import database_sync_to_async
+    from .moderation_policy import get_moderation_policy
+    from .moderation_utils import check_user_ban, check_message_rate
+
+    # 1. Проверяем, не заблокирован ли пользователь
+    is_banned, ban_reason = await database_sync_to_async(check_user_ban)(user, room)
+    timer.lap('ban')
+    if is_banned:
+        return True, ban_reason
+
+    # 2. Получаем настройки модерации для комнаты
+    policy = await database_sync_to_async(get_moderation_policy)(room)
+    timer.lap('policy')
+    if not policy.enabled:
+        return False, ""
+
+    # 3-9. Проверяем текст сообщения в пуле процессов
+    is_blocked, reason = await get_moderation_executor().run(content, policy, moderation_level, timer)
+    # Этапы проверки (analyze, prohibited_words, ...) засекает сам воркер и добавляет
+    # их в timer; 'executor' - остальное время run(): кеш вердиктов, очередь и передача
+    timer.lap('executor')
+    if is_blocked:
+        return True, reason
+
+    # 10. Проверяем частоту сообщений (и записываем разрешенное сообщение)
+    is_rate_limited, rate_reason = await database_sync_to_async(check_message_rate)(
+        user, room, policy.max_messages_per_minute
+    )
+    timer.lap('rate')
+    if is_rate_limited:
+        return True, rate_reason
+
+    return False, ""
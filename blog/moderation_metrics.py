@@ -0,0 +1,278 @@
+"""
+Метрики этапов модерации
+
+moderate_message() засекает длительность каждого шага (бан, настройки,
+разбор текста, словарь, выражения, частота) и передает их в приемник метрик
+из настройки MODERATION_METRICS:
+- SINK - класс приемника (HistogramMetricsSink или NullMetricsSink);
+- SAMPLE_RATE - доля сообщений, для которых снимаются замеры (0..1);
+- FLUSH_INTERVAL - раз в сколько секунд сбрасывать гистограммы.
+
+HistogramMetricsSink копит гистограммы с фиксированными корзинами в памяти
+процесса. Фоновый поток раз в FLUSH_INTERVAL пишет перцентили в логгер
+blog.performance (см. logging_config.py) и публикует снимок в кеш, откуда
+его читает команда moderation_metrics.
+"""
+import bisect
+import logging
+import os
+import random
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('blog.performance')
+
+DEFAULT_METRICS_SETTINGS = {
+    'SINK': 'blog.moderation_metrics.HistogramMetricsSink',
+    'SAMPLE_RATE': 0.1,
+    'FLUSH_INTERVAL': 60,
+}
+
+METRICS_KEY_PREFIX = 'moderation_metrics'
+REGISTRY_KEY = f'{METRICS_KEY_PREFIX}:processes'
+
+# Границы корзин (секунды): от 1 мкс до ~10 с с шагом 2^(1/4) (~19%)
+BUCKET_BOUNDS = [1e-6 * 2 ** (i / 4) for i in range(94)]
+
+
+class StageHistogram:
+    """Гистограмма длительностей с фиксированными корзинами: снимки разных процессов складываются"""
+
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def merge(self, data):
+        for i, value in enumerate(data['buckets']):
+            self.buckets[i] += value
+        self.count += data['count']
+        self.total += data['total']
+        self.max = max(self.max, data['max'])
+
+    def percentile(self, percent):
+        """Верхняя граница корзины, в которую попал перцентиль"""
+        if not self.count:
+            return 0.0
+        rank = percent / 100 * self.count
+        seen = 0
+        for i, value in enumerate(self.buckets):
+            seen += value
+            if value and seen >= rank:
+                return min(BUCKET_BOUNDS[i], self.max) if i < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {'buckets': list(self.buckets), 'count': self.count, 'total': self.total, 'max': self.max}
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class NullMetricsSink:
+    """Приемник, который ничего не замеряет"""
+
+    sample_rate = 0.0
+
+    def sample(self):
+        return False
+
+    def record_many(self, durations):
+        pass
+
+    def snapshot(self):
+        return {}
+
+
+class HistogramMetricsSink(NullMetricsSink):
+    """Гистограммы этапов в памяти процесса с периодическим сбросом в лог и кеш"""
+
+    def __init__(self, sample_rate=0.1, flush_interval=60):
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.process_id = f'{socket.gethostname()}:{os.getpid()}'
+
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    @classmethod
+    def from_settings(cls, config):
+        return cls(sample_rate=config['SAMPLE_RATE'], flush_interval=config['FLUSH_INTERVAL'])
+
+    def sample(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record_many(self, durations):
+        """Записывает замеры одного сообщения: [(этап, секунды), ...]"""
+        with self._lock:
+            for stage, duration in durations:
+                histogram = self._histograms.get(stage)
+                if histogram is None:
+                    histogram = self._histograms[stage] = StageHistogram()
+                histogram.add(duration)
+
+        if self._flusher is None and self.flush_interval:
+            self._start_flusher()
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: histogram.as_dict() for stage, histogram in self._histograms.items()}
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name='moderation-metrics', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Не удалось сбросить метрики модерации: {e}")
+
+    def flush(self):
+        """Пишет перцентили окна в лог, публикует снимок в кеш и начинает новое окно"""
+        with self._lock:
+            histograms, self._histograms = self._histograms, {}
+
+        for stage, histogram in sorted(histograms.items()):
+            summary = histogram.summary()
+            logger.info(
+                f"moderation stage={stage} count={summary['count']} "
+                f"p50={summary['p50_ms']:.3f}ms p95={summary['p95_ms']:.3f}ms "
+                f"p99={summary['p99_ms']:.3f}ms max={summary['max_ms']:.3f}ms"
+            )
+
+        publish_snapshot(
+            self.process_id,
+            {stage: histogram.as_dict() for stage, histogram in histograms.items()},
+            timeout=max(self.flush_interval * 3, 60),
+        )
+
+
+def publish_snapshot(process_id, stages, timeout):
+    """Сохраняет снимок процесса в кеше и отмечает процесс в реестре"""
+    now = time.time()
+    cache.set(f'{METRICS_KEY_PREFIX}:{process_id}', {'flushed_at': now, 'stages': stages}, timeout)
+
+    # Гонка при обновлении реестра не страшна: процесс добавит себя при следующем сбросе
+    registry = cache.get(REGISTRY_KEY) or {}
+    registry = {pid: seen for pid, seen in registry.items() if now - seen < timeout}
+    registry[process_id] = now
+    cache.set(REGISTRY_KEY, registry, timeout)
+
+
+def collect_snapshots():
+    """Складывает последние снимки всех процессов: {этап: StageHistogram}, число процессов"""
+    registry = cache.get(REGISTRY_KEY) or {}
+    snapshots = cache.get_many([f'{METRICS_KEY_PREFIX}:{pid}' for pid in registry])
+
+    histograms = {}
+    for snapshot in snapshots.values():
+        for stage, data in snapshot['stages'].items():
+            histograms.setdefault(stage, StageHistogram()).merge(data)
+
+    return histograms, len(snapshots)
+
+
+class StageTimer:
+    """Замеры шагов одного сообщения; передаются в приемник одним вызовом в finish()"""
+
+    __slots__ = ('sink', 'started', 'last', 'durations')
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.started = self.last = time.perf_counter()
+        self.durations = []
+
+    def lap(self, stage):
+        """Длительность шага - время с предыдущей отметки"""
+        now = time.perf_counter()
+        self.durations.append((stage, now - self.last))
+        self.last = now
+
+    def extend(self, durations):
+        """
+        Добавляет замеры, снятые в другом процессе (пул ModerationExecutor).
+        Их время не входит в следующий lap: сумма этапов не превышает total
+        """
+        self.durations.extend(durations)
+        self.last += sum(duration for _, duration in durations)
+
+    def finish(self, stage='total'):
+        self.durations.append((stage, time.perf_counter() - self.started))
+        self.sink.record_many(self.durations)
+
+
+class NullTimer:
+    """Таймер сообщения, не попавшего в выборку"""
+
+    __slots__ = ()
+
+    def lap(self, stage):
+        pass
+
+    def extend(self, durations):
+        pass
+
+    def finish(self, stage='total'):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+_metrics_sink = None
+
+
+def get_metrics_sink():
+    """Приемник метрик из настройки MODERATION_METRICS (один на процесс)"""
+    global _metrics_sink
+    if _metrics_sink is None:
+        config = dict(DEFAULT_METRICS_SETTINGS, **getattr(settings, 'MODERATION_METRICS', {}))
+        sink_class = import_string(config['SINK'])
+        _metrics_sink = sink_class.from_settings(config) if hasattr(sink_class, 'from_settings') else sink_class()
+    return _metrics_sink
+
+
+def start_timer():
+    """Таймер для очередного сообщения с учетом SAMPLE_RATE"""
+    sink = get_metrics_sink()
+    if sink.sample():
+        return StageTimer(sink)
+    return NULL_TIMER
+
+
+@receiver(setting_changed)
+def reset_metrics_sink(setting, **kwargs):
+    """Сбрасывает приемник при override_settings в тестах"""
+    global _metrics_sink
+    if setting == 'MODERATION_METRICS':
+        _metrics_sink = None
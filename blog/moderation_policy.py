@@ -0,0 +1,125 @@
+"""
+Скомпилированные политики модерации комнат
+
+Настройки ModerationSettings комнаты один раз превращаются в неизменяемый
+объект ModerationPolicy с готовым регулярным выражением для всех
+заблокированных слов комнаты и хранятся в памяти процесса.
+
+Изменения настроек (сигналы post_save/post_delete) увеличивают версию в кеше,
+по которой все процессы сбрасывают свои политики не позже чем через
+MODERATION_POLICY_REFRESH_INTERVAL секунд.
+"""
+import hashlib
+import re
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+
+from .cache_utils import VersionWatcher, bump_cache_version
+
+MODERATION_POLICY_VERSION = 'moderation_policy'
+
+# Значения для комнаты без настроек (как в moderate_message до кеширования)
+DEFAULT_POLICY_SETTINGS = {
+    'enabled': True,
+    'blocked_words': "",
+    'max_messages_per_minute': 10,
+    'enable_toxicity_filter': True,
+}
+
+
+class ModerationPolicy(namedtuple('ModerationPolicy', [
+    'room_id', 'enabled', 'enable_toxicity_filter', 'max_messages_per_minute',
+    'blocked_words', 'blocked_words_re', 'version',
+])):
+    """
+    Настройки модерации комнаты, готовые к проверке сообщений.
+    version - отпечаток настроек, влияющих на проверку текста: одинаковый
+    у комнат с одинаковыми правилами и меняется при их изменении
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_settings(cls, moderation_settings):
+        blocked_words = tuple(moderation_settings.blocked_words_list)
+        return cls(
+            room_id=moderation_settings.room_id,
+            enabled=moderation_settings.enabled,
+            enable_toxicity_filter=moderation_settings.enable_toxicity_filter,
+            max_messages_per_minute=moderation_settings.max_messages_per_minute,
+            blocked_words=blocked_words,
+            blocked_words_re=compile_blocked_words(blocked_words),
+            version=policy_version(moderation_settings.enable_toxicity_filter, blocked_words),
+        )
+
+
+def policy_version(enable_toxicity_filter, blocked_words):
+    """Отпечаток правил проверки текста"""
+    fingerprint = f"{int(enable_toxicity_filter)}:" + '\n'.join(sorted(set(blocked_words)))
+    return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:16]
+
+
+def compile_blocked_words(words):
+    """
+    Компилирует список слов в одно регулярное выражение \\b(?:w1|w2|...)\\b.
+    Совпадение есть тогда и только тогда, когда есть совпадение для одного из слов
+    """
+    if not words:
+        return None
+
+    # Длинные слова первыми - меньше возвратов при общих префиксах
+    alternation = '|'.join(re.escape(word) for word in sorted(set(words), key=len, reverse=True))
+    return re.compile(r'\b(?:' + alternation + r')\b')
+
+
+class ModerationPolicyCache:
+    """Политики модерации по room_id в памяти процесса"""
+
+    def __init__(self, refresh_interval=None):
+        if refresh_interval is None:
+            refresh_interval = getattr(settings, 'MODERATION_POLICY_REFRESH_INTERVAL', 1.0)
+
+        self._watcher = VersionWatcher(MODERATION_POLICY_VERSION, refresh_interval)
+        self._lock = threading.RLock()
+        self._policies = {}
+
+    def invalidate(self):
+        """Сбрасывает политики текущего процесса"""
+        with self._lock:
+            self._policies.clear()
+
+    def get(self, room):
+        with self._lock:
+            if self._watcher.changed():
+                self._policies.clear()
+
+            policy = self._policies.get(room.pk)
+            if policy is None:
+                policy = self._load(room)
+                self._policies[room.pk] = policy
+
+            return policy
+
+    def _load(self, room):
+        from .models import ModerationSettings
+
+        moderation_settings, created = ModerationSettings.objects.get_or_create(
+            room=room,
+            defaults=DEFAULT_POLICY_SETTINGS
+        )
+        return ModerationPolicy.from_settings(moderation_settings)
+
+
+policy_cache = ModerationPolicyCache()
+
+
+def get_moderation_policy(room):
+    """Возвращает скомпилированную политику модерации комнаты"""
+    return policy_cache.get(room)
+
+
+def invalidate_moderation_policies():
+    """Сбрасывает политики в текущем процессе и оповещает остальные процессы"""
+    policy_cache.invalidate()
+    bump_cache_version(MODERATION_POLICY_VERSION)
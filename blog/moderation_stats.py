@@ -0,0 +1,229 @@
+"""
+Счетчики статистики модерации по комнатам и часам
+
+Каждый вердикт модерации (moderate_message/amoderate_message) увеличивает
+один счетчик (комната, час, причина) в памяти процесса. Причина - ключ из
+REASON_KEYS ('' - сообщение пропущено). Фоновый поток раз в FLUSH_INTERVAL
+секунд прибавляет накопленное к строкам ModerationStatsRollup через F(),
+так что процессы не затирают счетчики друг друга.
+
+get_moderation_stats() суммирует не больше WINDOW_DAYS * 24 строк на причину,
+сколько бы сообщений ни было в комнате. Настройки - MODERATION_STATS:
+- ENABLED - записывать ли вердикты;
+- FLUSH_INTERVAL - раз в сколько секунд сбрасывать счетчики в БД
+  (0 - только вручную через flush());
+- WINDOW_DAYS - окно статистики по умолчанию.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Sum
+from django.dispatch import receiver
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATS_SETTINGS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 10,
+    'WINDOW_DAYS': 7,
+}
+
+PASSED = ''
+
+# Причина блокировки -> ключ счетчика (по началу текста причины)
+REASON_KEYS = [
+    ('Пользователь заблокирован', 'ban'),
+    ('Превышено ограничение частоты', 'rate'),
+    ('Сообщение слишком', 'length'),
+    ('Сообщение содержит запрещенные', 'prohibited'),
+    ('Будьте вежливы', 'blocked_words'),
+    ('Токсичное', 'toxicity'),
+    ('Обнаружен спам', 'spam'),
+    ('Слишком много заглавных', 'caps'),
+    ('Запрещены ссылки', 'links'),
+    ('Модерация временно недоступна', 'unavailable'),
+]
+
+REASON_LABELS = {
+    'ban': 'Бан',
+    'rate': 'Частота сообщений',
+    'length': 'Длина',
+    'prohibited': 'Запрещенные слова',
+    'blocked_words': 'Слова комнаты',
+    'toxicity': 'Токсичность',
+    'spam': 'Спам',
+    'caps': 'Заглавные буквы',
+    'links': 'Ссылки',
+    'unavailable': 'Модерация недоступна',
+    'other': 'Другое',
+}
+
+
+def get_stats_settings():
+    return dict(DEFAULT_STATS_SETTINGS, **getattr(settings, 'MODERATION_STATS', {}))
+
+
+def reason_key(reason):
+    """Ключ счетчика для текста причины блокировки"""
+    for prefix, key in REASON_KEYS:
+        if reason.startswith(prefix):
+            return key
+    return 'other'
+
+
+def hour_bucket(moment=None):
+    """Начало часа, к которому относится момент"""
+    moment = moment or timezone.now()
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class ModerationStatsRecorder:
+    """Счетчики вердиктов процесса с периодическим сбросом в ModerationStatsRollup"""
+
+    def __init__(self, flush_interval=10):
+        self.flush_interval = flush_interval
+
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    @classmethod
+    def from_settings(cls, config):
+        return cls(flush_interval=config['FLUSH_INTERVAL'])
+
+    def record(self, room_id, is_blocked, reason=''):
+        key = (room_id, hour_bucket(), reason_key(reason) if is_blocked else PASSED)
+        with self._lock:
+            self._pending[key] += 1
+
+        if self._flusher is None and self.flush_interval:
+            self._start_flusher()
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def discard(self):
+        with self._lock:
+            self._pending.clear()
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name='moderation-stats', daemon=True)
+        self._flusher.start()
+        atexit.register(self._flush_safely)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self._flush_safely()
+            close_old_connections()
+
+    def _flush_safely(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить статистику модерации: {e}")
+
+    def flush(self):
+        """
+        Прибавляет накопленные счетчики к строкам в БД.
+        Несохраненные из-за ошибки счетчики возвращаются в буфер
+        """
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+
+        items = list(pending.items())
+        try:
+            while items:
+                (room_id, hour, reason), count = items[-1]
+                add_to_rollup(room_id, hour, reason, count)
+                items.pop()
+        except Exception:
+            with self._lock:
+                self._pending.update(dict(items))
+            raise
+
+
+def add_to_rollup(room_id, hour, reason, count):
+    """Атомарно прибавляет count к счетчику (комната, час, причина)"""
+    from .models import ModerationStatsRollup
+
+    rows = ModerationStatsRollup.objects.filter(room_id=room_id, hour=hour, reason=reason)
+    if rows.update(count=F('count') + count):
+        return
+    try:
+        with transaction.atomic():
+            ModerationStatsRollup.objects.create(room_id=room_id, hour=hour, reason=reason, count=count)
+    except IntegrityError:
+        # Строку успел создать другой процесс (или комната удалена - тогда счетчик не нужен)
+        rows.update(count=F('count') + count)
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_stats_recorder():
+    """Счетчики текущего процесса; None, если запись отключена"""
+    global _recorder
+    if _recorder is None:
+        config = get_stats_settings()
+        if not config['ENABLED']:
+            return None
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = ModerationStatsRecorder.from_settings(config)
+    return _recorder
+
+
+def record_moderation_verdict(room, is_blocked, reason=''):
+    """Учитывает вердикт модерации в статистике комнаты"""
+    recorder = get_stats_recorder()
+    if recorder is not None:
+        recorder.record(room.pk, is_blocked, reason)
+
+
+def get_moderation_stats(room, days=None):
+    """
+    Статистика модерации комнаты за последние days дней (с точностью до часа)
+    по счетчикам ModerationStatsRollup
+    """
+    from .models import ModerationStatsRollup
+
+    if days is None:
+        days = get_stats_settings()['WINDOW_DAYS']
+
+    rows = ModerationStatsRollup.objects.filter(
+        room=room, hour__gte=hour_bucket(timezone.now() - timedelta(days=days))
+    ).values('reason').annotate(messages=Sum('count')).order_by()
+
+    reasons = {row['reason']: row['messages'] for row in rows}
+    passed = reasons.pop(PASSED, 0)
+    blocked_messages = sum(reasons.values())
+    total_messages = passed + blocked_messages
+
+    return {
+        'total_messages': total_messages,
+        'blocked_messages': blocked_messages,
+        'block_rate': (blocked_messages / total_messages * 100) if total_messages > 0 else 0,
+        'reasons': dict(sorted(reasons.items(), key=lambda item: -item[1])),
+    }
+
+
+@receiver(setting_changed)
+def reset_stats_recorder(setting, **kwargs):
+    """Сбрасывает счетчики процесса при override_settings в тестах"""
+    global _recorder
+    if setting == 'MODERATION_STATS':
+        _recorder = None
@@ -1,120 +1,103 @@
+import logging
 import re
 from datetime import timedelta
+from django.db import transaction
 from django.utils import timezone
-from django.db.models import Q
-from .models import ModerationSettings, UserMessageRate, Message, UserBan
+from .models import UserMessageRate, UserBan
 from .lexicon import (
-    PROHIBITED_WORDS,
-    TOXIC_INDICATORS,
-    SPAM_INDICATORS,
     MODERATION_SETTINGS,
     MODERATION_LEVELS,
-    normalize_text,  # ✅ ИМПОРТИРУЕМ ФУНКЦИЮ НОРМАЛИЗАЦИИ
-    contains_prohibited_word  # ✅ ИМПОРТИРУЕМ УМНУЮ ПРОВЕРКУ
 )
+from .message_analysis import analyze_message  # ✅ ОДИН РАЗБОР СООБЩЕНИЯ ДЛЯ ВСЕХ ПРОВЕРОК
+from .rate_limiting import get_rate_limiter
+from .ban_index import get_ban_index, invalidate_ban_index
+from .moderation_policy import get_moderation_policy
+from .verdict_cache import check_message_content_cached
+from .moderation_metrics import start_timer, NULL_TIMER
+from .moderation_stats import record_moderation_verdict
+from .moderation_stats import get_moderation_stats  # noqa: F401 - прежний адрес функции (moderation_utils)
+
+logger = logging.getLogger(__name__)
 
 def check_user_ban(user, room=None):
     """
     Проверяет, заблокирован ли пользователь
+    ✅ Проверка по индексу активных банов в памяти, без запросов к БД
     Возвращает: (is_banned, reason)
     """
-    cleanup_expired_bans()
-
-    active_bans = UserBan.objects.filter(
-        user=user,
-        is_active=True
-    )
-
-    if room:
-        active_bans = active_bans.filter(
-            Q(room=room) | Q(room=None)
-        )
-
-    for ban in active_bans:
-        if ban.is_permanent:
-            return True, f"Пользователь заблокирован навсегда. Причина: {ban.reason}"
-        elif ban.expires_at:
-            return True, f"Пользователь заблокирован до {ban.expires_at.strftime('%d.%m.%Y %H:%M')}. Причина: {ban.reason}"
-        else:
-            return True, f"Пользователь заблокирован. Причина: {ban.reason}"
+    ban = get_ban_index().find_active_ban(user.pk, room.pk if room else None)
 
-    return False, ""
+    if ban is None:
+        return False, ""
 
-def check_blocked_words(content, blocked_words_list):
+    if ban.is_permanent:
+        return True, f"Пользователь заблокирован навсегда. Причина: {ban.reason}"
+    elif ban.expires_at:
+        return True, f"Пользователь заблокирован до {ban.expires_at.strftime('%d.%m.%Y %H:%M')}. Причина: {ban.reason}"
+    else:
+        return True, f"Пользователь заблокирован. Причина: {ban.reason}"
+
+def check_blocked_words(analysis, policy):
     """
     Проверяет содержимое сообщения на наличие заблокированных слов
+    ✅ Все слова комнаты проверяются одним заранее скомпилированным выражением
     """
-    if not blocked_words_list:
+    if policy.blocked_words_re is None:
         return False, ""
 
-    content_lower = content.lower()
-
-    for word in blocked_words_list:
-        if word in content_lower:
-            pattern = r'\b' + re.escape(word) + r'\b'
-            if re.search(pattern, content_lower):
-                return True, "Будьте вежливы"
+    if policy.blocked_words_re.search(analysis.lowered):
+        return True, "Будьте вежливы"
 
     return False, ""
 
-def check_prohibited_words(content):
+def check_prohibited_words(analysis):
     """
     ✅ УЛУЧШЕНО: Проверяет содержимое сообщения на СТРОГО ЗАПРЕЩЕННЫЕ слова
     Использует PROHIBITED_WORDS из lexicon.py (~155 слов)
     Применяет нормализацию текста для обхода обфускации
     """
-    # Проверяем каждое запрещенное слово
-    for word in PROHIBITED_WORDS:
-        if contains_prohibited_word(content, word):
-            return True, "Сообщение содержит запрещенные слова"
+    if analysis.lexicon_hits.is_prohibited:
+        return True, "Сообщение содержит запрещенные слова"
 
     return False, ""
 
-def check_toxicity(content):
+def check_toxicity(analysis):
     """
     ✅ УЛУЧШЕНО: Проверяет сообщение на токсичность
     Использует TOXIC_INDICATORS из lexicon.py (~150 слов)
     Блокирует, если найдено 2+ токсичных слова
     """
-    toxic_count = 0
-
-    for indicator in TOXIC_INDICATORS:
-        if contains_prohibited_word(content, indicator):
-            toxic_count += 1
-
-            if toxic_count >= 2:
-                return True, "Токсичное сообщение (множественные оскорбления)"
+    if analysis.lexicon_hits.toxic_count >= 2:
+        return True, "Токсичное сообщение (множественные оскорбления)"
 
     return False, ""
 
-def check_spam(content):
+def check_spam(analysis):
     """
     ✅ НОВОЕ: Проверяет сообщение на спам-индикаторы
     Использует SPAM_INDICATORS из lexicon.py (~95 слов)
     """
-    content_lower = content.lower()
-
-    for spam_word in SPAM_INDICATORS:
-        if spam_word in content_lower:
-            return True, f"Обнаружен спам"
+    if analysis.lexicon_hits.is_spam:
+        return True, f"Обнаружен спам"
 
     return False, ""
 
-def check_suspicious_patterns(content):
+def check_suspicious_patterns(analysis):
     """
     ✅ УЛУЧШЕНО: Проверяет сообщение на подозрительные паттерны
     - Повторяющиеся символы (ааааааа)
     - Много заглавных букв (КРИЧИТ)
     - URL-адреса
     """
+    content = analysis.content
+
     # Проверка повторяющихся символов
     if re.search(r'(.)\1{4,}', content):
         return True, "Обнаружен спам (повторяющиеся символы)"
 
     # Проверка заглавных букв
     if len(content) > 10:
-        caps_ratio = sum(1 for c in content if c.isupper()) / len(content)
-        if caps_ratio > MODERATION_SETTINGS['max_caps_ratio']:
+        if analysis.caps_ratio > MODERATION_SETTINGS['max_caps_ratio']:
             return True, "Слишком много заглавных букв"
 
     # Проверка на URL
@@ -133,26 +116,22 @@ def check_suspicious_patterns(content):
 def check_message_rate(user, room, max_messages_per_minute):
     """
     Проверяет частоту сообщений пользователя
+    ✅ Проверка и запись сообщения выполняются одной атомарной операцией
+    бэкенда MODERATION_RATE_LIMITER (по умолчанию - Redis)
     """
-    time_threshold = timezone.now() - timedelta(minutes=1)
+    allowed = get_rate_limiter().hit(user.pk, room.pk, max_messages_per_minute)
 
-    recent_messages_count = UserMessageRate.objects.filter(
-        user=user,
-        room=room,
-        timestamp__gte=time_threshold
-    ).count()
-
-    if recent_messages_count >= max_messages_per_minute:
+    if not allowed:
         return True, f"Превышено ограничение частоты сообщений: {max_messages_per_minute} в минуту"
 
     return False, ""
 
-def check_message_length(content):
+def check_message_length(analysis):
     """
     ✅ НОВОЕ: Проверяет длину сообщения
     Использует MODERATION_SETTINGS из lexicon.py
     """
-    length = len(content)
+    length = len(analysis.content)
 
     if length < MODERATION_SETTINGS['min_message_length']:
         return True, "Сообщение слишком короткое"
@@ -162,6 +141,63 @@ def check_message_length(content):
 
     return False, ""
 
+def check_message_content(content, policy, moderation_level='moderate', timer=NULL_TIMER):
+    """
+    ✅ НОВОЕ: Проверки только текста сообщения (шаги 3-9 moderate_message)
+    Не обращается к БД, поэтому может выполняться в отдельном процессе
+    timer отмечает длительность каждой проверки (см. moderation_metrics)
+
+    Возвращает: (is_blocked, reason)
+    """
+    # 3. Получаем уровень модерации
+    level_settings = MODERATION_LEVELS.get(moderation_level, MODERATION_LEVELS['moderate'])
+
+    # ✅ Нормализуем и разбираем сообщение один раз для всех проверок
+    analysis = analyze_message(content)
+    timer.lap('analyze')
+
+    # 4. Проверяем длину сообщения
+    is_invalid_length, length_reason = check_message_length(analysis)
+    timer.lap('length')
+    if is_invalid_length:
+        return True, length_reason
+
+    # 5. ✅ ГЛАВНАЯ ПРОВЕРКА: СТРОГО ЗАПРЕЩЕННЫЕ слова (всегда проверяем)
+    if level_settings['prohibited_words']:
+        is_prohibited, prohibited_reason = check_prohibited_words(analysis)
+        timer.lap('prohibited_words')  # Включает проход словаря
+        if is_prohibited:
+            return True, "Сообщение содержит запрещенные слова"
+
+    # 6. Проверяем пользовательские заблокированные слова
+    is_blocked, reason = check_blocked_words(analysis, policy)
+    timer.lap('blocked_words')
+    if is_blocked:
+        return True, reason
+
+    # 7. Проверяем токсичность (если включено)
+    if level_settings['toxic_indicators'] and policy.enable_toxicity_filter:
+        is_toxic, toxic_reason = check_toxicity(analysis)
+        timer.lap('toxicity')
+        if is_toxic:
+            return True, toxic_reason
+
+    # 8. Проверяем спам-индикаторы
+    if level_settings['spam_indicators']:
+        is_spam, spam_reason = check_spam(analysis)
+        timer.lap('spam')
+        if is_spam:
+            return True, spam_reason
+
+    # 9. Проверяем подозрительные паттерны
+    if level_settings['suspicious_patterns']:
+        is_suspicious, suspicious_reason = check_suspicious_patterns(analysis)
+        timer.lap('suspicious_patterns')
+        if is_suspicious:
+            return True, suspicious_reason
+
+    return False, ""
+
 def moderate_message(user, room, content, moderation_level='moderate'):
     """
     ✅ ОБНОВЛЕНО: Основная функция автоматической модерации
@@ -173,135 +209,119 @@ def moderate_message(user, room, content, moderation_level='moderate'):
     - moderation_level: уровень строгости ('strict', 'moderate', 'relaxed')
 
     Возвращает: (is_blocked, reason)
+    ✅ Длительность каждого шага пишется в метрики (для доли SAMPLE_RATE сообщений)
+    ✅ Вердикт учитывается в почасовых счетчиках статистики комнаты
     """
+    timer = start_timer()
     try:
-        # 1. Проверяем, не заблокирован ли пользователь
-        is_banned, ban_reason = check_user_ban(user, room)
-        if is_banned:
-            return True, ban_reason
-
-        # 2. Получаем настройки модерации для комнаты
-        try:
-            settings = ModerationSettings.objects.get(room=room)
-        except ModerationSettings.DoesNotExist:
-            settings = ModerationSettings.objects.create(
-                room=room,
-                enabled=True,
-                blocked_words="",
-                max_messages_per_minute=10,
-                enable_toxicity_filter=True
-            )
-
-        if not settings.enabled:
-            return False, ""
-
-        # 3. Получаем уровень модерации
-        level_settings = MODERATION_LEVELS.get(moderation_level, MODERATION_LEVELS['moderate'])
-
-        # 4. Проверяем длину сообщения
-        is_invalid_length, length_reason = check_message_length(content)
-        if is_invalid_length:
-            return True, length_reason
-
-        # 5. ✅ ГЛАВНАЯ ПРОВЕРКА: СТРОГО ЗАПРЕЩЕННЫЕ слова (всегда проверяем)
-        if level_settings['prohibited_words']:
-            is_prohibited, prohibited_reason = check_prohibited_words(content)
-            if is_prohibited:
-                return True, "Сообщение содержит запрещенные слова"
-
-        # 6. Проверяем пользовательские заблокированные слова
-        is_blocked, reason = check_blocked_words(content, settings.blocked_words_list)
-        if is_blocked:
-            return True, reason
-
-        # 7. Проверяем токсичность (если включено)
-        if level_settings['toxic_indicators'] and settings.enable_toxicity_filter:
-            is_toxic, toxic_reason = check_toxicity(content)
-            if is_toxic:
-                return True, toxic_reason
-
-        # 8. Проверяем спам-индикаторы
-        if level_settings['spam_indicators']:
-            is_spam, spam_reason = check_spam(content)
-            if is_spam:
-                return True, spam_reason
-
-        # 9. Проверяем подозрительные паттерны
-        if level_settings['suspicious_patterns']:
-            is_suspicious, suspicious_reason = check_suspicious_patterns(content)
-            if is_suspicious:
-                return True, suspicious_reason
-
-        # 10. Проверяем частоту сообщений
-        is_rate_limited, rate_reason = check_message_rate(user, room, settings.max_messages_per_minute)
-        if is_rate_limited:
-            return True, rate_reason
-
-        # ✅ Все проверки пройдены
-        return False, ""
-
+        verdict = _moderate_message(user, room, content, moderation_level, timer)
     except Exception as e:
-        print(f"Ошибка при модерации сообщения: {e}")
+        logger.error(f"Ошибка при модерации сообщения: {e}", exc_info=True)
+        verdict = (False, "")
+    finally:
+        timer.finish()
+
+    record_moderation_verdict(room, *verdict)
+    return verdict
+
+def _moderate_message(user, room, content, moderation_level, timer):
+    # 1. Проверяем, не заблокирован ли пользователь
+    is_banned, ban_reason = check_user_ban(user, room)
+    timer.lap('ban')
+    if is_banned:
+        return True, ban_reason
+
+    # 2. Получаем настройки модерации для комнаты
+    # ✅ Скомпилированная политика из памяти процесса, без запросов к БД
+    policy = get_moderation_policy(room)
+    timer.lap('policy')
+
+    if not policy.enabled:
         return False, ""
 
+    # 3-9. Проверяем текст сообщения (повторы текста берутся из кеша вердиктов)
+    is_blocked, reason = check_message_content_cached(content, policy, moderation_level, timer)
+    timer.lap('verdict_cache')  # Поиск и запись вердикта, без самих проверок
+    if is_blocked:
+        return True, reason
+
+    # 10. Проверяем частоту сообщений (и записываем разрешенное сообщение)
+    is_rate_limited, rate_reason = check_message_rate(user, room, policy.max_messages_per_minute)
+    timer.lap('rate')
+    if is_rate_limited:
+        return True, rate_reason
+
+    # ✅ Все проверки пройдены
+    return False, ""
+
 def record_user_message(user, room):
     """
     Записывает факт отправки сообщения пользователем для отслеживания частоты
+    (check_message_rate уже записывает сообщение, если оно разрешено)
     """
-    UserMessageRate.objects.create(user=user, room=room)
+    get_rate_limiter().record(user.pk, room.pk)
 
-def cleanup_old_message_rates():
+def cleanup_old_message_rates(batch_size=1000):
     """
     Очищает старые записи о частоте сообщений (старше 2 минут)
+    Нужна только для DatabaseRateLimiter: окна в Redis истекают сами
+    ✅ Удаляет пачками по batch_size, чтобы не держать долгую блокировку таблицы
+
+    Возвращает: количество удаленных записей
     """
     time_threshold = timezone.now() - timedelta(minutes=2)
-    UserMessageRate.objects.filter(timestamp__lt=time_threshold).delete()
+    old_rates = UserMessageRate.objects.filter(timestamp__lt=time_threshold)
+
+    deleted_total = 0
+    while True:
+        batch_ids = list(old_rates.values_list('pk', flat=True)[:batch_size])
+        if not batch_ids:
+            break
+        deleted, _ = UserMessageRate.objects.filter(pk__in=batch_ids).delete()
+        deleted_total += deleted
+
+    return deleted_total
 
 def cleanup_expired_bans():
     """
     Очищает истекшие баны (деактивирует их)
+    ✅ Один UPDATE вместо save() для каждого бана
+
+    Возвращает: количество деактивированных банов
     """
-    expired_bans = UserBan.objects.filter(
+    deactivated = UserBan.objects.filter(
         is_active=True,
         is_permanent=False,
         expires_at__isnull=False,
         expires_at__lt=timezone.now()
-    )
+    ).update(is_active=False)
+
+    if deactivated:
+        # update() не отправляет post_save - оповещаем индексы банов сами
+        transaction.on_commit(invalidate_ban_index)
 
-    for ban in expired_bans:
-        ban.deactivate_if_expired()
+    return deactivated
 
 # ===================================================================
 # ✅ ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 # ===================================================================
 
-def get_moderation_stats(room):
-    """
-    ✅ НОВОЕ: Получает статистику модерации для комнаты
-    """
-    time_threshold = timezone.now() - timedelta(days=7)
-
-    total_messages = Message.objects.filter(room=room, created_at__gte=time_threshold).count()
-    blocked_messages = Message.objects.filter(room=room, is_blocked=True, created_at__gte=time_threshold).count()
-
-    return {
-        'total_messages': total_messages,
-        'blocked_messages': blocked_messages,
-        'block_rate': (blocked_messages / total_messages * 100) if total_messages > 0 else 0
-    }
-
 def test_moderation(content, moderation_level='moderate'):
     """
     ✅ НОВОЕ: Тестирует модерацию сообщения без сохранения в БД
+    Возвращает также объект анализа сообщения для отладки
     """
+    analysis = analyze_message(content)
+
     results = {
-        'prohibited_words': check_prohibited_words(content),
-        'toxicity': check_toxicity(content),
-        'spam': check_spam(content),
-        'suspicious_patterns': check_suspicious_patterns(content),
-        'length': check_message_length(content),
-        'normalized': normalize_text(content) if content else '',
-        'normalized_length': len(normalize_text(content)) if content else ''
+        'prohibited_words': check_prohibited_words(analysis),
+        'toxicity': check_toxicity(analysis),
+        'spam': check_spam(analysis),
+        'suspicious_patterns': check_suspicious_patterns(analysis),
+        'length': check_message_length(analysis),
+        'normalized': analysis.normalized,
+        'normalized_length': len(analysis.normalized) if content else '',
+        'analysis': analysis,
     }
 
     return results
@@ -0,0 +1,105 @@
+"""
+Курсорная (keyset) пагинация по (created_at, id)
+
+Страница выбирается условием "строго старше/новее последней показанной
+записи" вместо OFFSET, а о следующей странице говорит одна лишняя запись
+вместо COUNT(*). Запрос идет по индексам (room, -created_at) и
+(is_published, -created_at), поэтому глубокие страницы открываются так же
+быстро, как первая.
+
+Курсор - подписанная строка (django.core.signing): клиент не может ни
+прочитать, ни подделать его. Испорченный курсор - CursorError.
+"""
+from datetime import datetime
+
+from django.core import signing
+from django.db.models import Q
+
+CURSOR_SALT = 'blog.pagination.cursor'
+
+OLDER = 'older'
+NEWER = 'newer'
+
+
+class CursorError(ValueError):
+    """Испорченный или чужой курсор"""
+
+
+def encode_cursor(item, direction):
+    return signing.dumps([item.created_at.isoformat(), item.pk, direction], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token):
+    """Возвращает: (created_at, id, направление)"""
+    try:
+        created_at, pk, direction = signing.loads(token, salt=CURSOR_SALT)
+        if direction not in (OLDER, NEWER):
+            raise ValueError(direction)
+        return datetime.fromisoformat(created_at), int(pk), direction
+    except (signing.BadSignature, ValueError, TypeError) as e:
+        raise CursorError(str(e)) from e
+
+
+class CursorPage:
+    """Страница записей от новых к старым с курсорами соседних страниц"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor          # Более старые записи
+        self.previous_cursor = previous_cursor  # Более новые записи
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def paginate_by_cursor(queryset, cursor=None, per_page=20):
+    """
+    Страница queryset (от новых к старым) после курсора.
+    cursor - строка из next_cursor/previous_cursor предыдущей страницы или None
+    """
+    if cursor is None:
+        items = list(queryset.order_by('-created_at', '-id')[:per_page + 1])
+        has_more = len(items) > per_page
+        items = items[:per_page]
+        return CursorPage(items, next_cursor=encode_cursor(items[-1], OLDER) if has_more else None)
+
+    created_at, pk, direction = decode_cursor(cursor)
+    if direction == OLDER:
+        # created_at <= X дает диапазон по индексу, второе условие разрешает равные даты
+        items = list(
+            queryset.filter(created_at__lte=created_at)
+            .filter(Q(created_at__lt=created_at) | Q(id__lt=pk))
+            .order_by('-created_at', '-id')[:per_page + 1]
+        )
+        has_more = len(items) > per_page
+        items = items[:per_page]
+        return CursorPage(
+            items,
+            next_cursor=encode_cursor(items[-1], OLDER) if has_more else None,
+            previous_cursor=encode_cursor(items[0], NEWER) if items else None,
+        )
+
+    items = list(
+        queryset.filter(created_at__gte=created_at)
+        .filter(Q(created_at__gt=created_at) | Q(id__gt=pk))
+        .order_by('created_at', 'id')[:per_page + 1]
+    )
+    has_more = len(items) > per_page
+    items = items[:per_page][::-1]
+    return CursorPage(
+        items,
+        next_cursor=encode_cursor(items[-1], OLDER) if items else None,
+        previous_cursor=encode_cursor(items[0], NEWER) if has_more else None,
+    )
@@ -2,33 +2,31 @@
 Дополнительные оптимизации производительности
 """
 from django.db import models
-from django.core.cache import cache
 from django.conf import settings
 import functools
 import logging
 
+from .cache_utils import (
+    POSTS_NAMESPACE, get_or_compute, invalidate_namespace, post_namespace, room_namespace, versioned_key,
+)
+
 logger = logging.getLogger(__name__)
 
-def cache_queryset(timeout=300):
+def cache_queryset(timeout=300, namespaces=()):
     """
-    Декоратор для кеширования результатов запросов к БД
+    Декоратор для кеширования результатов запросов к БД.
+    namespaces - пространства имен кеша (cache_utils), сброс которых делает результат устаревшим
     """
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             # Создаем ключ кеша на основе имени функции и аргументов
-            cache_key = f"queryset_{func.__name__}_{str(args)}_{str(sorted(kwargs.items()))}"
-            
-            # Проверяем, есть ли результат в кеше
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
-                return cached_result
-            
-            # Выполняем функцию и кешируем результат
-            result = func(*args, **kwargs)
-            cache.set(cache_key, result, timeout)
-            
-            return result
+            cache_key = versioned_key(
+                f"queryset_{func.__name__}_{str(args)}_{str(sorted(kwargs.items()))}", *namespaces
+            )
+
+            # ✅ Один пересчет на истекший ключ, остальные получают устаревший результат
+            return get_or_compute(cache_key, lambda: func(*args, **kwargs), timeout)
         return wrapper
     return decorator
 
@@ -77,49 +75,43 @@ def get_published_posts_optimized():
     Оптимизированный запрос для получения опубликованных постов
     """
     from blog.models import Post
-    cache_key = "published_posts_optimized"
-    posts = cache.get(cache_key)
+    cache_key = versioned_key("published_posts_optimized", POSTS_NAMESPACE)
     
-    if posts is None:
-        posts = Post.objects.filter(
+    def load_posts():
+        return list(Post.objects.filter(
             is_published=True
         ).select_related('author').only(
             'title', 'created_at', 'author__username'
-        ).order_by('-created_at')[:50]  # Ограничиваем количество
-        
-        cache.set(cache_key, posts, 300)  # Кешируем на 5 минут
+        ).order_by('-created_at')[:50])  # Ограничиваем количество
     
-    return posts
+    return get_or_compute(cache_key, load_posts, 300)  # Кешируем на 5 минут
 
 def get_recent_messages_optimized(room, limit=100):
     """
     Оптимизированный запрос для получения последних сообщений
     """
     from blog.models import Message
-    cache_key = f"recent_messages_{room.id}_{limit}"
-    messages = cache.get(cache_key)
+    cache_key = versioned_key(f"recent_messages_{limit}", room_namespace(room.id))
     
-    if messages is None:
-        messages = Message.objects.filter(
+    def load_messages():
+        return list(Message.objects.filter(
             room=room
         ).select_related('user').only(
             'content', 'created_at', 'user__username'
-        ).order_by('-created_at')[:limit]
-        
-        cache.set(cache_key, messages, 60)  # Кешируем на 1 минуту
+        ).order_by('-created_at')[:limit])
     
-    return messages
+    return get_or_compute(cache_key, load_messages, 60)  # Кешируем на 1 минуту
 
-def invalidate_posts_cache():
+def invalidate_posts_cache(*post_ids):
     """
-    Очистка кеша, связанного с постами
+    ✅ Сброс кеша постов: списки и, если переданы id, кеш отдельных постов.
+    Поколения пространств имен увеличиваются INCR, ключи кеша не перебираются
     """
-    cache.delete("published_posts_optimized")
-    # Удаляем все ключи, связанные с постами
-    cache.delete_many([key for key in cache._cache.keys() if 'posts' in key])
+    invalidate_namespace(POSTS_NAMESPACE, *[post_namespace(post_id) for post_id in post_ids])
 
 def invalidate_messages_cache(room_id):
     """
-    Очистка кеша, связанного с сообщениями в комнате
+    ✅ Сброс кеша сообщений комнаты (один INCR)
     """
-    cache.delete_many([key for key in cache._cache.keys() if f'messages_{room_id}' in key])
\ No newline at end of file
+    invalidate_namespace(room_namespace(room_id))
+
@@ -0,0 +1,355 @@
+"""
+Полнотекстовый поиск по постам (главная страница)
+
+title__icontains OR content__icontains просматривает все опубликованные
+посты; здесь поиск идет по индексу, и время ответа зависит от числа
+совпадений, а не от размера архива. Бэкенд выбирается настройкой
+POST_SEARCH['BACKEND'] так же, как у поиска по сообщениям
+(blog.message_search):
+- blog.post_search.SQLitePostSearch - FTS5 с основами слов (blog.russian_stemmer);
+- blog.post_search.PostgresPostSearch - tsvector + GIN, конфигурация POST_SEARCH['CONFIG'];
+- blog.post_search.DatabasePostSearch - icontains без индекса;
+- None (по умолчанию) - по типу базы данных.
+
+Заголовок весит больше текста. Результаты упорядочены по релевантности и
+листаются курсором (релевантность, id); у найденных постов есть
+search_title и search_snippet - фрагменты с найденными словами в <mark>.
+suggest() - подсказки заголовков по началу слов для автодополнения.
+
+В индексе только опубликованные посты; он обновляется после фиксации
+транзакции при сохранении и удалении поста (blog/signals.py). Заполнить
+индекс для существующих постов:
+    python manage.py rebuild_post_search
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection
+from django.db.models import Q
+from django.dispatch import receiver
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from .message_search import decode_search_cursor, encode_search_cursor, search_terms
+from .pagination import CursorPage, paginate_by_cursor
+from .russian_stemmer import stem, stem_words
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POST_SEARCH_SETTINGS = {
+    'BACKEND': None,
+    'CONFIG': 'russian',
+    'SNIPPET_WORDS': 30,
+    'SUGGEST_LIMIT': 8,
+}
+
+BACKENDS_BY_VENDOR = {
+    'sqlite': 'blog.post_search.SQLitePostSearch',
+    'postgresql': 'blog.post_search.PostgresPostSearch',
+}
+
+TOKEN_RE = re.compile(r'(\w+)')
+
+
+def highlight(text, terms, words=None):
+    """
+    HTML-фрагмент text, где слова, основа которых начинается с основы
+    одного из terms, обернуты в <mark>. words - длина окна вокруг первого
+    совпадения (None - весь текст)
+    """
+    stems = [stem(term) for term in terms]
+    # Нечетные элементы - слова, четные - то, что между ними
+    parts = TOKEN_RE.split(text)
+    matched = {
+        i for i in range(1, len(parts), 2)
+        if any(stem(parts[i]).startswith(term_stem) for term_stem in stems)
+    }
+
+    start, stop = 0, len(parts)
+    if words is not None:
+        first = min(matched, default=1)
+        start = max(first - 10, 0) // 2 * 2  # Пара слов контекста перед совпадением
+        stop = min(start + words * 2, len(parts))
+
+    html = ''.join(
+        f'<mark>{escape(parts[i])}</mark>' if i in matched else escape(parts[i])
+        for i in range(start, stop)
+    ).strip()
+    if start > 0:
+        html = '… ' + html
+    if stop < len(parts) - 1:
+        html += ' …'
+    return mark_safe(html)
+
+
+class BasePostSearch:
+    """Общий интерфейс поиска по постам"""
+
+    def __init__(self, config='russian', snippet_words=30, suggest_limit=8):
+        self.config = config
+        self.snippet_words = snippet_words
+        self.suggest_limit = suggest_limit
+
+    @classmethod
+    def from_settings(cls, options):
+        return cls(
+            config=options['CONFIG'],
+            snippet_words=options['SNIPPET_WORDS'],
+            suggest_limit=options['SUGGEST_LIMIT'],
+        )
+
+    def queryset(self):
+        from .models import Post
+        return Post.objects.filter(is_published=True).select_related('author')
+
+    def index(self, post_ids):
+        """Добавляет или обновляет посты в индексе (неопубликованные удаляет)"""
+
+    def remove(self, post_ids):
+        """Удаляет посты из индекса"""
+
+    def clear(self):
+        """Очищает индекс целиком (перед полной перестройкой)"""
+
+    def search(self, query, cursor=None, per_page=5):
+        """Страница найденных постов (CursorPage); cursor - next_cursor прошлой страницы"""
+        raise NotImplementedError
+
+    def suggest(self, prefix, limit=None):
+        """
+        [(id, заголовок), ...] постов, в заголовке которых есть слова,
+        начинающиеся с prefix (не больше limit, по умолчанию SUGGEST_LIMIT)
+        """
+        raise NotImplementedError
+
+    def annotate(self, posts, terms):
+        """Фрагменты с найденными словами для шаблона"""
+        for post in posts:
+            post.search_title = highlight(post.title, terms)
+            post.search_snippet = highlight(post.content, terms, self.snippet_words)
+        return posts
+
+
+class DatabasePostSearch(BasePostSearch):
+    """Поиск без индекса: icontains по заголовку и тексту, от новых к старым"""
+
+    def search(self, query, cursor=None, per_page=5):
+        queryset = self.queryset().filter(Q(title__icontains=query) | Q(content__icontains=query))
+        page = paginate_by_cursor(queryset, cursor, per_page)
+        self.annotate(page.object_list, search_terms(query))
+        return page
+
+    def suggest(self, prefix, limit=None):
+        queryset = self.queryset().filter(title__icontains=prefix).order_by('-created_at')
+        return list(queryset.values_list('pk', 'title')[:limit or self.suggest_limit])
+
+
+class IndexedPostSearch(BasePostSearch):
+    """Поиск по индексу: подкласс возвращает id и релевантность совпадений"""
+
+    def ranked_ids(self, terms, after, limit, title_only=False):
+        """
+        [(id, релевантность), ...] по убыванию релевантности, затем id.
+        after - (релевантность, id) последнего показанного результата или None
+        """
+        raise NotImplementedError
+
+    def documents(self, post_ids):
+        """[(id, заголовок, текст), ...] опубликованных постов"""
+        return list(self.queryset().filter(pk__in=post_ids).values_list('pk', 'title', 'content'))
+
+    def search(self, query, cursor=None, per_page=5):
+        terms = search_terms(query)
+        if not terms:
+            return CursorPage([])
+
+        after = decode_search_cursor(cursor) if cursor else None
+        ranked = self.ranked_ids(terms, after, per_page + 1)
+        has_more = len(ranked) > per_page
+        ranked = ranked[:per_page]
+
+        posts = self.queryset().in_bulk([pk for pk, _ in ranked])
+        return CursorPage(
+            self.annotate([posts[pk] for pk, _ in ranked if pk in posts], terms),
+            next_cursor=encode_search_cursor(ranked[-1][1], ranked[-1][0]) if has_more else None,
+        )
+
+    def suggest(self, prefix, limit=None):
+        terms = search_terms(prefix)
+        if not terms:
+            return []
+        ranked = self.ranked_ids(terms, None, limit or self.suggest_limit, title_only=True)
+        titles = dict(self.queryset().filter(pk__in=[pk for pk, _ in ranked]).values_list('pk', 'title'))
+        return [(pk, titles[pk]) for pk, _ in ranked if pk in titles]
+
+
+class SQLitePostSearch(IndexedPostSearch):
+    """Таблица FTS5 blog_post_fts(title, body) с основами слов, rowid = id поста"""
+
+    table = 'blog_post_fts'
+    title_weight = 4.0
+
+    def index(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        documents = self.documents(post_ids)
+        with connection.cursor() as cursor:
+            self._delete(cursor, post_ids)
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, title, body) VALUES (%s, %s, %s)',
+                [(pk, ' '.join(stem_words(title)), ' '.join(stem_words(content))) for pk, title, content in documents],
+            )
+
+    def remove(self, post_ids):
+        post_ids = list(post_ids)
+        if post_ids:
+            with connection.cursor() as cursor:
+                self._delete(cursor, post_ids)
+
+    def _delete(self, cursor, post_ids):
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', post_ids)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def match_expression(self, terms, title_only=False):
+        # Слова - \w+ в кавычках, спецсинтаксис FTS5 в запрос не попадает; "*" - поиск по началу основы
+        columns = 'title' if title_only else '{title body}'
+        return ' AND '.join(f'{columns} : "{stem(term)}"*' for term in terms)
+
+    def ranked_ids(self, terms, after, limit, title_only=False):
+        sql = (
+            f'SELECT id, score FROM ('
+            f'SELECT rowid AS id, -bm25({self.table}, {self.title_weight}, 1.0) AS score '
+            f'FROM {self.table} WHERE {self.table} MATCH %s)'
+        )
+        params = [self.match_expression(terms, title_only)]
+        if after is not None:
+            sql += ' WHERE score < %s OR (score = %s AND id < %s)'
+            params += [after[0], after[0], after[1]]
+        sql += ' ORDER BY score DESC, id DESC LIMIT %s'
+        params.append(limit)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class PostgresPostSearch(IndexedPostSearch):
+    """Таблица blog_post_search(post_id, document tsvector) с GIN: заголовок - вес A, текст - вес B"""
+
+    table = 'blog_post_search'
+
+    def index(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE post_id = ANY(%s)', [post_ids])
+            cursor.execute(
+                f'INSERT INTO {self.table} (post_id, document) '
+                f'SELECT p.id, '
+                f'setweight(to_tsvector(%s::regconfig, p.title), \'A\') || '
+                f'setweight(to_tsvector(%s::regconfig, p.content), \'B\') '
+                f'FROM blog_post p WHERE p.id = ANY(%s) AND p.is_published',
+                [self.config, self.config, post_ids],
+            )
+
+    def remove(self, post_ids):
+        post_ids = list(post_ids)
+        if post_ids:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {self.table} WHERE post_id = ANY(%s)', [post_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {self.table}')
+
+    def tsquery(self, terms, title_only=False):
+        # to_tsquery сам приводит слова к основам; ":*" - по началу основы, "A" - только заголовок
+        suffix = ':*A' if title_only else ':*'
+        return ' & '.join(f'{term}{suffix}' for term in terms)
+
+    def ranked_ids(self, terms, after, limit, title_only=False):
+        sql = (
+            f'SELECT id, score FROM ('
+            f'SELECT s.post_id AS id, ts_rank(s.document, q)::float8 AS score '
+            f'FROM {self.table} s, to_tsquery(%s::regconfig, %s) q '
+            f'WHERE s.document @@ q) ranked'
+        )
+        params = [self.config, self.tsquery(terms, title_only)]
+        if after is not None:
+            sql += ' WHERE score < %s OR (score = %s AND id < %s)'
+            params += [after[0], after[0], after[1]]
+        sql += ' ORDER BY score DESC, id DESC LIMIT %s'
+        params.append(limit)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+_post_search = None
+
+
+def get_post_search():
+    """Возвращает бэкенд поиска из настройки POST_SEARCH (один на процесс)"""
+    global _post_search
+    if _post_search is None:
+        options = dict(DEFAULT_POST_SEARCH_SETTINGS, **getattr(settings, 'POST_SEARCH', {}))
+        backend = options['BACKEND'] or BACKENDS_BY_VENDOR.get(connection.vendor, 'blog.post_search.DatabasePostSearch')
+        _post_search = import_string(backend).from_settings(options)
+    return _post_search
+
+
+def index_posts(post_ids):
+    """Обновляет посты в индексе; ошибка индекса не мешает сохранению поста"""
+    try:
+        get_post_search().index(post_ids)
+    except Exception as e:
+        logger.warning(f"Не удалось обновить поисковый индекс постов: {e}")
+
+
+def remove_posts(post_ids):
+    try:
+        get_post_search().remove(post_ids)
+    except Exception as e:
+        logger.warning(f"Не удалось удалить посты из поискового индекса: {e}")
+
+
+def rebuild_post_search(batch_size=500, clear=False, progress=None):
+    """
+    Заполняет индекс существующими постами пачками по возрастанию id.
+    Возвращает: количество обработанных постов
+    """
+    from .models import Post
+
+    search = get_post_search()
+    if clear:
+        search.clear()
+
+    processed = 0
+    last_id = 0
+    while True:
+        ids = list(Post.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return processed
+        search.index(ids)
+        processed += len(ids)
+        last_id = ids[-1]
+        if progress:
+            progress(processed)
+
+
+@receiver(setting_changed)
+def reset_post_search(setting, **kwargs):
+    """Сбрасывает бэкенд при override_settings в тестах"""
+    global _post_search
+    if setting == 'POST_SEARCH':
+        _post_search = None
@@ -0,0 +1,205 @@
+"""
+Ограничение частоты сообщений в чате (скользящее окно)
+
+Бэкенд выбирается настройкой MODERATION_RATE_LIMITER:
+- blog.rate_limiting.RedisRateLimiter - sorted set в Redis, одна атомарная
+  операция "проверить и записать" через Lua-скрипт; пока Redis недоступен,
+  лимит считается по таблице (DatabaseRateLimiter);
+- blog.rate_limiting.DatabaseRateLimiter - таблица UserMessageRate (запасной вариант);
+- blog.rate_limiting.InMemoryRateLimiter - память процесса (тесты, локальная разработка).
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE_LIMITER = 'blog.rate_limiting.DatabaseRateLimiter'
+DEFAULT_WINDOW_SECONDS = 60
+
+
+class BaseRateLimiter:
+    """Общий интерфейс бэкендов ограничения частоты"""
+
+    def hit(self, user_id, room_id, limit, window=DEFAULT_WINDOW_SECONDS, now=None):
+        """
+        Атомарно проверяет лимит и, если он не превышен, записывает сообщение.
+        Возвращает True, если сообщение разрешено
+        """
+        raise NotImplementedError
+
+    def record(self, user_id, room_id, window=DEFAULT_WINDOW_SECONDS, now=None):
+        """Записывает сообщение без проверки лимита"""
+        raise NotImplementedError
+
+    def reset(self, user_id, room_id):
+        """Сбрасывает окно пользователя в комнате"""
+        raise NotImplementedError
+
+
+class DatabaseRateLimiter(BaseRateLimiter):
+    """Скользящее окно на таблице UserMessageRate (COUNT + INSERT)"""
+
+    def hit(self, user_id, room_id, limit, window=DEFAULT_WINDOW_SECONDS, now=None):
+        from .models import UserMessageRate
+
+        now = now or timezone.now()
+        recent_messages_count = UserMessageRate.objects.filter(
+            user_id=user_id,
+            room_id=room_id,
+            timestamp__gte=now - timedelta(seconds=window)
+        ).count()
+
+        if recent_messages_count >= limit:
+            return False
+
+        self.record(user_id, room_id, window, now)
+        return True
+
+    def record(self, user_id, room_id, window=DEFAULT_WINDOW_SECONDS, now=None):
+        from .models import UserMessageRate
+
+        UserMessageRate.objects.create(user_id=user_id, room_id=room_id)
+
+    def reset(self, user_id, room_id):
+        from .models import UserMessageRate
+
+        UserMessageRate.objects.filter(user_id=user_id, room_id=room_id).delete()
+
+
+class RedisRateLimiter(BaseRateLimiter):
+    """
+    Скользящее окно в Redis: sorted set на пару (пользователь, комната),
+    score - время отправки. Ключ живет не дольше окна, очистка не нужна.
+    При ошибке Redis вызов передается fallback (по умолчанию DatabaseRateLimiter)
+    """
+
+    HIT_SCRIPT = """
+    local key = KEYS[1]
+    local now = tonumber(ARGV[1])
+    local window = tonumber(ARGV[2])
+    local limit = tonumber(ARGV[3])
+
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= limit then
+        return 0
+    end
+
+    redis.call('ZADD', key, now, ARGV[4])
+    redis.call('EXPIRE', key, math.ceil(window))
+    return 1
+    """
+
+    def __init__(self, alias='default', fallback=None):
+        self.alias = alias
+        self.fallback = fallback or DatabaseRateLimiter()
+        self._script = None
+
+    @property
+    def client(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection(self.alias)
+
+    def make_key(self, user_id, room_id):
+        return cache.make_key(f'ratelimit:{user_id}:{room_id}')
+
+    def _member(self, now):
+        return f'{now:.6f}:{uuid.uuid4().hex[:8]}'
+
+    def hit(self, user_id, room_id, limit, window=DEFAULT_WINDOW_SECONDS, now=None):
+        now = now or time.time()
+        try:
+            if self._script is None:
+                self._script = self.client.register_script(self.HIT_SCRIPT)
+            allowed = self._script(
+                keys=[self.make_key(user_id, room_id)],
+                args=[now, window, limit, self._member(now)],
+            )
+        except Exception as e:
+            # Недоступный Redis не блокирует чат и не снимает лимит: окно считается по БД
+            logger.warning(f"Redis rate limiter недоступен, лимит проверяется по БД: {e}")
+            return self.fallback.hit(user_id, room_id, limit, window)
+
+        return bool(allowed)
+
+    def record(self, user_id, room_id, window=DEFAULT_WINDOW_SECONDS, now=None):
+        now = now or time.time()
+        key = self.make_key(user_id, room_id)
+        try:
+            pipe = self.client.pipeline()
+            pipe.zadd(key, {self._member(now): now})
+            pipe.expire(key, int(window))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Redis rate limiter недоступен, сообщение записывается в БД: {e}")
+            self.fallback.record(user_id, room_id, window)
+
+    def reset(self, user_id, room_id):
+        try:
+            self.client.delete(self.make_key(user_id, room_id))
+        except Exception as e:
+            logger.warning(f"Redis rate limiter недоступен: {e}")
+        self.fallback.reset(user_id, room_id)
+
+
+class InMemoryRateLimiter(BaseRateLimiter):
+    """Скользящее окно в памяти процесса, с той же семантикой, что и Redis"""
+
+    def __init__(self):
+        self._windows = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def _trim(self, timestamps, now, window):
+        while timestamps and timestamps[0] <= now - window:
+            timestamps.popleft()
+
+    def hit(self, user_id, room_id, limit, window=DEFAULT_WINDOW_SECONDS, now=None):
+        now = now or time.time()
+        with self._lock:
+            timestamps = self._windows[(user_id, room_id)]
+            self._trim(timestamps, now, window)
+            if len(timestamps) >= limit:
+                return False
+            timestamps.append(now)
+            return True
+
+    def record(self, user_id, room_id, window=DEFAULT_WINDOW_SECONDS, now=None):
+        now = now or time.time()
+        with self._lock:
+            timestamps = self._windows[(user_id, room_id)]
+            self._trim(timestamps, now, window)
+            timestamps.append(now)
+
+    def reset(self, user_id, room_id):
+        with self._lock:
+            self._windows.pop((user_id, room_id), None)
+
+
+_rate_limiter = None
+
+
+def get_rate_limiter():
+    """Возвращает бэкенд из настройки MODERATION_RATE_LIMITER (один на процесс)"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        backend_path = getattr(settings, 'MODERATION_RATE_LIMITER', DEFAULT_RATE_LIMITER)
+        _rate_limiter = import_string(backend_path)()
+    return _rate_limiter
+
+
+@receiver(setting_changed)
+def reset_rate_limiter(setting, **kwargs):
+    """Сбрасывает бэкенд при override_settings в тестах"""
+    global _rate_limiter
+    if setting == 'MODERATION_RATE_LIMITER':
+        _rate_limiter = None
@@ -0,0 +1,407 @@
+"""
+Буфер реакций на посты в Redis (режим для "горячих" постов)
+
+Без буфера каждый клик - транзакция с PostReaction и UPDATE счетчиков поста
+(blog.reactions), и при тысячах кликов по одному посту запросы ждут
+блокировок одной строки. С буфером (POST_REACTION_BUFFER['ENABLED']) клик -
+один вызов Lua-скрипта в Redis:
+- post_reactions:<post>:users - хеш {user_id: 'like' | 'dislike' | ''};
+- post_reactions:<post>:counts - хеш {like, dislike};
+- post_reactions:dirty - множество "<post>:<user>" с незаписанными изменениями.
+Скрипт атомарно переключает реакцию, меняет счетчики и сразу возвращает
+их AJAX-запросу. Если в Redis еще нет состояния пользователя или счетчиков
+поста, они один раз читаются из БД.
+
+Задача flush_reaction_buffer_task (celery beat) забирает изменения пачками
+по FLUSH_BATCH: upsert/delete в PostReaction и пересчет счетчиков
+затронутых постов по PostReaction. До записи счетчики в Post (карточки на
+главной) отстают не больше чем на интервал задачи; страница поста
+показывает значения из Redis.
+
+Бэкенд выбирается настройкой POST_REACTION_BUFFER['BACKEND']:
+- blog.reaction_buffer.RedisReactionBuffer - Redis;
+- blog.reaction_buffer.InMemoryReactionBuffer - память процесса (тесты).
+Если Redis недоступен, клик отклоняется (ReactionBufferUnavailable): запись
+мимо буфера разошлась бы с его хешами и незаписанными кликами.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import DataError, IntegrityError, transaction
+from django.db.models import Q
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .cache_utils import get_or_compute, post_namespace, versioned_key
+from .models import CustomUser, Post, PostReaction
+from .reactions import actual_reaction_count, toggle_reaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REACTION_BUFFER_SETTINGS = {
+    'ENABLED': False,
+    'BACKEND': 'blog.reaction_buffer.RedisReactionBuffer',
+    'FLUSH_BATCH': 1000,
+    'TIMEOUT': 24 * 60 * 60,  # Состояние неактивного поста уходит из Redis
+    'POST_EXISTS_TIMEOUT': 300,  # Кеш проверки, что пост есть (сбрасывается при удалении поста)
+}
+
+MESSAGES = {
+    'added': 'Реакция добавлена',
+    'removed': 'Реакция удалена',
+    'changed': 'Реакция изменена',
+}
+
+# KEYS: users, counts, dirty; ARGV: user_id, реакция, член dirty, TTL, [состояние, лайки, дизлайки]
+# Возвращает {прежнее состояние, новое, лайки, дизлайки} или 0, если нужно состояние из БД
+TOGGLE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if #ARGV < 7 then return 0 end
+    redis.call('HSET', KEYS[2], 'like', ARGV[6], 'dislike', ARGV[7])
+end
+local previous = redis.call('HGET', KEYS[1], ARGV[1])
+if not previous then
+    if #ARGV < 7 then return 0 end
+    previous = ARGV[5]
+end
+local current = ARGV[2]
+if previous == current then
+    current = ''
+end
+if previous ~= '' then
+    redis.call('HINCRBY', KEYS[2], previous, -1)
+end
+if current ~= '' then
+    redis.call('HINCRBY', KEYS[2], current, 1)
+end
+redis.call('HSET', KEYS[1], ARGV[1], current)
+redis.call('SADD', KEYS[3], ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return {previous, current, redis.call('HGET', KEYS[2], 'like'), redis.call('HGET', KEYS[2], 'dislike')}
+"""
+
+
+class ReactionBufferUnavailable(Exception):
+    """Буфер включен, но недоступен - реакция не записана"""
+
+
+class BaseReactionBuffer:
+    """Общий интерфейс буферов реакций"""
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+
+    @classmethod
+    def from_settings(cls, config):
+        return cls(timeout=config['TIMEOUT'])
+
+    def toggle(self, post_id, user_id, reaction_type, seed=None):
+        """
+        Переключает реакцию. seed - (состояние пользователя, лайки, дизлайки) из БД.
+        Возвращает: (прежнее состояние, новое, лайки, дизлайки) или None, если нужен seed
+        """
+        raise NotImplementedError
+
+    def state(self, post_id, user_id):
+        """(реакция пользователя или None, {'like_count', 'dislike_count'}) или None, если поста нет в буфере"""
+        raise NotImplementedError
+
+    def pop_dirty(self, limit):
+        """Забирает до limit измененных пар: [(post_id, user_id, 'like' | 'dislike' | '' | None)]"""
+        raise NotImplementedError
+
+    def restore_dirty(self, pairs):
+        """Возвращает в буфер пары [(post_id, user_id)], которые не удалось записать"""
+        raise NotImplementedError
+
+
+class RedisReactionBuffer(BaseReactionBuffer):
+    DIRTY_KEY = 'post_reactions:dirty'
+
+    def __init__(self, timeout=None, alias='default'):
+        super().__init__(timeout)
+        self.alias = alias
+        self._script = None
+
+    @property
+    def client(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection(self.alias)
+
+    def keys(self, post_id):
+        return (
+            cache.make_key(f'post_reactions:{post_id}:users'),
+            cache.make_key(f'post_reactions:{post_id}:counts'),
+            cache.make_key(self.DIRTY_KEY),
+        )
+
+    def toggle(self, post_id, user_id, reaction_type, seed=None):
+        client = self.client
+        if self._script is None:
+            self._script = client.register_script(TOGGLE_SCRIPT)
+        args = [user_id, reaction_type, f'{post_id}:{user_id}', self.timeout or 24 * 60 * 60]
+        if seed is not None:
+            args += [seed[0] or '', seed[1], seed[2]]
+        result = self._script(keys=self.keys(post_id), args=args, client=client)
+        if not result:
+            return None
+        previous, current, likes, dislikes = result
+        return previous.decode(), current.decode(), int(likes), int(dislikes)
+
+    def state(self, post_id, user_id):
+        users_key, counts_key, _ = self.keys(post_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hmget(counts_key, 'like', 'dislike')
+        pipe.hget(users_key, user_id)
+        (likes, dislikes), user_state = pipe.execute()
+        if likes is None or user_state is None:
+            return None
+        return user_state.decode() or None, {'like_count': int(likes), 'dislike_count': int(dislikes)}
+
+    def pop_dirty(self, limit):
+        client = self.client
+        members = client.spop(cache.make_key(self.DIRTY_KEY), limit) or []
+        pairs = [tuple(int(part) for part in member.decode().split(':')) for member in members]
+
+        pipe = client.pipeline(transaction=False)
+        for post_id, user_id in pairs:
+            pipe.hget(self.keys(post_id)[0], user_id)
+        states = pipe.execute() if pairs else []
+        return [
+            (post_id, user_id, None if state is None else state.decode())
+            for (post_id, user_id), state in zip(pairs, states)
+        ]
+
+    def restore_dirty(self, pairs):
+        if pairs:
+            self.client.sadd(cache.make_key(self.DIRTY_KEY), *[f'{post_id}:{user_id}' for post_id, user_id in pairs])
+
+
+class InMemoryReactionBuffer(BaseReactionBuffer):
+    """Буфер в памяти процесса с той же семантикой, что и Redis"""
+
+    def __init__(self, timeout=None):
+        super().__init__(timeout)
+        self._users = {}
+        self._counts = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def toggle(self, post_id, user_id, reaction_type, seed=None):
+        with self._lock:
+            users = self._users.setdefault(post_id, {})
+            if post_id not in self._counts or user_id not in users:
+                if seed is None:
+                    return None
+                self._counts.setdefault(post_id, {'like': seed[1], 'dislike': seed[2]})
+                users.setdefault(user_id, seed[0] or '')
+
+            counts = self._counts[post_id]
+            previous = users[user_id]
+            current = '' if previous == reaction_type else reaction_type
+            if previous:
+                counts[previous] -= 1
+            if current:
+                counts[current] += 1
+            users[user_id] = current
+            self._dirty.add((post_id, user_id))
+            return previous, current, counts['like'], counts['dislike']
+
+    def state(self, post_id, user_id):
+        with self._lock:
+            counts = self._counts.get(post_id)
+            user_state = self._users.get(post_id, {}).get(user_id)
+            if counts is None or user_state is None:
+                return None
+            return user_state or None, {'like_count': counts['like'], 'dislike_count': counts['dislike']}
+
+    def pop_dirty(self, limit):
+        with self._lock:
+            pairs = [self._dirty.pop() for _ in range(min(limit, len(self._dirty)))]
+            return [(post_id, user_id, self._users.get(post_id, {}).get(user_id)) for post_id, user_id in pairs]
+
+    def restore_dirty(self, pairs):
+        with self._lock:
+            self._dirty.update(pairs)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._counts.clear()
+            self._dirty.clear()
+
+
+_reaction_buffer = None
+_reaction_buffer_config = None
+
+
+def get_reaction_buffer_settings():
+    global _reaction_buffer_config
+    if _reaction_buffer_config is None:
+        _reaction_buffer_config = dict(
+            DEFAULT_REACTION_BUFFER_SETTINGS, **getattr(settings, 'POST_REACTION_BUFFER', {})
+        )
+    return _reaction_buffer_config
+
+
+def get_reaction_buffer():
+    """Буфер реакций; None, если режим выключен"""
+    global _reaction_buffer
+    config = get_reaction_buffer_settings()
+    if not config['ENABLED']:
+        return None
+    if _reaction_buffer is None:
+        _reaction_buffer = import_string(config['BACKEND']).from_settings(config)
+    return _reaction_buffer
+
+
+def post_exists(post_id):
+    """
+    Есть ли пост. В режиме буфера клик не должен ходить в БД, поэтому ответ
+    кешируется в пространстве имен поста (сигнал сбрасывает его при удалении)
+    """
+    if get_reaction_buffer() is None:
+        return Post.objects.filter(pk=post_id).exists()
+    return get_or_compute(
+        versioned_key(f'post_exists:{post_id}', post_namespace(post_id)),
+        lambda: Post.objects.filter(pk=post_id).exists(),
+        get_reaction_buffer_settings()['POST_EXISTS_TIMEOUT'],
+    )
+
+
+def _db_seed(post_id, user_id):
+    """Состояние пользователя и счетчики поста из БД для первого клика"""
+    user_state = PostReaction.objects.filter(post_id=post_id, user_id=user_id).values_list(
+        'reaction_type', flat=True
+    ).first()
+    likes, dislikes = Post.objects.filter(pk=post_id).values_list('like_count', 'dislike_count').get()
+    return user_state, likes, dislikes
+
+
+def toggle_post_reaction(user, post_id, reaction_type):
+    """
+    Переключает реакцию через буфер, если он включен, иначе сразу в БД.
+    Возвращает то же, что blog.reactions.toggle_reaction.
+    Если буфер недоступен, бросает ReactionBufferUnavailable: клик нельзя
+    записать в БД в обход буфера - хеши в Redis и незаписанные клики других
+    пользователей остались бы со старыми счетчиками
+    """
+    buffer = get_reaction_buffer()
+    if buffer is None:
+        return toggle_reaction(user, post_id, reaction_type)
+
+    try:
+        result = buffer.toggle(post_id, user.pk, reaction_type)
+        if result is None:
+            result = buffer.toggle(post_id, user.pk, reaction_type, seed=_db_seed(post_id, user.pk))
+    except Exception as e:
+        logger.warning(f"Буфер реакций недоступен, реакция не записана: {e}")
+        raise ReactionBufferUnavailable(str(e)) from e
+
+    previous, current, likes, dislikes = result
+    message = MESSAGES['removed' if not current else 'changed' if previous else 'added']
+    return current or None, message, {'like_count': likes, 'dislike_count': dislikes}
+
+
+def get_post_reaction_state(post, user):
+    """
+    Счетчики поста и реакция пользователя с учетом еще не записанных кликов.
+    Возвращает: (реакция пользователя или None, {'like_count', 'dislike_count'})
+    """
+    buffer = get_reaction_buffer()
+    if buffer is not None:
+        try:
+            state = buffer.state(post.pk, user.pk)
+        except Exception as e:
+            logger.warning(f"Буфер реакций недоступен: {e}")
+            state = None
+        if state is not None:
+            return state
+
+    user_reaction = PostReaction.objects.filter(post=post, user=user).values_list('reaction_type', flat=True).first()
+    return user_reaction, {'like_count': post.like_count, 'dislike_count': post.dislike_count}
+
+
+def flush_reaction_buffer(batch_size=None):
+    """
+    Записывает накопленные реакции в PostReaction пачками и пересчитывает
+    счетчики затронутых постов. Возвращает: количество записанных изменений
+    """
+    buffer = get_reaction_buffer()
+    if buffer is None:
+        return 0
+    batch_size = batch_size or get_reaction_buffer_settings()['FLUSH_BATCH']
+
+    flushed = 0
+    while True:
+        items = buffer.pop_dirty(batch_size)
+        if not items:
+            return flushed
+        written = 0  # Обработано пар из items: записано или отброшено
+        try:
+            try:
+                _write_batch(items)
+            except (IntegrityError, DataError) as e:
+                # Одна отвергнутая пара не должна навсегда блокировать всю пачку
+                logger.warning(f"Пачка реакций отвергнута БД, запись по одной: {e}")
+                for item in items:
+                    _write_one(item)
+                    written += 1
+        except Exception:
+            # Клики не теряются: пары вернутся в следующую запись
+            buffer.restore_dirty([(post_id, user_id) for post_id, user_id, _ in items[written:]])
+            raise
+        flushed += len(items)
+        if len(items) < batch_size:
+            return flushed
+
+
+def _write_one(item):
+    """Записывает одну пару из отвергнутой пачки; пару, которую БД отвергла и одну, отбрасывает"""
+    try:
+        _write_batch([item])
+    except (IntegrityError, DataError) as e:
+        post_id, user_id, _ = item
+        logger.error(f"Реакция отброшена (пост {post_id}, пользователь {user_id}): {e}")
+
+
+def _write_batch(items):
+    existing_posts = set(Post.objects.filter(pk__in={post_id for post_id, _, _ in items}).values_list('pk', flat=True))
+    existing_users = set(
+        CustomUser.objects.filter(pk__in={user_id for _, user_id, _ in items}).values_list('pk', flat=True)
+    )
+    upserts = []
+    removals = Q()
+    for post_id, user_id, state in items:
+        # Состояние истекло из Redis, пост или пользователь удален - записывать нечего
+        if state is None or post_id not in existing_posts or user_id not in existing_users:
+            continue
+        if state:
+            upserts.append(PostReaction(post_id=post_id, user_id=user_id, reaction_type=state))
+        else:
+            removals |= Q(post_id=post_id, user_id=user_id)
+
+    with transaction.atomic():
+        if upserts:
+            PostReaction.objects.bulk_create(
+                upserts, update_conflicts=True, unique_fields=['user', 'post'], update_fields=['reaction_type']
+            )
+        if removals:
+            PostReaction.objects.filter(removals).delete()
+        Post.objects.filter(pk__in=existing_posts).update(
+            like_count=actual_reaction_count('like'),
+            dislike_count=actual_reaction_count('dislike'),
+        )
+
+
+@receiver(setting_changed)
+def reset_reaction_buffer(setting, **kwargs):
+    """Сбрасывает буфер при override_settings в тестах"""
+    global _reaction_buffer, _reaction_buffer_config
+    if setting == 'POST_REACTION_BUFFER':
+        _reaction_buffer = None
+        _reaction_buffer_config = None
@@ -0,0 +1,112 @@
+"""
+Реакции на посты и счетчики Post.like_count / Post.dislike_count
+
+Счетчики хранятся в самом посте, поэтому страница поста и карточки на
+главной не считают реакции агрегатом по PostReaction. Они меняются в той же
+транзакции, что и реакция, выражениями F() (UPDATE ... SET like_count =
+like_count + 1), так что одновременные реакции не теряют обновлений.
+
+Реакции, измененные в обход toggle_reaction (админка, удаление
+пользователя), могут разойтись со счетчиками - их исправляет
+reconcile_reaction_counts() (команда reconcile_reaction_counts и задача
+celery beat).
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Post, PostReaction
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = {
+    'like': 'like_count',
+    'dislike': 'dislike_count',
+}
+
+
+def _shift_counters(post_id, **deltas):
+    """Атомарно меняет счетчики поста: _shift_counters(pk, like=1, dislike=-1)"""
+    updates = {}
+    for reaction_type, delta in deltas.items():
+        field = COUNTER_FIELDS[reaction_type]
+        # Разошедшийся счетчик не уходит ниже нуля (PositiveIntegerField)
+        updates[field] = F(field) + delta if delta > 0 else Greatest(F(field) + delta, Value(0))
+    Post.objects.filter(pk=post_id).update(**updates)
+
+
+def toggle_reaction(user, post_id, reaction_type):
+    """
+    Ставит, переключает или снимает реакцию пользователя.
+    Возвращает: (реакция пользователя или None, сообщение, {'like_count', 'dislike_count'})
+    """
+    with transaction.atomic():
+        reaction, created = PostReaction.objects.get_or_create(
+            user=user, post_id=post_id, defaults={'reaction_type': reaction_type}
+        )
+
+        if created:
+            _shift_counters(post_id, **{reaction_type: 1})
+            user_reaction, message = reaction_type, 'Реакция добавлена'
+        elif reaction.reaction_type == reaction_type:
+            # Отмена реакции; повторный запрос того же клика не уменьшит счетчик дважды
+            deleted, _ = PostReaction.objects.filter(pk=reaction.pk, reaction_type=reaction_type).delete()
+            if deleted:
+                _shift_counters(post_id, **{reaction_type: -1})
+            user_reaction, message = None, 'Реакция удалена'
+        else:
+            switched = PostReaction.objects.filter(
+                pk=reaction.pk, reaction_type=reaction.reaction_type
+            ).update(reaction_type=reaction_type)
+            if switched:
+                _shift_counters(post_id, **{reaction.reaction_type: -1, reaction_type: 1})
+            user_reaction, message = reaction_type, 'Реакция изменена'
+
+        counts = Post.objects.filter(pk=post_id).values('like_count', 'dislike_count').get()
+
+    return user_reaction, message, counts
+
+
+def actual_reaction_count(reaction_type):
+    """Подзапрос: число реакций reaction_type на пост"""
+    return Coalesce(
+        Subquery(
+            PostReaction.objects.filter(post=OuterRef('pk'), reaction_type=reaction_type)
+            .order_by().values('post').annotate(count=Count('pk')).values('count'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def reconcile_reaction_counts(post_ids=None, dry_run=False):
+    """
+    Сверяет счетчики постов с PostReaction и исправляет расхождения.
+    Возвращает: [(id поста, (лайки, дизлайки) в посте, (лайки, дизлайки) по реакциям), ...]
+    """
+    posts = Post.objects.all()
+    if post_ids:
+        posts = posts.filter(pk__in=post_ids)
+
+    drifted = list(
+        posts.annotate(
+            actual_likes=Count('postreaction', filter=Q(postreaction__reaction_type='like')),
+            actual_dislikes=Count('postreaction', filter=Q(postreaction__reaction_type='dislike')),
+        )
+        .exclude(like_count=F('actual_likes'), dislike_count=F('actual_dislikes'))
+        .order_by('pk')
+        .values_list('pk', 'like_count', 'dislike_count', 'actual_likes', 'actual_dislikes')
+    )
+
+    if drifted and not dry_run:
+        # Пересчет подзапросом в самом UPDATE: реакции, поставленные после сверки, не теряются
+        Post.objects.filter(pk__in=[row[0] for row in drifted]).update(
+            like_count=actual_reaction_count('like'),
+            dislike_count=actual_reaction_count('dislike'),
+        )
+        logger.warning(f"Исправлены счетчики реакций постов: {len(drifted)}")
+
+    return [(pk, (likes, dislikes), (actual_likes, actual_dislikes))
+            for pk, likes, dislikes, actual_likes, actual_dislikes in drifted]
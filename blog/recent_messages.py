@@ -0,0 +1,314 @@
+"""
+Последние сообщения комнат чата (кольцевой буфер)
+
+Для каждой комнаты хранится не больше SIZE последних сообщений в компактном
+виде [id, user_id, username, текст, время]. Сообщение добавляется в буфер
+сразу после записи в БД (OptimizedChatConsumer, MessageWriteBuffer), поэтому
+страница чата не перечитывает историю комнаты после каждого сообщения.
+
+Бэкенд выбирается настройкой CHAT_RECENT_MESSAGES['BACKEND']:
+- blog.recent_messages.RedisRecentMessages - список в Redis (LPUSHX + LTRIM);
+- blog.recent_messages.InMemoryRecentMessages - память процесса (тесты).
+
+Буфер заполняется из БД при первом чтении (fill); новые сообщения добавляются
+только в уже заполненный буфер, иначе в нем оказался бы "хвост" без истории.
+Каждое добавление и сброс увеличивают счетчик изменений комнаты; fill
+записывает буфер, только если счетчик не изменился с момента перед чтением
+из БД (fill_token) - иначе сообщение, сохраненное между чтением и fill,
+пропало бы из буфера. Неудавшийся fill просто оставляет буфер пустым: его
+заполнит следующий запрос.
+Изменение или удаление сохраненного сообщения сбрасывает буфер комнаты
+(см. blog/signals.py). Более старые страницы читаются из БД по курсору
+(blog.pagination).
+"""
+import json
+import logging
+import threading
+from collections import deque, namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from redis.exceptions import WatchError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RECENT_MESSAGES_SETTINGS = {
+    'BACKEND': 'blog.recent_messages.RedisRecentMessages',
+    'SIZE': 200,
+    'TIMEOUT': 24 * 60 * 60,  # Неактивная комната освобождает память
+}
+
+RecentUser = namedtuple('RecentUser', ['id', 'username'])
+
+
+class RecentMessage(namedtuple('RecentMessage', ['id', 'user', 'content', 'created_at'])):
+    """Сообщение из буфера: те же атрибуты, что читает шаблон чата у Message"""
+    __slots__ = ()
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def user_id(self):
+        return self.user.id
+
+
+def serialize_message(message):
+    return json.dumps(
+        [message.pk, message.user_id, message.user.username, message.content, message.created_at.timestamp()],
+        ensure_ascii=False, separators=(',', ':'),
+    )
+
+
+def deserialize_message(data):
+    pk, user_id, username, content, timestamp = json.loads(data)
+    return RecentMessage(
+        pk, RecentUser(user_id, username), content, datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+    )
+
+
+class BaseRecentMessages:
+    """Общий интерфейс буферов последних сообщений"""
+
+    def __init__(self, size=200, timeout=None):
+        self.size = size
+        self.timeout = timeout
+
+    @classmethod
+    def from_settings(cls, config):
+        return cls(size=config['SIZE'], timeout=config['TIMEOUT'])
+
+    def push(self, room_id, messages):
+        """Добавляет сохраненные сообщения (в порядке отправки), если буфер комнаты заполнен"""
+        raise NotImplementedError
+
+    def fill_token(self, room_id):
+        """Счетчик изменений комнаты; читается до выборки сообщений для fill из БД"""
+        raise NotImplementedError
+
+    def fill(self, room_id, messages, token):
+        """
+        Заполняет буфер комнаты сообщениями из БД (от новых к старым), если после
+        fill_token в комнату ничего не добавлялось. Возвращает: заполнен ли буфер
+        """
+        raise NotImplementedError
+
+    def range(self, room_id, start, stop):
+        """
+        Сообщения с позиции start по stop (0 - самое новое, stop не включается).
+        Возвращает: (сообщения, заполнен ли буфер до SIZE) или None, если буфер не заполнен из БД
+        """
+        raise NotImplementedError
+
+    def clear(self, room_id):
+        raise NotImplementedError
+
+
+class RedisRecentMessages(BaseRecentMessages):
+    """Список в Redis на комнату: новое сообщение слева, LTRIM держит SIZE последних"""
+
+    def __init__(self, size=200, timeout=None, alias='default'):
+        super().__init__(size, timeout)
+        self.alias = alias
+
+    @property
+    def client(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection(self.alias)
+
+    def make_key(self, room_id):
+        return cache.make_key(f'chat_recent:{room_id}')
+
+    def make_counter_key(self, room_id):
+        return cache.make_key(f'chat_recent:{room_id}:changes')
+
+    def push(self, room_id, messages):
+        key = self.make_key(room_id)
+        counter_key = self.make_counter_key(room_id)
+        try:
+            pipe = self.client.pipeline()
+            # Счетчик растет, даже если буфера нет: идущий сейчас fill не запишет буфер без этих сообщений
+            pipe.incr(counter_key)
+            pipe.lpushx(key, *[serialize_message(message) for message in messages])
+            pipe.ltrim(key, 0, self.size - 1)
+            if self.timeout:
+                pipe.expire(key, self.timeout)
+                pipe.expire(counter_key, self.timeout)
+            pipe.execute()
+        except Exception as e:
+            # Буфер без нового сообщения устарел - сбрасываем, чтобы его заполнили из БД
+            logger.warning(f"Redis недоступен, буфер сообщений комнаты {room_id} сброшен: {e}")
+            self.clear(room_id)
+
+    def fill_token(self, room_id):
+        try:
+            return self.client.get(self.make_counter_key(room_id))
+        except Exception as e:
+            logger.warning(f"Redis недоступен: {e}")
+            return None
+
+    def fill(self, room_id, messages, token):
+        if not messages:
+            return False
+        key = self.make_key(room_id)
+        counter_key = self.make_counter_key(room_id)
+        try:
+            with self.client.pipeline() as pipe:
+                # WATCH: push или clear после fill_token отменяют EXEC
+                pipe.watch(counter_key)
+                if pipe.get(counter_key) != token:
+                    return False
+                pipe.multi()  # MULTI/EXEC: читатели не видят буфер наполовину
+                pipe.delete(key)
+                pipe.rpush(key, *[serialize_message(message) for message in messages[:self.size]])
+                if self.timeout:
+                    pipe.expire(key, self.timeout)
+                pipe.execute()
+            return True
+        except WatchError:
+            return False
+        except Exception as e:
+            logger.warning(f"Redis недоступен: {e}")
+            return False
+
+    def range(self, room_id, start, stop):
+        key = self.make_key(room_id)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.llen(key)
+            pipe.lrange(key, start, stop - 1)
+            length, items = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Redis недоступен, сообщения читаются из БД: {e}")
+            return None
+        if not length:
+            return None
+        return [deserialize_message(item) for item in items], length >= self.size
+
+    def clear(self, room_id):
+        try:
+            pipe = self.client.pipeline()
+            pipe.delete(self.make_key(room_id))
+            pipe.incr(self.make_counter_key(room_id))
+            if self.timeout:
+                pipe.expire(self.make_counter_key(room_id), self.timeout)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Redis недоступен: {e}")
+
+
+class InMemoryRecentMessages(BaseRecentMessages):
+    """Буфер в памяти процесса с той же семантикой, что и Redis"""
+
+    def __init__(self, size=200, timeout=None):
+        super().__init__(size, timeout)
+        self._rooms = {}
+        self._changes = {}
+        self._lock = threading.Lock()
+
+    def push(self, room_id, messages):
+        with self._lock:
+            self._changes[room_id] = self._changes.get(room_id, 0) + 1
+            items = self._rooms.get(room_id)
+            if items is not None:
+                items.extendleft(serialize_message(message) for message in messages)
+
+    def fill_token(self, room_id):
+        with self._lock:
+            return self._changes.get(room_id, 0)
+
+    def fill(self, room_id, messages, token):
+        if not messages:
+            return False
+        with self._lock:
+            if self._changes.get(room_id, 0) != token:
+                return False
+            self._rooms[room_id] = deque(
+                (serialize_message(message) for message in messages[:self.size]), maxlen=self.size
+            )
+            return True
+
+    def range(self, room_id, start, stop):
+        with self._lock:
+            items = self._rooms.get(room_id)
+            if not items:
+                return None
+            selected = list(items)[start:stop]
+            full = len(items) >= self.size
+        return [deserialize_message(item) for item in selected], full
+
+    def clear(self, room_id):
+        with self._lock:
+            self._changes[room_id] = self._changes.get(room_id, 0) + 1
+            self._rooms.pop(room_id, None)
+
+
+_recent_messages = None
+
+
+def get_recent_messages():
+    """Возвращает буфер из настройки CHAT_RECENT_MESSAGES (один на процесс)"""
+    global _recent_messages
+    if _recent_messages is None:
+        config = dict(DEFAULT_RECENT_MESSAGES_SETTINGS, **getattr(settings, 'CHAT_RECENT_MESSAGES', {}))
+        _recent_messages = import_string(config['BACKEND']).from_settings(config)
+    return _recent_messages
+
+
+def push_saved_messages(messages):
+    """Добавляет только что сохраненные сообщения в буферы их комнат"""
+    by_room = {}
+    for message in messages:
+        by_room.setdefault(message.room_id, []).append(message)
+
+    recent = get_recent_messages()
+    for room_id, room_messages in by_room.items():
+        recent.push(room_id, room_messages)
+
+
+def get_room_messages_page(room, cursor=None, per_page=50, search_query=None):
+    """
+    Страница сообщений комнаты от новых к старым (CursorPage).
+    Первая страница читается из буфера, более старые - из БД по курсору.
+    Поиск - по индексу blog.message_search, по релевантности
+    """
+    from .message_search import get_message_search
+    from .models import Message
+    from .pagination import OLDER, CursorPage, encode_cursor, paginate_by_cursor
+
+    if search_query:
+        return get_message_search().search(room, search_query, cursor, per_page)
+
+    queryset = Message.objects.filter(room=room, is_blocked=False).select_related('user').only(
+        'content', 'created_at', 'room_id', 'user__username'
+    )
+    recent = get_recent_messages()
+    if cursor is not None or per_page >= recent.size:
+        return paginate_by_cursor(queryset, cursor, per_page)
+
+    # Лишнее сообщение показывает, есть ли более старые
+    cached = recent.range(room.pk, 0, per_page + 1)
+    if cached is None:
+        token = recent.fill_token(room.pk)
+        latest = list(queryset.order_by('-created_at', '-id')[:recent.size])
+        recent.fill(room.pk, latest, token)
+        items = latest[:per_page + 1]
+    else:
+        items = cached[0]
+
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    return CursorPage(items, next_cursor=encode_cursor(items[-1], OLDER) if has_more else None)
+
+
+@receiver(setting_changed)
+def reset_recent_messages(setting, **kwargs):
+    """Сбрасывает буфер при override_settings в тестах"""
+    global _recent_messages
+    if setting == 'CHAT_RECENT_MESSAGES':
+        _recent_messages = None
@@ -0,0 +1,258 @@
+"""
+Повторная модерация сохраненных сообщений
+
+После изменения словаря или заблокированных слов комнаты вердикты уже
+сохраненных сообщений (is_blocked, moderation_reason) устаревают.
+remoderate_messages() перепроверяет их текущими правилами:
+- сообщения читаются по возрастанию id через iterator(chunk_size), в памяти
+  не больше нескольких пачек по batch_size строк;
+- пачки проверяются в пуле процессов (workers > 0) или в текущем процессе,
+  одинаковые тексты внутри пачки проверяются один раз;
+- изменившиеся вердикты записываются через bulk_update, поисковый индекс
+  обновляется для тех же сообщений;
+- после каждой записанной пачки id последнего сообщения сохраняется в кеш,
+  и прерванный запуск продолжается с этого места (resume=True);
+- в режиме dry_run ничего не записывается, возвращается только отчет.
+
+Проверяется только текст (как в check_message_content); бан и частота
+сообщений к уже отправленным сообщениям не относятся. Комнаты с выключенной
+модерацией пропускаются.
+
+Запуск: python manage.py remoderate_messages или задача
+blog.tasks.remoderate_messages_task.
+"""
+import hashlib
+import logging
+import multiprocessing
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.core.cache import cache
+
+from .message_search import index_messages
+from .moderation_executor import _init_worker
+from .moderation_stats import reason_key
+from .performance_utils import invalidate_messages_cache
+from .recent_messages import get_recent_messages
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_KEY_PREFIX = 'remoderation:checkpoint'
+MAX_SAMPLES = 20
+
+
+def _check_batch_task(rows, policies, moderation_level):
+    """
+    Проверяет пачку [(room_id, текст), ...] политиками {room_id: политика}.
+    Возвращает вердикты (is_blocked, reason) в том же порядке
+    """
+    from .lexicon_store import lexicon_store
+    from .moderation_utils import check_message_content
+
+    # Словарь мог смениться во время запуска - берем опубликованную версию сразу
+    lexicon_store.refresh()
+
+    verdicts = {}
+    results = []
+    for room_id, content in rows:
+        policy = policies[room_id]
+        key = (policy.version, content)
+        verdict = verdicts.get(key)
+        if verdict is None:
+            verdict = verdicts[key] = check_message_content(content, policy, moderation_level)
+        results.append(verdict)
+    return results
+
+
+def load_policy(room_id):
+    """Политика комнаты без создания ModerationSettings (dry_run ничего не пишет)"""
+    from .models import ModerationSettings
+    from .moderation_policy import DEFAULT_POLICY_SETTINGS, ModerationPolicy
+
+    moderation_settings = ModerationSettings.objects.filter(room_id=room_id).first()
+    if moderation_settings is None:
+        moderation_settings = ModerationSettings(room_id=room_id, **DEFAULT_POLICY_SETTINGS)
+    return ModerationPolicy.from_settings(moderation_settings)
+
+
+def checkpoint_key(room_ids=None, since=None, until=None, moderation_level='moderate'):
+    """Ключ контрольной точки: свой для каждого набора фильтров"""
+    fingerprint = repr((sorted(room_ids or ()), since and since.isoformat(),
+                        until and until.isoformat(), moderation_level))
+    return f'{CHECKPOINT_KEY_PREFIX}:{hashlib.sha1(fingerprint.encode()).hexdigest()[:16]}'
+
+
+def _completed(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class Remoderation:
+    """Один запуск повторной модерации"""
+
+    def __init__(self, room_ids=None, since=None, until=None, moderation_level='moderate',
+                 batch_size=1000, workers=0, dry_run=False, unblock=True, progress=None):
+        self.room_ids = room_ids
+        self.since = since
+        self.until = until
+        self.moderation_level = moderation_level
+        self.batch_size = batch_size
+        self.workers = workers
+        self.dry_run = dry_run
+        self.unblock = unblock
+        self.progress = progress
+
+        self.checkpoint_key = checkpoint_key(room_ids, since, until, moderation_level)
+        self._policies = {}
+        self._changed_rooms = set()
+        self.report = {
+            'dry_run': dry_run,
+            'start_id': 0,
+            'last_id': 0,
+            'scanned': 0,
+            'skipped': 0,
+            'changed': 0,
+            'blocked': 0,
+            'unblocked': 0,
+            'reasons': Counter(),
+            'samples': [],
+        }
+
+    def queryset(self, start_id=0):
+        from .models import Message
+
+        qs = Message.objects.filter(pk__gt=start_id)
+        if self.room_ids:
+            qs = qs.filter(room_id__in=self.room_ids)
+        if self.since:
+            qs = qs.filter(created_at__gte=self.since)
+        if self.until:
+            qs = qs.filter(created_at__lt=self.until)
+        return qs.order_by('pk').values_list('pk', 'room_id', 'content', 'is_blocked', 'moderation_reason')
+
+    def batches(self, start_id=0):
+        """Пачки строк из одного потока iterator(chunk_size)"""
+        batch = []
+        for row in self.queryset(start_id).iterator(chunk_size=self.batch_size):
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def policy(self, room_id):
+        policy = self._policies.get(room_id)
+        if policy is None:
+            policy = self._policies[room_id] = load_policy(room_id)
+        return policy
+
+    def run(self, resume=False):
+        start_id = (cache.get(self.checkpoint_key) or 0) if resume else 0
+        self.report['start_id'] = self.report['last_id'] = start_id
+        started = time.perf_counter()
+
+        pool = None
+        if self.workers > 0:
+            pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+
+        # Пачек в работе не больше двух на процесс - память ограничена
+        in_flight = deque()
+        max_in_flight = max(self.workers * 2, 1)
+        try:
+            for batch in self.batches(start_id):
+                checked = []
+                for row in batch:
+                    if self.policy(row[1]).enabled:
+                        checked.append(row)
+                    else:
+                        self.report['skipped'] += 1
+
+                rows = [(room_id, content) for _, room_id, content, _, _ in checked]
+                policies = {room_id: self.policy(room_id) for room_id, _ in rows}
+                if pool is not None:
+                    future = pool.submit(_check_batch_task, rows, policies, self.moderation_level)
+                else:
+                    future = _completed(_check_batch_task(rows, policies, self.moderation_level))
+                in_flight.append((batch, checked, future))
+
+                if len(in_flight) >= max_in_flight:
+                    self._apply(*in_flight.popleft())
+
+            while in_flight:
+                self._apply(*in_flight.popleft())
+        finally:
+            for _, _, future in in_flight:
+                future.cancel()
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        if not self.dry_run:
+            cache.delete(self.checkpoint_key)
+            self._invalidate_room_caches()
+
+        report = dict(self.report, reasons=dict(self.report['reasons']))
+        report['elapsed_s'] = time.perf_counter() - started
+        return report
+
+    def _apply(self, batch, checked, future):
+        """Сравнивает вердикты с сохраненными, записывает изменения и контрольную точку"""
+        from .models import Message
+
+        report = self.report
+        changed = []
+        for (pk, room_id, content, was_blocked, old_reason), (is_blocked, reason) in zip(checked, future.result()):
+            if is_blocked == was_blocked and (not is_blocked or reason == old_reason):
+                continue
+            if was_blocked and not is_blocked and not self.unblock:
+                continue
+
+            if is_blocked:
+                report['reasons'][reason_key(reason)] += 1
+                if not was_blocked:
+                    report['blocked'] += 1
+            else:
+                report['unblocked'] += 1
+
+            if len(report['samples']) < MAX_SAMPLES:
+                report['samples'].append({
+                    'id': pk, 'room_id': room_id, 'content': content[:80],
+                    'was_blocked': was_blocked, 'is_blocked': is_blocked, 'reason': reason,
+                })
+            changed.append(Message(pk=pk, room_id=room_id, is_blocked=is_blocked,
+                                   moderation_reason=reason or None))
+
+        report['scanned'] += len(batch)
+        report['changed'] += len(changed)
+        report['last_id'] = batch[-1][0]
+
+        if not self.dry_run:
+            if changed:
+                Message.objects.bulk_update(changed, ['is_blocked', 'moderation_reason'], batch_size=self.batch_size)
+                index_messages([message.pk for message in changed])
+                self._changed_rooms.update(message.room_id for message in changed)
+            cache.set(self.checkpoint_key, report['last_id'], None)
+
+        if self.progress:
+            self.progress(report)
+
+    def _invalidate_room_caches(self):
+        """Сбрасывает буферы и кеш последних сообщений комнат, где изменились вердикты"""
+        recent = get_recent_messages()
+        for room_id in self._changed_rooms:
+            recent.clear(room_id)
+            invalidate_messages_cache(room_id)
+
+
+def remoderate_messages(resume=False, **options):
+    """
+    Перепроверяет сохраненные сообщения текущими правилами.
+    Параметры - см. Remoderation; возвращает отчет
+    """
+    return Remoderation(**options).run(resume=resume)
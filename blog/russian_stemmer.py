@@ -0,0 +1,94 @@
+"""
+Стеммер русского языка (алгоритм Snowball/Портера)
+
+Нужен для полнотекстового поиска по сообщениям на SQLite: в FTS5 нет
+русской морфологии, поэтому в индекс и в запрос попадают основы слов
+("сообщения", "сообщение" -> "сообщен"). На PostgreSQL то же самое делает
+конфигурация 'russian' у to_tsvector.
+"""
+import re
+from functools import lru_cache
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND_RE = re.compile(r'(ив|ивши|ившись|ыв|ывши|ывшись|(?<=[ая])(в|вши|вшись))$')
+REFLEXIVE_RE = re.compile(r'(ся|сь)$')
+ADJECTIVE_RE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$'
+)
+PARTICIPLE_RE = re.compile(r'(ивш|ывш|ующ|(?<=[ая])(ем|нн|вш|ющ|щ))$')
+VERB_RE = re.compile(
+    r'(ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю'
+    r'|(?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно))$'
+)
+NOUN_RE = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+SUPERLATIVE_RE = re.compile(r'(ейше|ейш)$')
+DERIVATIONAL_RE = re.compile(r'(ост|ость)$')
+
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+
+def _region_start(word, start=0):
+    """Начало области после первой согласной, идущей за гласной (R1/R2)"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _cut(regex, text):
+    """Отрезает окончание regex; возвращает (текст, отрезано ли)"""
+    match = regex.search(text)
+    if match is None:
+        return text, False
+    return text[:match.start()], True
+
+
+@lru_cache(maxsize=50_000)
+def stem(word):
+    """Основа слова; слова без кириллицы возвращаются в нижнем регистре"""
+    word = word.lower().replace('ё', 'е')
+    if not CYRILLIC_RE.search(word):
+        return word
+
+    rv_start = next((i + 1 for i, char in enumerate(word) if char in VOWELS), len(word))
+    r2_start = _region_start(word, _region_start(word))
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1: деепричастие, иначе возвратность и прилагательное/глагол/существительное
+    rv, found = _cut(PERFECTIVE_GERUND_RE, rv)
+    if not found:
+        rv, _ = _cut(REFLEXIVE_RE, rv)
+        rv, found = _cut(ADJECTIVE_RE, rv)
+        if found:
+            rv, _ = _cut(PARTICIPLE_RE, rv)
+        else:
+            rv, found = _cut(VERB_RE, rv)
+            if not found:
+                rv, _ = _cut(NOUN_RE, rv)
+
+    # Шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательное окончание только в R2
+    match = DERIVATIONAL_RE.search(rv)
+    if match and rv_start + match.start() >= r2_start:
+        rv = rv[:match.start()]
+
+    # Шаг 4
+    rv, found = _cut(SUPERLATIVE_RE, rv)
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    elif not found and rv.endswith('ь'):
+        rv = rv[:-1]
+
+    return prefix + rv
+
+
+def stem_words(text):
+    """Основы всех слов текста по порядку"""
+    return [stem(word) for word in WORD_RE.findall(text)]
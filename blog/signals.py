@@ -0,0 +1,102 @@
+"""
+Обработчики сигналов моделей блога
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .ban_index import get_ban_index, invalidate_ban_index
+from .lexicon_store import schedule_publish
+from .message_search import index_messages, remove_messages
+from .moderation_policy import policy_cache, invalidate_moderation_policies
+from .performance_utils import invalidate_messages_cache, invalidate_posts_cache
+from .models import UserBan, ModerationSettings, LexiconEntry, Message, Post
+from .post_search import index_posts, remove_posts
+from .recent_messages import get_recent_messages
+
+
+@receiver([post_save, post_delete], sender=UserBan)
+def invalidate_bans_on_change(sender, **kwargs):
+    """
+    ✅ Изменение бана сбрасывает индекс банов сразу в этом процессе,
+    а остальные процессы оповещаются после фиксации транзакции
+    """
+    get_ban_index().invalidate()
+    transaction.on_commit(invalidate_ban_index)
+
+
+@receiver([post_save, post_delete], sender=ModerationSettings)
+def invalidate_moderation_policy_on_change(sender, **kwargs):
+    """
+    ✅ Изменение настроек модерации в админке сбрасывает скомпилированные
+    политики во всех процессах
+    """
+    policy_cache.invalidate()
+    transaction.on_commit(invalidate_moderation_policies)
+
+
+@receiver([post_save, post_delete], sender=LexiconEntry)
+def publish_lexicon_on_change(sender, **kwargs):
+    """
+    ✅ Изменение словаря в админке публикует новую версию после фиксации
+    транзакции; процессы подхватывают ее без перезапуска. Правки подряд
+    (массовое редактирование, импорт) собираются в одну компиляцию
+    """
+    transaction.on_commit(schedule_publish)
+
+
+@receiver([post_save, post_delete], sender=Message)
+def reset_recent_messages_on_change(sender, instance, created=False, **kwargs):
+    """
+    ✅ Новые сообщения добавляет в буфер сам консьюмер, и кеш сообщений комнаты
+    (performance_utils) на каждое сообщение чата не сбрасывается (буфер записи
+    сбрасывает его раз за запись пачки). Изменение или удаление сохраненного
+    сообщения (админка, модерация) сбрасывает и буфер, и кеш комнаты
+    """
+    if created:
+        return
+    room_id = instance.room_id
+    transaction.on_commit(lambda: invalidate_messages_cache(room_id))
+    transaction.on_commit(lambda: get_recent_messages().clear(room_id))
+
+
+@receiver(post_save, sender=Message)
+def index_message_on_save(sender, instance, **kwargs):
+    """
+    ✅ Сохраненное сообщение попадает в поисковый индекс после фиксации
+    транзакции (заблокированное - удаляется из него)
+    """
+    message_id = instance.pk
+    transaction.on_commit(lambda: index_messages([message_id]))
+
+
+@receiver(post_delete, sender=Message)
+def remove_message_from_index(sender, instance, **kwargs):
+    message_id = instance.pk
+    transaction.on_commit(lambda: remove_messages([message_id]))
+
+
+@receiver(post_save, sender=Post)
+def index_post_on_save(sender, instance, **kwargs):
+    """
+    ✅ Создание и редактирование поста (PostCreateView, PostUpdateView,
+    админка) обновляют поисковый индекс после фиксации транзакции
+    """
+    post_id = instance.pk
+    transaction.on_commit(lambda: index_posts([post_id]))
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_index(sender, instance, **kwargs):
+    post_id = instance.pk
+    transaction.on_commit(lambda: remove_posts([post_id]))
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post_cache_on_change(sender, instance, **kwargs):
+    """
+    ✅ Изменение поста сбрасывает пространства кеша списка постов и самого
+    поста (INCR поколений) после фиксации транзакции
+    """
+    post_id = instance.pk
+    transaction.on_commit(lambda: invalidate_posts_cache(post_id))
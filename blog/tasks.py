@@ -171,3 +171,89 @@ def send_critical_email(self, user_id, subject, message):
             logger.critical(f"🔴🔴🔴 CRITICAL: Max retries exceeded for user {user_id}")
             # Здесь можно отправить алерт админам
             return f"CRITICAL FAILURE after {self.max_retries} retries"
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# ОБСЛУЖИВАНИЕ МОДЕРАЦИИ (расписание - CELERY_BEAT_SCHEDULE в settings.py)
+# ═══════════════════════════════════════════════════════════════════════════
+
+@shared_task(ignore_result=True)
+def cleanup_expired_bans_task():
+    """
+    Деактивирует истекшие баны одним UPDATE.
+    ✅ Выполняется по расписанию celery beat, а не при проверке сообщений
+    """
+    from blog.moderation_utils import cleanup_expired_bans
+
+    deactivated = cleanup_expired_bans()
+    logger.info(f"Деактивировано истекших банов: {deactivated}")
+    return deactivated
+
+
+@shared_task(ignore_result=True)
+def cleanup_message_rates_task(batch_size=1000):
+    """
+    Удаляет старые записи UserMessageRate пачками по batch_size.
+    ✅ Выполняется по расписанию celery beat, а не при проверке сообщений
+    """
+    from blog.moderation_utils import cleanup_old_message_rates
+
+    deleted = cleanup_old_message_rates(batch_size=batch_size)
+    logger.info(f"Удалено старых записей о частоте сообщений: {deleted}")
+    return deleted
+
+
+@shared_task(ignore_result=True)
+def flush_reaction_buffer_task():
+    """
+    Записывает реакции из буфера Redis в PostReaction пачками.
+    ✅ Выполняется по расписанию celery beat; без POST_REACTION_BUFFER['ENABLED'] ничего не делает
+    """
+    from blog.reaction_buffer import flush_reaction_buffer
+
+    flushed = flush_reaction_buffer()
+    if flushed:
+        logger.info(f"Записано реакций из буфера: {flushed}")
+    return flushed
+
+
+@shared_task(ignore_result=True)
+def reconcile_reaction_counts_task():
+    """
+    Сверяет счетчики реакций постов с PostReaction и исправляет расхождения.
+    ✅ Выполняется по расписанию celery beat
+    """
+    from blog.reactions import reconcile_reaction_counts
+
+    drifted = reconcile_reaction_counts()
+    logger.info(f"Исправлено счетчиков реакций постов: {len(drifted)}")
+    return len(drifted)
+
+
+@shared_task
+def remoderate_messages_task(room_ids=None, since=None, until=None, moderation_level='moderate',
+                             dry_run=False, resume=True):
+    """
+    Повторная модерация сохраненных сообщений (см. blog/remoderation.py).
+
+    ✅ Проверки в процессе воркера: воркеры Celery не могут запускать свой пул процессов
+    ✅ resume=True - повторный запуск продолжает с контрольной точки
+    """
+    from django.utils.dateparse import parse_datetime
+    from blog.remoderation import remoderate_messages
+
+    report = remoderate_messages(
+        resume=resume,
+        room_ids=room_ids,
+        since=parse_datetime(since) if since else None,
+        until=parse_datetime(until) if until else None,
+        moderation_level=moderation_level,
+        workers=0,
+        dry_run=dry_run,
+    )
+    logger.info(
+        f"Повторная модерация: проверено {report['scanned']}, изменено {report['changed']} "
+        f"(заблокировано {report['blocked']}, разблокировано {report['unblocked']})"
+    )
+    report.pop('samples')
+    return report
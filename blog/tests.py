@@ -1,7 +1,50 @@
-from django.test import TestCase, Client
+import time
+from io import StringIO
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from .models import CustomUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.utils import timezone
+
+from .cache_utils import (
+    POSTS_NAMESPACE, RELEASE_LOCK_SCRIPT, _should_refresh, get_or_compute, release_lock, room_namespace, versioned_key,
+)
+from .message_buffer import MessageWriteBuffer
+from .message_search import SQLiteMessageSearch, get_message_search, rebuild_message_search
+from .models import CustomUser, ChatRoom, Message, Post, PostReaction
+from .performance_utils import get_published_posts_optimized, invalidate_messages_cache, invalidate_posts_cache
+from .pagination import CursorError, decode_cursor, paginate_by_cursor
+from .post_search import get_post_search
+from . import reaction_buffer
+from .reaction_buffer import (
+    ReactionBufferUnavailable, flush_reaction_buffer, get_post_reaction_state, get_reaction_buffer, post_exists,
+    toggle_post_reaction,
+)
+from .reactions import reconcile_reaction_counts, toggle_reaction
+from .russian_stemmer import stem
+from .recent_messages import get_recent_messages, get_room_messages_page, push_saved_messages
+from .two_tier_cache import LocalInvalidationBus, RedisInvalidationBus, TwoTierCache, get_two_tier_cache
+
+
+def create_user(username):
+    """Пользователь для тестов, которым не важны его почта и пароль"""
+    return CustomUser.objects.create_user(
+        username=username, email=f'{username}@example.com', password='testpass123'
+    )
+
+
+class CleanCacheMixin:
+    """Кеш и L1 процесса не откатываются вместе с транзакцией теста"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        get_two_tier_cache().clear()
+
 
 class UserAuthenticationTestCase(TestCase):
     
@@ -151,4 +194,684 @@ class UserAuthenticationTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         
         # Проверяем, что нет перенаправления на страницу входа
-        self.assertNotEqual(response.status_code, 302)
\ No newline at end of file
+        self.assertNotEqual(response.status_code, 302)
+
+
+class CursorPaginationTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user('cursoruser')
+        self.room = ChatRoom.objects.create(name='cursor_room')
+        for i in range(5):
+            Message.objects.create(room=self.room, user=self.user, content=f'сообщение {i}')
+        self.queryset = Message.objects.filter(room=self.room)
+
+    def walk(self, per_page):
+        page = paginate_by_cursor(self.queryset, per_page=per_page)
+        contents = [message.content for message in page]
+        while page.has_next():
+            page = paginate_by_cursor(self.queryset, page.next_cursor, per_page)
+            contents.extend(message.content for message in page)
+        return contents
+
+    def test_equal_timestamps_are_ordered_by_id(self):
+        self.queryset.update(created_at=timezone.now())
+        self.assertEqual(self.walk(2), [f'сообщение {i}' for i in range(4, -1, -1)])
+
+    def test_tampered_cursor_is_rejected(self):
+        cursor = paginate_by_cursor(self.queryset, per_page=2).next_cursor
+        with self.assertRaises(CursorError):
+            paginate_by_cursor(self.queryset, cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B'), 2)
+        with self.assertRaises(CursorError):
+            decode_cursor('garbage')
+
+
+class PostSearchTestCase(TestCase):
+    def setUp(self):
+        self.author = create_user('postauthor')
+        self.search = get_post_search()
+
+    def publish(self, title, content, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(title=title, content=content, author=self.author, **kwargs)
+
+    def titles(self, page):
+        return [post.title for post in page]
+
+    def test_title_matches_rank_above_content(self):
+        self.publish('Заметки о погоде', 'Сегодня мы поговорим о котах и собаках')
+        self.publish('Коты в городе', 'Несколько слов о городской жизни')
+        self.publish('Черновик про котов', 'Коты', is_published=False)
+
+        page = self.search.search('коты')
+        self.assertEqual(self.titles(page), ['Коты в городе', 'Заметки о погоде'])
+        self.assertIn('<mark>котах</mark>', page.object_list[1].search_snippet)
+        self.assertEqual(page.object_list[0].search_title, '<mark>Коты</mark> в городе')
+
+    def test_snippet_escapes_html(self):
+        self.publish('Пост', '<b>жирный</b> текст про котов')
+        snippet = self.search.search('кот').object_list[0].search_snippet
+        self.assertIn('&lt;b&gt;', snippet)
+        self.assertIn('<mark>котов</mark>', snippet)
+
+    def test_suggest_uses_title_prefixes(self):
+        post = self.publish('Программирование на Python', 'текст')
+        self.publish('Другое', 'программирование упоминается только в тексте')
+
+        self.assertEqual(self.search.suggest('прогр'), [(post.pk, 'Программирование на Python')])
+        self.assertEqual(self.search.suggest('pyth'), [(post.pk, 'Программирование на Python')])
+
+    def test_index_follows_edits_and_deletes(self):
+        post = self.publish('Старый заголовок', 'текст')
+        with self.captureOnCommitCallbacks(execute=True):
+            post.title = 'Новый заголовок'
+            post.save()
+        self.assertEqual(self.titles(self.search.search('старый')), [])
+        self.assertEqual(self.titles(self.search.search('новый')), ['Новый заголовок'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertEqual(self.titles(self.search.search('новый')), [])
+
+
+class ReactionCountersTestCase(TestCase):
+    def setUp(self):
+        self.author = create_user('reactauthor')
+        self.reader = create_user('reader')
+        self.post = Post.objects.create(title='Пост', content='текст', author=self.author)
+
+    def counts(self):
+        self.post.refresh_from_db()
+        return self.post.like_count, self.post.dislike_count
+
+    def test_toggle_updates_counters(self):
+        self.assertEqual(toggle_reaction(self.reader, self.post.pk, 'like')[2],
+                         {'like_count': 1, 'dislike_count': 0})
+        self.assertEqual(toggle_reaction(self.author, self.post.pk, 'like')[0], 'like')
+        self.assertEqual(self.counts(), (2, 0))
+
+        user_reaction, _, counts = toggle_reaction(self.reader, self.post.pk, 'dislike')
+        self.assertEqual((user_reaction, counts), ('dislike', {'like_count': 1, 'dislike_count': 1}))
+
+        user_reaction, _, counts = toggle_reaction(self.reader, self.post.pk, 'dislike')
+        self.assertEqual((user_reaction, counts), (None, {'like_count': 1, 'dislike_count': 0}))
+
+    def test_editing_post_keeps_counters(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        toggle_reaction(self.reader, self.post.pk, 'like')
+        stale.title = 'Новый заголовок'
+        stale.save()
+        self.assertEqual(self.counts(), (1, 0))
+
+    def test_reconcile_repairs_drift(self):
+        toggle_reaction(self.reader, self.post.pk, 'like')
+        PostReaction.objects.filter(user=self.reader).delete()  # В обход toggle_reaction
+        PostReaction.objects.create(user=self.author, post=self.post, reaction_type='dislike')
+
+        self.assertEqual(reconcile_reaction_counts(dry_run=True), [(self.post.pk, (1, 0), (0, 1))])
+        self.assertEqual(self.counts(), (1, 0))
+
+        reconcile_reaction_counts()
+        self.assertEqual(self.counts(), (0, 1))
+        self.assertEqual(reconcile_reaction_counts(), [])
+
+
+@override_settings(POST_REACTION_BUFFER={
+    'ENABLED': True, 'BACKEND': 'blog.reaction_buffer.InMemoryReactionBuffer', 'FLUSH_BATCH': 2,
+})
+class ReactionBufferTestCase(CleanCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = [create_user(f'clicker{i}') for i in range(3)]
+        self.post = Post.objects.create(title='Горячий пост', content='текст', author=self.users[0])
+        self.buffer = get_reaction_buffer()
+        self.buffer.clear()
+
+    def test_toggles_are_served_from_buffer(self):
+        PostReaction.objects.create(user=self.users[0], post=self.post, reaction_type='like')
+        Post.objects.filter(pk=self.post.pk).update(like_count=1)
+
+        # Первый клик пользователя читает его реакцию и счетчики из БД
+        user_reaction, message, counts = toggle_post_reaction(self.users[0], self.post.pk, 'dislike')
+        self.assertEqual((user_reaction, message), ('dislike', 'Реакция изменена'))
+        self.assertEqual(counts, {'like_count': 0, 'dislike_count': 1})
+
+        toggle_post_reaction(self.users[1], self.post.pk, 'like')
+        with self.assertNumQueries(0):
+            user_reaction, message, counts = toggle_post_reaction(self.users[1], self.post.pk, 'like')
+        self.assertEqual((user_reaction, message), (None, 'Реакция удалена'))
+        self.assertEqual(counts, {'like_count': 0, 'dislike_count': 1})
+
+        self.post.refresh_from_db()
+        self.assertEqual(get_post_reaction_state(self.post, self.users[0]),
+                         ('dislike', {'like_count': 0, 'dislike_count': 1}))
+        # В БД до записи буфера ничего не изменилось
+        self.assertEqual(self.post.like_count, 1)
+
+    def test_post_existence_is_cached_until_post_is_deleted(self):
+        post_id = self.post.pk
+        self.assertTrue(post_exists(post_id))
+        with self.assertNumQueries(0):
+            self.assertTrue(post_exists(post_id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.delete()
+        self.assertFalse(post_exists(post_id))
+
+    def test_flush_writes_reactions_and_counters(self):
+        toggle_post_reaction(self.users[0], self.post.pk, 'like')
+        toggle_post_reaction(self.users[1], self.post.pk, 'dislike')
+        toggle_post_reaction(self.users[2], self.post.pk, 'like')
+        toggle_post_reaction(self.users[2], self.post.pk, 'like')
+
+        self.assertEqual(flush_reaction_buffer(), 3)
+        self.assertEqual(
+            dict(PostReaction.objects.values_list('user__username', 'reaction_type')),
+            {'clicker0': 'like', 'clicker1': 'dislike'},
+        )
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.dislike_count), (1, 1))
+
+        toggle_post_reaction(self.users[0], self.post.pk, 'dislike')
+        self.assertEqual(flush_reaction_buffer(), 1)
+        self.assertEqual(PostReaction.objects.get(user=self.users[0]).reaction_type, 'dislike')
+        self.assertEqual(flush_reaction_buffer(), 0)
+
+    def test_failed_flush_keeps_changes(self):
+        toggle_post_reaction(self.users[0], self.post.pk, 'like')
+        with mock.patch('blog.reaction_buffer._write_batch', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                flush_reaction_buffer()
+        self.assertEqual(flush_reaction_buffer(), 1)
+        self.assertTrue(PostReaction.objects.filter(user=self.users[0], reaction_type='like').exists())
+
+    def test_unavailable_buffer_rejects_click_without_db_write(self):
+        toggle_post_reaction(self.users[1], self.post.pk, 'like')
+        with mock.patch.object(self.buffer, 'toggle', side_effect=ConnectionError('redis down')):
+            with self.assertRaises(ReactionBufferUnavailable):
+                toggle_post_reaction(self.users[0], self.post.pk, 'like')
+        self.assertFalse(PostReaction.objects.exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
+        # Буфер и БД не разошлись: следующий клик считается от состояния в буфере
+        user_reaction, message, counts = toggle_post_reaction(self.users[0], self.post.pk, 'like')
+        self.assertEqual((user_reaction, counts), ('like', {'like_count': 2, 'dislike_count': 0}))
+        self.assertEqual(flush_reaction_buffer(), 2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 2)
+
+
+@override_settings(POST_REACTION_BUFFER={
+    'ENABLED': True, 'BACKEND': 'blog.reaction_buffer.InMemoryReactionBuffer', 'FLUSH_BATCH': 10,
+})
+class ReactionBufferRejectedPairTestCase(TransactionTestCase):
+    """Внешние ключи в SQLite проверяются при фиксации - нужны настоящие транзакции"""
+
+    def setUp(self):
+        self.users = [create_user(f'flusher{i}') for i in range(3)]
+        self.post = Post.objects.create(title='Пост', content='текст', author=self.users[0])
+        self.buffer = get_reaction_buffer()
+        self.buffer.clear()
+        for user in self.users:
+            toggle_post_reaction(user, self.post.pk, 'like')
+
+    def test_deleted_user_does_not_block_flush(self):
+        self.users[1].delete()
+
+        self.assertEqual(flush_reaction_buffer(), 3)
+        self.assertEqual(
+            set(PostReaction.objects.values_list('user__username', flat=True)), {'flusher0', 'flusher2'}
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 2)
+
+    def test_rejected_batch_is_written_pair_by_pair(self):
+        write_batch = reaction_buffer._write_batch
+        calls = []
+
+        def reject_batches(items):
+            calls.append(len(items))
+            # Пользователь удален между проверкой и записью - БД отвергает всю пачку и эту пару
+            if len(items) > 1 or items[0][1] == self.users[1].pk:
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            write_batch(items)
+
+        with mock.patch('blog.reaction_buffer._write_batch', side_effect=reject_batches):
+            self.assertEqual(flush_reaction_buffer(), 3)
+        self.assertEqual(calls, [3, 1, 1, 1])
+        self.assertEqual(
+            set(PostReaction.objects.values_list('user__username', flat=True)), {'flusher0', 'flusher2'}
+        )
+        self.assertEqual(flush_reaction_buffer(), 0)
+
+
+class PostStoredFieldsTestCase(TestCase):
+    def setUp(self):
+        self.author = create_user('previewauthor')
+
+    def test_preview_and_slug_computed_on_save(self):
+        content = 'а' * 250 + '. ' + 'б' * 200
+        post = Post.objects.create(title='Новый пост: итоги!', content=content, author=self.author)
+        self.assertEqual(post.preview, content[:251])
+        self.assertEqual(post.slug, 'новый-пост-итоги')
+
+        post.title = 'Другой заголовок'
+        post.content = 'коротко'
+        post.save(update_fields=['title'])
+        post.refresh_from_db()
+        self.assertEqual(post.slug, 'другой-заголовок')
+        self.assertEqual(post.preview, content[:251])
+
+        post.content = 'коротко'
+        post.save(update_fields=['content'])
+        post.refresh_from_db()
+        self.assertEqual(post.preview, 'коротко')
+
+    def test_backfill_command_repairs_stale_fields(self):
+        post = Post.objects.create(title='Пост', content='текст', author=self.author)
+        Post.objects.filter(pk=post.pk).update(preview='', slug='')
+
+        call_command('backfill_post_fields', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual((post.preview, post.slug), ('текст', 'пост'))
+
+
+class CacheNamespaceTestCase(CleanCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = create_user('cacheauthor')
+
+    def test_invalidation_changes_only_own_namespace(self):
+        posts_key = versioned_key('total', POSTS_NAMESPACE)
+        room_key = versioned_key('recent', room_namespace(1))
+        self.assertEqual(versioned_key('total', POSTS_NAMESPACE), posts_key)
+
+        with mock.patch.object(cache, 'incr', wraps=cache.incr) as incr:
+            invalidate_posts_cache()
+        incr.assert_called_once()
+        self.assertNotEqual(versioned_key('total', POSTS_NAMESPACE), posts_key)
+        self.assertEqual(versioned_key('recent', room_namespace(1)), room_key)
+
+        invalidate_messages_cache(1)
+        self.assertNotEqual(versioned_key('recent', room_namespace(1)), room_key)
+
+    def test_lost_generation_does_not_revive_old_keys(self):
+        with mock.patch('blog.cache_utils.time.time_ns', return_value=10**12):
+            key = versioned_key('total', POSTS_NAMESPACE)
+        get_two_tier_cache().delete('ns:posts')  # Ключ поколения вытеснен из кеша
+        with mock.patch('blog.cache_utils.time.time_ns', return_value=2 * 10**12):
+            self.assertNotEqual(versioned_key('total', POSTS_NAMESPACE), key)
+
+    def test_post_save_invalidates_cached_list(self):
+        Post.objects.create(title='Первый', content='текст', author=self.author)
+        self.assertEqual([post.title for post in get_published_posts_optimized()], ['Первый'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(title='Второй', content='текст', author=self.author)
+        self.assertEqual(len(get_published_posts_optimized()), 2)
+
+    def test_only_edited_messages_invalidate_room_cache(self):
+        room = ChatRoom.objects.create(name='cache_room')
+        room_key = versioned_key('recent', room_namespace(room.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            message = Message.objects.create(room=room, user=self.author, content='привет')
+        self.assertEqual(versioned_key('recent', room_namespace(room.pk)), room_key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            message.content = 'исправлено'
+            message.save()
+        self.assertNotEqual(versioned_key('recent', room_namespace(room.pk)), room_key)
+
+
+class GetOrComputeTestCase(CleanCacheMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_value_is_computed_once_until_expiry(self):
+        self.assertEqual(get_or_compute('stampede', self.compute, 60), 1)
+        self.assertEqual(get_or_compute('stampede', self.compute, 60), 1)
+        self.assertEqual(self.calls, 1)
+
+        value, delta, expires_at = cache.get('stampede')
+        self.assertLessEqual(expires_at, time.time() + 60)
+        self.assertGreater(expires_at, time.time() + 60 * (1 - 0.1) - 1)
+
+    def test_expired_value_is_served_stale_while_other_process_recomputes(self):
+        cache.set('stampede', (1, 0.0, time.time() - 1), 60)
+        cache.add('stampede:lock', 'other', 10)
+        self.assertEqual(get_or_compute('stampede', self.compute, 60), 1)
+        self.assertEqual(self.calls, 0)
+
+        cache.delete('stampede:lock')
+        self.assertEqual(get_or_compute('stampede', self.compute, 60), 1)
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(cache.get('stampede:lock'))
+
+    @override_settings(CACHE_GET_OR_COMPUTE={'LOCK_WAIT': 1.0, 'POLL_INTERVAL': 0.01})
+    def test_miss_waits_for_lock_holder(self):
+        cache.add('stampede:lock', 'other', 10)
+        original_get = cache.get
+
+        def get_after_refresh(key, *args, **kwargs):
+            if key == 'stampede' and self.calls == 0 and poll.call_count > 2:
+                cache.set('stampede', ('computed elsewhere', 0.0, time.time() + 60), 60)
+            return original_get(key, *args, **kwargs)
+
+        with mock.patch.object(cache, 'get', side_effect=get_after_refresh) as poll:
+            self.assertEqual(get_or_compute('stampede', self.compute, 60), 'computed elsewhere')
+        self.assertEqual(self.calls, 0)
+
+    def test_zero_lock_wait_computes_on_miss_without_sleeping(self):
+        cache.add('stampede:lock', 'other', 10)
+        with mock.patch('blog.cache_utils.time.sleep') as sleep:
+            self.assertEqual(get_or_compute('stampede', self.compute, 60, lock_wait=0), 1)
+        sleep.assert_not_called()
+        self.assertEqual(cache.get('stampede:lock'), 'other')
+
+    def test_release_keeps_lock_taken_over_by_other_process(self):
+        cache.add('stampede:lock', 'other', 10)
+        release_lock('stampede:lock', 'mine')
+        self.assertEqual(cache.get('stampede:lock'), 'other')
+        release_lock('stampede:lock', 'other')
+        self.assertIsNone(cache.get('stampede:lock'))
+
+    def test_release_on_redis_is_one_compare_and_delete_script(self):
+        client = mock.Mock()
+        redis_cache = mock.Mock()
+        redis_cache.make_key.return_value = ':1:stampede:lock'
+        redis_cache.client.encode.return_value = b'encoded-token'
+        with mock.patch('django_redis.get_redis_connection', return_value=client), \
+                mock.patch('blog.cache_utils.cache', redis_cache):
+            release_lock('stampede:lock', 'token')
+        client.eval.assert_called_once_with(RELEASE_LOCK_SCRIPT, 1, ':1:stampede:lock', b'encoded-token')
+        redis_cache.get.assert_not_called()
+        redis_cache.delete.assert_not_called()
+
+    def test_early_refresh_probability_grows_near_expiry(self):
+        now = time.time()
+        refreshes = lambda expires_at: sum(
+            _should_refresh(1.0, expires_at, 1.0, now) for _ in range(1000)
+        )
+        self.assertLess(refreshes(now + 10), 5)
+        self.assertGreater(refreshes(now + 0.1), 800)
+
+
+class TwoTierCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.bus = LocalInvalidationBus()
+        self.worker_a = TwoTierCache(cache, self.bus, max_size=2, timeout=60, prefixes=['hot:'])
+        self.worker_b = TwoTierCache(cache, self.bus, max_size=2, timeout=60, prefixes=['hot:'])
+
+    def test_hot_reads_are_served_from_process_memory(self):
+        self.worker_a.set('hot:total', 10)
+        self.assertEqual(self.worker_b.get('hot:total'), 10)
+
+        with mock.patch.object(cache, 'get') as l2_get:
+            self.assertEqual(self.worker_a.get('hot:total'), 10)
+            self.assertEqual(self.worker_b.get('hot:total'), 10)
+        l2_get.assert_not_called()
+        self.assertEqual(self.worker_b.stats()['l1_hits'], 1)
+        self.assertEqual(self.worker_b.stats()['l2_hits'], 1)
+
+    def test_writes_evict_copies_in_other_workers(self):
+        self.worker_a.set('hot:total', 10)
+        self.worker_b.get('hot:total')
+
+        self.worker_a.set('hot:total', 11)
+        self.assertEqual(self.worker_b.get('hot:total'), 11)
+
+        self.worker_a.incr('hot:total')
+        self.assertEqual(self.worker_b.get('hot:total'), 12)
+
+        self.worker_b.delete('hot:total')
+        self.assertIsNone(self.worker_a.get('hot:total'))
+
+    def test_only_eligible_keys_use_l1(self):
+        self.worker_a.set('cold:total', 1)
+        self.worker_a.get('cold:total')
+        self.assertEqual(self.worker_a.stats()['size'], 0)
+
+        for key in ('hot:1', 'hot:2', 'hot:3'):
+            self.worker_a.set(key, key)
+        self.assertEqual(self.worker_a.stats()['size'], 2)
+
+    def test_l1_is_bypassed_without_bus_subscription(self):
+        with mock.patch.object(LocalInvalidationBus, 'connected', new_callable=mock.PropertyMock, return_value=False):
+            self.worker_a.set('hot:total', 10)
+            cache.set('hot:total', 11)
+            self.assertEqual(self.worker_a.get('hot:total'), 11)
+            self.assertEqual(self.worker_a.stats()['size'], 0)
+
+    def test_redis_bus_is_silent_on_cache_without_pub_sub(self):
+        tiered = TwoTierCache(cache, RedisInvalidationBus(), prefixes=['hot:'])
+        self.assertFalse(tiered.active)
+        with self.assertNoLogs('blog.two_tier_cache', level='WARNING'):
+            tiered.set('hot:total', 10)
+            tiered.delete('hot:total')
+
+
+@override_settings(CHAT_RECENT_MESSAGES={'BACKEND': 'blog.recent_messages.InMemoryRecentMessages'})
+class MessageWriteBufferTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user('bufferuser')
+        self.room = ChatRoom.objects.create(name='buffer_room')
+        get_recent_messages().clear(self.room.pk)
+        self.buffer = MessageWriteBuffer(flush_interval_ms=0, max_batch=2, max_pending=3)
+
+    def message(self, content):
+        return Message(room=self.room, user=self.user, content=content, is_moderated=True)
+
+    def test_flush_writes_batches_in_order(self):
+        get_room_messages_page(self.room)  # Буфер последних сообщений заполнен (пустой комнатой)
+        for i in range(3):
+            self.assertTrue(self.buffer.add(self.message(f'сообщение {i}')))
+        self.assertEqual(Message.objects.count(), 0)
+
+        # Буфер полон: дальше консьюмер ждет записи
+        self.assertFalse(self.buffer.add(self.message('лишнее')))
+
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(
+            list(Message.objects.order_by('pk').values_list('content', flat=True)),
+            ['сообщение 0', 'сообщение 1', 'сообщение 2'],
+        )
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(
+            [message.content for message in get_room_messages_page(self.room, per_page=2)],
+            ['сообщение 2', 'сообщение 1'],
+        )
+
+    def test_failed_batch_returns_to_buffer(self):
+        self.buffer.add(self.message('первое'))
+        self.buffer.add(self.message('второе'))
+        self.buffer.add(self.message('третье'))
+
+        original = Message.objects.bulk_create
+        calls = []
+
+        def fail_second_batch(objs, *args, **kwargs):
+            calls.append(len(objs))
+            if len(calls) == 2:
+                raise RuntimeError('db down')
+            return original(objs, *args, **kwargs)
+
+        with mock.patch.object(Message.objects, 'bulk_create', side_effect=fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertEqual(len(self.buffer), 1)
+        self.buffer.close()
+        self.assertEqual(Message.objects.count(), 3)
+
+
+class MessageWriteBufferRejectedRowTestCase(TransactionTestCase):
+    """Внешние ключи SQLite проверяются при фиксации - нужна настоящая транзакция"""
+
+    def setUp(self):
+        self.user = create_user('bufferuser')
+        self.room = ChatRoom.objects.create(name='buffer_room')
+        self.buffer = MessageWriteBuffer(flush_interval_ms=0, max_batch=2, max_pending=4)
+
+    def test_rejected_row_is_dropped_and_rest_is_written(self):
+        # Комнату удалили, пока сообщение ждало в буфере
+        self.buffer.add(Message(room_id=self.room.pk + 1000, user=self.user, content='потерянное'))
+        for i in range(3):
+            self.buffer.add(Message(room=self.room, user=self.user, content=f'сообщение {i}'))
+
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(
+            list(Message.objects.order_by('pk').values_list('content', flat=True)),
+            ['сообщение 0', 'сообщение 1', 'сообщение 2'],
+        )
+        self.assertEqual((len(self.buffer), self.buffer.dropped), (0, 1))
+        self.assertTrue(self.buffer.add(Message(room=self.room, user=self.user, content='дальше')))
+
+
+@override_settings(CHAT_RECENT_MESSAGES={'BACKEND': 'blog.recent_messages.InMemoryRecentMessages', 'SIZE': 5})
+class RecentMessagesTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user('recentuser')
+        self.room = ChatRoom.objects.create(name='recent_room')
+        # Буфер в памяти переживает откат транзакции между тестами
+        get_recent_messages().clear(self.room.pk)
+        self.messages = [
+            Message.objects.create(room=self.room, user=self.user, content=f'сообщение {i}') for i in range(7)
+        ]
+
+    def contents(self, page):
+        return [message.content for message in page]
+
+    def test_first_page_is_served_from_ring(self):
+        page = get_room_messages_page(self.room, per_page=2)
+        self.assertEqual(self.contents(page), ['сообщение 6', 'сообщение 5'])
+        self.assertTrue(page.has_next())
+
+        new = Message.objects.create(room=self.room, user=self.user, content='новое')
+        push_saved_messages([new])
+        with self.assertNumQueries(0):
+            page = get_room_messages_page(self.room, per_page=2)
+        self.assertEqual(self.contents(page), ['новое', 'сообщение 6'])
+        self.assertEqual(page.object_list[0].user.username, 'recentuser')
+
+    def test_older_pages_follow_cursor(self):
+        page = get_room_messages_page(self.room, per_page=2)
+        pages = [self.contents(page)]
+        while page.has_next():
+            with self.assertNumQueries(1):
+                page = get_room_messages_page(self.room, page.next_cursor, per_page=2)
+            pages.append(self.contents(page))
+        self.assertEqual(pages, [
+            ['сообщение 6', 'сообщение 5'], ['сообщение 4', 'сообщение 3'],
+            ['сообщение 2', 'сообщение 1'], ['сообщение 0'],
+        ])
+
+        second = get_room_messages_page(self.room, get_room_messages_page(self.room, per_page=2).next_cursor,
+                                        per_page=2)
+        newer = get_room_messages_page(self.room, second.previous_cursor, per_page=2)
+        self.assertEqual(self.contents(newer), ['сообщение 6', 'сообщение 5'])
+        self.assertFalse(newer.has_previous())
+
+    def test_push_between_db_read_and_fill_is_not_lost(self):
+        recent = get_recent_messages()
+        fill = recent.fill
+
+        def push_then_fill(room_id, messages, token):
+            # Сообщение сохранено после чтения из БД, но до записи буфера
+            late = Message.objects.create(room=self.room, user=self.user, content='между чтением и fill')
+            push_saved_messages([late])
+            return fill(room_id, messages, token)
+
+        with mock.patch.object(recent, 'fill', side_effect=push_then_fill):
+            self.assertEqual(self.contents(get_room_messages_page(self.room, per_page=2)),
+                             ['сообщение 6', 'сообщение 5'])
+
+        self.assertIsNone(recent.range(self.room.pk, 0, 2))
+        self.assertEqual(self.contents(get_room_messages_page(self.room, per_page=2)),
+                         ['между чтением и fill', 'сообщение 6'])
+
+    def test_edited_message_resets_ring(self):
+        get_room_messages_page(self.room, per_page=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.filter(pk=self.messages[6].pk).update(is_blocked=True)
+            self.messages[6].is_blocked = True
+            self.messages[6].save()
+
+        self.assertIsNone(get_recent_messages().range(self.room.pk, 0, 2))
+        self.assertEqual(self.contents(get_room_messages_page(self.room, per_page=2)),
+                         ['сообщение 5', 'сообщение 4'])
+
+
+class MessageSearchTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user('searchuser')
+        self.room = ChatRoom.objects.create(name='search_room')
+        self.other_room = ChatRoom.objects.create(name='search_other')
+        self.search = get_message_search()
+
+    def send(self, content, room=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Message.objects.create(room=room or self.room, user=self.user, content=content)
+
+    def contents(self, page):
+        return [message.content for message in page]
+
+    def test_stemmer(self):
+        self.assertEqual(stem('сообщения'), stem('сообщение'))
+        self.assertEqual(stem('Говорили'), 'говор')
+        self.assertEqual(stem('hello'), 'hello')
+
+    def test_saved_messages_are_found_by_word_forms(self):
+        self.send('Пришло новое сообщение')
+        self.send('про котов', room=self.other_room)
+        self.send('совсем другое')
+
+        self.assertIsInstance(self.search, SQLiteMessageSearch)
+        self.assertEqual(self.contents(self.search.search(self.room, 'сообщения')), ['Пришло новое сообщение'])
+        self.assertEqual(self.contents(self.search.search(self.room, 'котов')), [])
+        self.assertEqual(self.contents(self.search.search(self.room, 'searchuser')),
+                         ['совсем другое', 'Пришло новое сообщение'])
+
+    def test_results_are_ranked_and_paginated(self):
+        self.send('кот кот кот')
+        for i in range(3):
+            self.send(f'кот и еще много слов про погоду и новости номер {i}')
+
+        page = self.search.search(self.room, 'кот', per_page=2)
+        self.assertEqual(self.contents(page)[0], 'кот кот кот')
+        seen = self.contents(page)
+        while page.has_next():
+            page = self.search.search(self.room, 'кот', page.next_cursor, per_page=2)
+            seen.extend(self.contents(page))
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(set(seen)), 4)
+
+        with self.assertRaises(CursorError):
+            self.search.search(self.room, 'кот', 'garbage')
+
+    def test_blocked_and_deleted_messages_leave_index(self):
+        blocked = self.send('спорное сообщение')
+        deleted = self.send('удаленное сообщение')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            blocked.is_blocked = True
+            blocked.save()
+            deleted.delete()
+
+        self.assertEqual(self.contents(self.search.search(self.room, 'сообщение')), [])
+
+    def test_rebuild_indexes_existing_history(self):
+        Message.objects.bulk_create([
+            Message(room=self.room, user=self.user, content=f'старое сообщение {i}') for i in range(3)
+        ])
+        self.assertEqual(self.contents(self.search.search(self.room, 'старое')), [])
+
+        self.assertEqual(rebuild_message_search(clear=True, batch_size=2), 3)
+        self.assertEqual(len(self.search.search(self.room, 'старые')), 3)
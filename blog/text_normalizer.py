@@ -0,0 +1,90 @@
+"""
+Нормализация текста сообщений для поиска по словарю модерации
+
+Все замены символов выполняются готовыми таблицами str.maketrans, которые
+строятся один раз из файла data/confusables.txt:
+- NFKC сворачивает полноширинные и стилизованные формы букв;
+- невидимые символы (zero-width и т.п.) и маски ("*") удаляются;
+- похожие символы других алфавитов и "@" заменяются кириллицей;
+- латиница и цифры заменяются кириллицей только в словах, где уже есть
+  кириллица ("xyй", "д3бил"), поэтому английский текст и числа ("1488")
+  не искажаются;
+- повторы символов сжимаются до двух за один проход регулярного выражения.
+"""
+import re
+import unicodedata
+from pathlib import Path
+
+CONFUSABLES_PATH = Path(__file__).resolve().parent / 'data' / 'confusables.txt'
+
+REPEATED_CHARS_RE = re.compile(r'(.)\1\1+')
+SPACES_BETWEEN_LETTERS_RE = re.compile(r'(?<=[а-яёa-z])\s+(?=[а-яёa-z])')
+HAS_LATIN_OR_DIGIT_RE = re.compile(r'[a-z0-9]')
+MIXED_PAIR_RE = re.compile(r'[а-яё][a-z0-9]|[a-z0-9][а-яё]')
+# Слово, в котором есть и кириллица, и латиница/цифры
+MIXED_WORD_RE = re.compile(r'\b(?=\w*[а-яё])(?=\w*[a-z0-9])\w+')
+
+
+def _parse_char(token):
+    if token.upper().startswith('U+'):
+        return chr(int(token[2:], 16))
+    return token
+
+
+def load_confusables(path=CONFUSABLES_PATH):
+    """Читает таблицу похожих символов: {секция: {символ: замена}}"""
+    sections = {'delete': {}, 'always': {}, 'mixed': {}}
+    current = None
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            # Комментарий начинается с "#" в начале строки или после пробела
+            line = re.split(r'(?:^|\s)#', line, maxsplit=1)[0].strip()
+            if not line:
+                continue
+            if line.startswith('[') and line.endswith(']'):
+                current = sections[line[1:-1]]
+                continue
+
+            parts = line.split()
+            source = _parse_char(parts[0])
+            current[source] = _parse_char(parts[1]) if len(parts) > 1 else ''
+
+    return sections
+
+
+class TextNormalizer:
+    """Нормализатор на заранее скомпилированных таблицах перевода"""
+
+    def __init__(self, confusables):
+        base = dict.fromkeys(confusables['delete'], '')
+        base.update(confusables['always'])
+        self.base_table = str.maketrans(base)
+        self.mixed_table = str.maketrans(confusables['mixed'])
+
+        # Быстрая проверка: есть ли в тексте хоть один символ для замены
+        self._needs_base_re = re.compile('[' + re.escape(''.join(base)) + ']')
+
+    def _translate_mixed_word(self, match):
+        return match.group().translate(self.mixed_table)
+
+    def normalize(self, text):
+        if not text.isascii() and not unicodedata.is_normalized('NFKC', text):
+            text = unicodedata.normalize('NFKC', text)
+        text = text.lower()
+
+        if self._needs_base_re.search(text):
+            text = text.translate(self.base_table)
+
+        # Латиница и цифры внутри кириллических слов (сначала дешевые проверки)
+        if HAS_LATIN_OR_DIGIT_RE.search(text) and MIXED_PAIR_RE.search(text):
+            text = MIXED_WORD_RE.sub(self._translate_mixed_word, text)
+
+        # Повторяющиеся символы (оставляем макс 2)
+        text = REPEATED_CHARS_RE.sub(r'\1\1', text)
+
+        # Пробелы между буквами: "х у й" -> "хуй"
+        return SPACES_BETWEEN_LETTERS_RE.sub('', text)
+
+
+TEXT_NORMALIZER = TextNormalizer(load_confusables())
@@ -0,0 +1,346 @@
+"""
+Двухуровневый кеш: LRU в памяти процесса перед Redis
+
+Горячие ключи (поколения пространств имен, счетчик постов, комнаты чата)
+читаются на каждом запросе, и каждое чтение из django-redis - это сетевой
+запрос, распаковка zlib и unpickle. Первый уровень (L1) - ограниченный LRU
+со сроком жизни в памяти процесса; второй (L2) - кеш Django (алиас
+TWO_TIER_CACHE['ALIAS']).
+
+В L1 попадают только ключи с префиксами из TWO_TIER_CACHE['PREFIXES'].
+Значения из L1 общие для всех потоков процесса и не должны изменяться
+вызывающим кодом. Запись, удаление и INCR такого ключа рассылаются через шину
+сброса, и остальные процессы (воркеры Daphne, celery) удаляют свою копию:
+- blog.two_tier_cache.RedisInvalidationBus - Redis pub/sub, слушатель в
+  фоновом потоке;
+- blog.two_tier_cache.LocalInvalidationBus - внутри процесса (тесты).
+
+L1 работает, только пока процесс подписан на шину: после потери подписки
+(и при переподключении - сообщения могли потеряться) L1 очищается, а чтения
+идут напрямую в L2. Если соединение оборвалось незаметно или чтение из L2
+разминулось с записью в другом процессе, устаревшая копия живет не дольше
+TWO_TIER_CACHE['TIMEOUT'] секунд.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TWO_TIER_CACHE_SETTINGS = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'BUS': 'blog.two_tier_cache.RedisInvalidationBus',
+    'CHANNEL': 'cache:l1:invalidate',
+    'MAX_SIZE': 5000,      # Ключей в памяти процесса
+    'TIMEOUT': 5,          # Секунд жизни копии в L1
+    'PREFIXES': ['ns:', 'total_published_posts', 'chat_room_'],
+    'RETRY_INTERVAL': 5,   # Пауза перед переподключением к pub/sub, с
+}
+
+
+class BaseInvalidationBus:
+    """Рассылка сброса ключей L1 между процессами"""
+
+    def __init__(self):
+        self._subscribers = []
+
+    @classmethod
+    def from_settings(cls, options):
+        return cls()
+
+    @property
+    def connected(self):
+        """True, если процесс получает сообщения шины (иначе L1 нельзя доверять)"""
+        return True
+
+    def subscribe(self, callback):
+        """callback(key) удаляет ключ из L1; callback(None) очищает L1 целиком"""
+        self._subscribers.append(callback)
+
+    def deliver(self, key, sender=None):
+        for callback in self._subscribers:
+            if callback != sender:  # Связанные методы равны, но не идентичны
+                callback(key)
+
+    def publish(self, key, sender=None):
+        raise NotImplementedError
+
+
+class LocalInvalidationBus(BaseInvalidationBus):
+    """Доставка подписчикам того же процесса (тесты, один процесс)"""
+
+    def publish(self, key, sender=None):
+        self.deliver(key, sender)
+
+
+class RedisInvalidationBus(BaseInvalidationBus):
+    """Канал Redis pub/sub; сообщение - [id процесса, ключ], свои сообщения пропускаются"""
+
+    def __init__(self, alias='default', channel='cache:l1:invalidate', retry_interval=5):
+        super().__init__()
+        self.alias = alias
+        self.channel = caches[alias].make_key(channel)
+        self.retry_interval = retry_interval
+        self.origin = uuid.uuid4().hex
+        self._connected = False
+        self._supported = True
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, options):
+        return cls(alias=options['ALIAS'], channel=options['CHANNEL'], retry_interval=options['RETRY_INTERVAL'])
+
+    @property
+    def client(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection(self.alias)
+
+    @property
+    def connected(self):
+        return self._connected
+
+    def subscribe(self, callback):
+        super().subscribe(callback)
+        self.start()
+
+    def start(self):
+        with self._start_lock:
+            if self._listener is not None:
+                return
+            try:
+                self.client
+            except NotImplementedError:
+                # Алиас не django-redis (locmem в тестах) - L1 остается выключенным,
+                # и рассылать сбросы некому
+                logger.info(f"Кеш '{self.alias}' не поддерживает pub/sub, L1 выключен")
+                self._supported = False
+                return
+            self._listener = threading.Thread(target=self._listen, name='l1-cache-invalidation', daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Пока подписки не было, сообщения терялись - начинаем с пустого L1
+                self.deliver(None)
+                self._connected = True
+                for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    origin, key = json.loads(message['data'])
+                    if origin != self.origin:
+                        self.deliver(key)
+            except Exception as e:
+                logger.warning(f"Подписка на сброс L1 потеряна, повтор через {self.retry_interval} с: {e}")
+            finally:
+                self._connected = False
+                self.deliver(None)
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            time.sleep(self.retry_interval)
+
+    def publish(self, key, sender=None):
+        if not self._supported:
+            return
+        try:
+            self.client.publish(self.channel, json.dumps([self.origin, key]))
+        except Exception as e:
+            logger.warning(f"Не удалось разослать сброс ключа L1 {key}: {e}")
+
+
+class TwoTierCache:
+    """
+    Кеш с интерфейсом get / get_many / set / add / delete / incr кеша Django.
+    Ключи без префиксов из prefixes идут напрямую в L2
+    """
+
+    def __init__(self, cache, bus=None, max_size=5000, timeout=5, prefixes=()):
+        self.cache = cache
+        self.bus = bus
+        self.max_size = max_size
+        self.timeout = timeout
+        self.prefixes = tuple(prefixes)
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+
+        if bus is not None:
+            bus.subscribe(self._on_invalidate)
+
+    @classmethod
+    def from_settings(cls, options):
+        bus = import_string(options['BUS']).from_settings(options) if options['ENABLED'] and options['BUS'] else None
+        return cls(
+            caches[options['ALIAS']],
+            bus=bus,
+            max_size=options['MAX_SIZE'],
+            timeout=options['TIMEOUT'],
+            prefixes=options['PREFIXES'],
+        )
+
+    @property
+    def active(self):
+        return self.bus is not None and self.bus.connected
+
+    def eligible(self, key):
+        return key.startswith(self.prefixes)
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set_local(self, key, value, timeout=None):
+        ttl = self.timeout if timeout is None else min(self.timeout, timeout)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _evict(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _on_invalidate(self, key):
+        if key is None:
+            self.clear()
+        else:
+            self._evict(key)
+
+    def _changed(self, key):
+        """Ключ изменен в L2: удаляем свою копию и рассылаем сброс остальным процессам"""
+        self._evict(key)
+        if self.bus is not None:
+            self.bus.publish(key, sender=self._on_invalidate)
+
+    def get(self, key, default=None):
+        local = self.active and self.eligible(key)
+        if local:
+            value = self._get_local(key)
+            if value is not None:
+                self.l1_hits += 1
+                return value
+
+        value = self.cache.get(key)
+        if value is None:
+            self.misses += 1
+            return default
+        self.l2_hits += 1
+        if local:
+            self._set_local(key, value)
+        return value
+
+    def get_many(self, keys):
+        found = {}
+        remote = []
+        active = self.active
+        for key in keys:
+            value = self._get_local(key) if active and self.eligible(key) else None
+            if value is not None:
+                found[key] = value
+            else:
+                remote.append(key)
+        self.l1_hits += len(found)
+
+        if remote:
+            fetched = self.cache.get_many(remote)
+            self.l2_hits += len(fetched)
+            self.misses += len(remote) - len(fetched)
+            for key, value in fetched.items():
+                if active and self.eligible(key):
+                    self._set_local(key, value)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=None):
+        self.cache.set(key, value, timeout)
+        if self.eligible(key):
+            self._changed(key)
+            if self.active:
+                self._set_local(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        added = self.cache.add(key, value, timeout)
+        if added and self.eligible(key):
+            # Ключ мог истечь в L2 раньше, чем копии в L1 других процессов
+            self._changed(key)
+        return added
+
+    def delete(self, key):
+        self.cache.delete(key)
+        if self.eligible(key):
+            self._changed(key)
+
+    def incr(self, key, delta=1):
+        value = self.cache.incr(key, delta)
+        if self.eligible(key):
+            self._changed(key)
+        return value
+
+    def clear(self):
+        """Очищает только L1"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.l1_hits + self.l2_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'active': self.active,
+            'l1_hits': self.l1_hits,
+            'l2_hits': self.l2_hits,
+            'misses': self.misses,
+            'l1_hit_ratio': self.l1_hits / lookups if lookups else 0.0,
+            'l2_hit_ratio': self.l2_hits / lookups if lookups else 0.0,
+        }
+
+
+_two_tier_cache = None
+_two_tier_cache_lock = threading.Lock()
+
+
+def get_two_tier_cache():
+    """Возвращает кеш из настройки TWO_TIER_CACHE (один на процесс)"""
+    global _two_tier_cache
+    with _two_tier_cache_lock:
+        if _two_tier_cache is None:
+            options = dict(DEFAULT_TWO_TIER_CACHE_SETTINGS, **getattr(settings, 'TWO_TIER_CACHE', {}))
+            _two_tier_cache = TwoTierCache.from_settings(options)
+        return _two_tier_cache
+
+
+@receiver(setting_changed)
+def reset_two_tier_cache(setting, **kwargs):
+    """Пересоздает кеш при override_settings в тестах"""
+    global _two_tier_cache
+    if setting in ('TWO_TIER_CACHE', 'CACHES'):
+        with _two_tier_cache_lock:
+            _two_tier_cache = None
@@ -5,6 +5,7 @@ from django.views.generic import RedirectView
 # ✅ Импортируем все view напрямую - БЕЗ from . import views!
 from .views import (
     HomeView,
+    post_suggest,
     LoginView,
     RegisterView,
     logout_view,
@@ -15,6 +16,7 @@ from .views import (
     PostDetailView,
     ToggleReactionView,
     chat_room,
+    chat_messages,
 )
 
 app_name = 'blog'
@@ -23,6 +25,7 @@ urlpatterns = [
     # Главная и посты
     path('posts/', HomeView.as_view(), name='post_list'),
     path('', HomeView.as_view(), name='home'),
+    path('posts/suggest/', post_suggest, name='post_suggest'),
 
     # Редирект профиля
     path('accounts/profile/', RedirectView.as_view(url='/', permanent=False)),
@@ -66,4 +69,5 @@ urlpatterns = [
 
     # Чат
     path('chat/<str:room_name>/', chat_room, name='chat_room'),
+    path('chat/<str:room_name>/messages/', chat_messages, name='chat_messages'),
 ]
@@ -0,0 +1,154 @@
+"""
+Кеш вердиктов проверки текста сообщений
+
+Волны спама повторяют один и тот же текст, и каждая копия проходила все
+проверки заново. Вердикт check_message_content() зависит только от текста,
+правил комнаты (ModerationPolicy.version), версии словаря и уровня модерации,
+поэтому его можно запомнить:
+- первый уровень - ограниченный LRU в памяти процесса;
+- второй уровень (необязательный) - общий кеш Redis для всех процессов.
+
+Проверки бана и частоты сообщений зависят от пользователя и времени
+и никогда не кешируются.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .lexicon_store import get_lexicon_version
+from .moderation_metrics import NULL_TIMER
+
+DEFAULT_VERDICT_CACHE_SETTINGS = {
+    'MAX_SIZE': 10000,       # Вердиктов в памяти процесса
+    'SHARED_TIMEOUT': 300,   # Секунд в Redis; 0 - без общего уровня
+}
+
+
+class VerdictCache:
+    """LRU вердиктов (is_blocked, reason) с необязательным общим уровнем в кеше Django"""
+
+    def __init__(self, max_size=10000, shared_timeout=300):
+        self.max_size = max_size
+        self.shared_timeout = shared_timeout
+
+        self._verdicts = OrderedDict()
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls):
+        config = dict(DEFAULT_VERDICT_CACHE_SETTINGS, **getattr(settings, 'MODERATION_VERDICT_CACHE', {}))
+        return cls(max_size=config['MAX_SIZE'], shared_timeout=config['SHARED_TIMEOUT'])
+
+    @property
+    def shared(self):
+        return bool(self.shared_timeout)
+
+    def make_key(self, content, policy, moderation_level='moderate'):
+        """
+        Ключ - хеш точного текста: проверки заглавных букв, ссылок и букв через
+        пробел зависят от регистра и пробелов, которые normalize_text() убирает.
+        Новая версия словаря делает старые вердикты недоступными
+        """
+        digest = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        return f'{get_lexicon_version()}:{policy.version}:{moderation_level}:{digest}'
+
+    def get_local(self, key):
+        with self._lock:
+            verdict = self._verdicts.get(key)
+            if verdict is not None:
+                self._verdicts.move_to_end(key)
+                self.local_hits += 1
+            return verdict
+
+    def set_local(self, key, verdict):
+        with self._lock:
+            self._verdicts[key] = verdict
+            self._verdicts.move_to_end(key)
+            while len(self._verdicts) > self.max_size:
+                self._verdicts.popitem(last=False)
+
+    def get_shared(self, key):
+        """Ищет вердикт в общем кеше; найденный копируется в память процесса"""
+        verdict = cache.get(f'verdict:{key}') if self.shared else None
+        if verdict is not None:
+            verdict = tuple(verdict)
+            self.shared_hits += 1
+            self.set_local(key, verdict)
+        return verdict
+
+    def set_shared(self, key, verdict):
+        if self.shared:
+            cache.set(f'verdict:{key}', verdict, self.shared_timeout)
+
+    def record_miss(self):
+        self.misses += 1
+
+    def get(self, key):
+        verdict = self.get_local(key)
+        if verdict is None:
+            verdict = self.get_shared(key)
+        if verdict is None:
+            self.record_miss()
+        return verdict
+
+    def set(self, key, verdict):
+        self.set_local(key, verdict)
+        self.set_shared(key, verdict)
+
+    def clear(self):
+        with self._lock:
+            self._verdicts.clear()
+
+    def stats(self):
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            'size': len(self._verdicts),
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.local_hits + self.shared_hits) / lookups if lookups else 0.0,
+        }
+
+
+_verdict_cache = None
+_verdict_cache_lock = threading.Lock()
+
+
+def get_verdict_cache():
+    global _verdict_cache
+    with _verdict_cache_lock:
+        if _verdict_cache is None:
+            _verdict_cache = VerdictCache.from_settings()
+        return _verdict_cache
+
+
+@receiver(setting_changed)
+def reset_verdict_cache(setting, **kwargs):
+    """Пересоздает кеш при override_settings (тесты, бенчмарк)"""
+    global _verdict_cache
+    if setting == 'MODERATION_VERDICT_CACHE':
+        with _verdict_cache_lock:
+            _verdict_cache = None
+
+
+def check_message_content_cached(content, policy, moderation_level='moderate', timer=NULL_TIMER):
+    """check_message_content() с кешированием вердикта"""
+    from .moderation_utils import check_message_content
+
+    verdict_cache = get_verdict_cache()
+    key = verdict_cache.make_key(content, policy, moderation_level)
+
+    verdict = verdict_cache.get(key)
+    if verdict is None:
+        verdict = check_message_content(content, policy, moderation_level, timer)
+        verdict_cache.set(key, verdict)
+
+    return verdict
@@ -3,22 +3,27 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
 from django.contrib import messages
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Q, Count, Prefetch
+from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.db.models import Prefetch
 from django.http import Http404, HttpResponseRedirect
 from django.contrib.auth.views import LoginView as DjangoLoginView, LogoutView
 from django.contrib.auth import login
-from django.core.cache import cache
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
+from django.utils import timezone
 
-from .models import Post, PostReaction, ChatRoom, Message
+from .models import Post, ChatRoom
 from .forms import CustomUserCreationForm, CustomAuthenticationForm, CustomPasswordResetForm
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, FormView
 from django.urls import reverse_lazy, reverse
 from django.views import View
 from django.http import JsonResponse
-from .performance_utils import get_recent_messages_optimized, invalidate_posts_cache
+from .cache_utils import POSTS_NAMESPACE, get_or_compute, versioned_key
+from .performance_utils import get_recent_messages_optimized
+from .pagination import CursorError, paginate_by_cursor
+from .post_search import get_post_search
+from .reaction_buffer import ReactionBufferUnavailable, get_post_reaction_state, post_exists, toggle_post_reaction
+from .recent_messages import get_room_messages_page
 # from django.contrib.auth.views import PasswordResetView
 
 
@@ -39,34 +44,14 @@ def chat_room(request, room_name):
     room, created = ChatRoom.objects.get_or_create(name=room_name)
 
     search_query = request.GET.get('q')
-    cache_key = f'chat_messages_{room_name}'
-
-    # ✅ КЕШИРОВАНИЕ: используем кеш только без поиска
-    if not search_query:
-        messages_qs = cache.get(cache_key)
-        if messages_qs is None:
-            # Кеша нет - запрашиваем БД с оптимизацией
-            messages_qs = Message.objects.filter(
-                room=room,
-                is_blocked=False
-            ).select_related('user').order_by('-created_at')
-            # Сохраняем в кеш на 5 минут
-            cache.set(cache_key, list(messages_qs), 300)
-        messages_qs = list(messages_qs)
-    else:
-        # Поиск - всегда из БД
-        messages_qs = Message.objects.filter(
-            room=room,
-            is_blocked=False
-        ).select_related('user').filter(
-            Q(content__icontains=search_query) |
-            Q(user__username__icontains=search_query)
-        ).order_by('-created_at')
-
-    # Пагинация: 50 сообщений на страницу
-    paginator = Paginator(messages_qs, 50)
-    page_number = request.GET.get('page')
-    messages = paginator.get_page(page_number)
+
+    # ✅ ОПТИМИЗАЦИЯ: первая страница - из буфера последних сообщений комнаты,
+    # более старые - из БД по курсору (keyset), без OFFSET и COUNT(*);
+    # поиск - по полнотекстовому индексу (blog.message_search)
+    try:
+        messages = get_room_messages_page(room, request.GET.get('before'), per_page=50, search_query=search_query)
+    except CursorError:
+        messages = get_room_messages_page(room, per_page=50, search_query=search_query)
 
     # Отображаемое имя комнаты
     display_name = 'Светлый чат' if room_name == 'general' else room_name
@@ -79,44 +64,106 @@ def chat_room(request, room_name):
     })
 
 
+@login_required
+def chat_messages(request, room_name):
+    """
+    JSON: более старые сообщения комнаты для кнопки "Загрузить ранее".
+    Параметры: before - курсор next из предыдущего ответа, q - поиск
+    """
+    room = get_object_or_404(ChatRoom, name=room_name)
+    try:
+        page = get_room_messages_page(room, request.GET.get('before'), per_page=50,
+                                      search_query=request.GET.get('q'))
+    except CursorError:
+        return JsonResponse({'error': 'Некорректный курсор'}, status=400)
+
+    return JsonResponse({
+        'messages': [
+            {
+                'id': message.id,
+                'username': message.user.username,
+                'content': message.content,
+                'time': timezone.localtime(message.created_at).strftime('%H:%M'),
+            }
+            for message in page.object_list
+        ],
+        'next': page.next_cursor,
+    })
+
+
 class HomeView(ListView):
     """Главная страница с постами, оптимизацией и кешированием"""
     model = Post
     template_name = 'home.html'
     context_object_name = 'posts'
-    paginate_by = 5
+    per_page = 5  # Курсорная пагинация вместо paginate_by (OFFSET + COUNT)
+    # Поля карточки поста (includes/post_cards.html)
+    card_fields = (
+        'title', 'preview', 'slug', 'image', 'created_at', 'is_published',
+        'like_count', 'dislike_count', 'author__email',
+    )
 
     def get_queryset(self):
         """✅ ОПТИМИЗАЦИЯ: select_related для author (1 запрос вместо N+1)"""
-        queryset = Post.objects.filter(
+        # Поиск (?q=) идет по полнотекстовому индексу, см. get_context_data
+        # ✅ ОПТИМИЗАЦИЯ: only() - карточкам не нужен content, превью хранится в посте
+        return Post.objects.filter(
             is_published=True
-        ).select_related('author').order_by('-created_at')
+        ).select_related('author').only(*self.card_fields).order_by('-created_at', '-id')
 
-        # Добавляем поиск
-        search_query = self.request.GET.get('q')
-        if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) |
-                Q(content__icontains=search_query)
-            )
-
-        return queryset
+    def get_template_names(self):
+        """Бесконечная прокрутка получает только карточки следующей страницы"""
+        if self.request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return ['includes/post_cards.html']
+        return super().get_template_names()
 
     def get_context_data(self, **kwargs):
         """✅ КЕШИРОВАНИЕ: кешируем общее количество постов"""
-        context = super().get_context_data(**kwargs)
-
-        # ✅ Кешируем общее количество постов на 10 минут
-        total_posts = cache.get('total_published_posts')
-        if total_posts is None:
-            total_posts = Post.objects.filter(is_published=True).count()
-            cache.set('total_published_posts', total_posts, 600)
+        # ✅ ОПТИМИЗАЦИЯ: страница по курсору (keyset) - глубокие страницы так же быстры, как первая;
+        # поиск - по полнотекстовому индексу с ранжированием (blog.post_search)
+        search_query = self.request.GET.get('q')
+        if search_query:
+            search = get_post_search()
+            try:
+                page = search.search(search_query, self.request.GET.get('cursor'), self.per_page)
+            except CursorError:
+                page = search.search(search_query, None, self.per_page)
+        else:
+            try:
+                page = paginate_by_cursor(self.object_list, self.request.GET.get('cursor'), self.per_page)
+            except CursorError:
+                page = paginate_by_cursor(self.object_list, None, self.per_page)
+
+        context = super().get_context_data(object_list=page.object_list, **kwargs)
+        context['page_obj'] = page
+        context['is_paginated'] = page.has_other_pages()
+
+        # ✅ Кешируем общее количество постов на 10 минут; ключ устаревает при сбросе
+        # пространства постов (сигналы Post -> invalidate_posts_cache); при истечении
+        # ключа COUNT(*) выполняет один запрос, остальные получают прежнее значение
+        total_posts = get_or_compute(
+            versioned_key('total_published_posts', POSTS_NAMESPACE),
+            Post.objects.filter(is_published=True).count,
+            600,
+        )
 
         context['total_posts'] = total_posts
         context['search_query'] = self.request.GET.get('q', '')
         return context
 
 
+def post_suggest(request):
+    """JSON: подсказки заголовков постов для автодополнения поиска (?q=начало слова)"""
+    query = request.GET.get('q', '').strip()
+    suggestions = get_post_search().suggest(query) if query else []
+    return JsonResponse({
+        'results': [
+            {'id': pk, 'title': title, 'url': reverse('blog:post_detail', kwargs={'pk': pk})}
+            for pk, title in suggestions
+        ],
+    })
+
+
 class LoginView(DjangoLoginView):
     """Представление для входа в системе"""
     form_class = CustomAuthenticationForm
@@ -197,7 +244,7 @@ class PostCreateView(CreateView):
         return super().dispatch(request, *args, **kwargs)
 
     def form_valid(self, form):
-        """Установка автора поста и сброс кеша"""
+        """Установка автора поста (кеш постов сбрасывает сигнал post_save)"""
         form.instance.author = self.request.user
         response = super().form_valid(form)
 
@@ -205,9 +252,6 @@ class PostCreateView(CreateView):
         if self.object.image:
             optimize_post_image.delay(self.object.id)
 
-        # ✅ Сбрасываем кеш после создания поста
-        cache.delete('total_published_posts')
-
         messages.success(self.request, 'Пост успешно создан. Изображение оптимизируется...')
         return response
 
@@ -227,7 +271,7 @@ class PostUpdateView(UpdateView):
         return super().dispatch(request, *args, **kwargs)
 
     def form_valid(self, form):
-        """Обработка успешного сохранения и сброс кеша"""
+        """Обработка успешного сохранения (кеш поста сбрасывает сигнал post_save)"""
         # Сохраняем старое изображение
         old_image = None
         if self.object.pk:
@@ -240,10 +284,6 @@ class PostUpdateView(UpdateView):
         if self.object.image and self.object.image != old_image:
             optimize_post_image.delay(self.object.id)
 
-        # ✅ Сбрасываем кеш поста
-        cache.delete(f'post_{self.object.pk}')
-        cache.delete(f'post_reactions_{self.object.pk}')
-
         messages.success(self.request, 'Пост успешно обновлен.')
         return response
 
@@ -262,9 +302,8 @@ class PostDeleteView(DeleteView):
         return super().dispatch(request, *args, **kwargs)
 
     def delete(self, request, *args, **kwargs):
-        """Обработка успешного удаления и сброс кеша"""
+        """Обработка успешного удаления (кеш поста сбрасывает сигнал post_delete)"""
         post = self.get_object()
-        post_id = post.pk
 
         # Сохраняем путь к изображению до удаления
         image_path = post.image.path if post.image else None
@@ -275,11 +314,6 @@ class PostDeleteView(DeleteView):
         if image_path:
             delete_post_files.delay(image_path)
 
-        # ✅ Сбрасываем кеш
-        cache.delete('total_published_posts')
-        cache.delete(f'post_{post_id}')
-        cache.delete(f'post_reactions_{post_id}')
-
         messages.success(request, 'Пост успешно удален.')
         return response
 
@@ -305,49 +339,15 @@ class PostDetailView(DetailView):
         return Post.objects.select_related('author')
 
     def get_context_data(self, **kwargs):
-        """✅ ОПТИМИЗАЦИЯ + КЕШИРОВАНИЕ: кешируем реакции"""
+        """✅ ОПТИМИЗАЦИЯ: счетчики реакций хранятся в посте (blog.reactions)"""
         context = super().get_context_data(**kwargs)
-        post = self.get_object()
-
-        # ✅ Кешируем статистику реакций на 5 минут
-        cache_key = f'post_reactions_{post.pk}'
-        reaction_data = cache.get(cache_key)
-
-        if reaction_data is None:
-            # Один агрегированный запрос для подсчета реакций
-            reaction_stats = PostReaction.objects.filter(
-                post=post
-            ).values('reaction_type').annotate(count=Count('reaction_type'))
+        post = self.object
 
-            reaction_counts = {
-                item['reaction_type']: item['count']
-                for item in reaction_stats
-            }
-
-            reaction_data = {
-                'like_count': reaction_counts.get('like', 0),
-                'dislike_count': reaction_counts.get('dislike', 0)
-            }
-
-            # Сохраняем в кеш
-            cache.set(cache_key, reaction_data, 300)
-
-        context['like_count'] = reaction_data['like_count']
-        context['dislike_count'] = reaction_data['dislike_count']
-
-        # ✅ Проверяем реакцию пользователя (оптимизированный запрос)
-        if self.request.user.is_authenticated:
-            user_reaction = PostReaction.objects.filter(
-                post=post,
-                user=self.request.user
-            ).values('reaction_type').first()
-
-            context['user_reaction'] = (
-                user_reaction['reaction_type']
-                if user_reaction else None
-            )
-        else:
-            context['user_reaction'] = None
+        # ✅ Реакция пользователя и счетчики с учетом еще не записанных из буфера кликов
+        user_reaction, counts = get_post_reaction_state(post, self.request.user)
+        context['like_count'] = counts['like_count']
+        context['dislike_count'] = counts['dislike_count']
+        context['user_reaction'] = user_reaction
 
         return context
 
@@ -358,7 +358,9 @@ class ToggleReactionView(View):
 
     def post(self, request, pk):
         """Обработка POST запроса для переключения реакции"""
-        post = get_object_or_404(Post, pk=pk)
+        # ✅ В режиме буфера наличие поста проверяется по кешу, а не запросом к БД на каждый клик
+        if not post_exists(pk):
+            raise Http404('Пост не найден')
 
         if not request.user.is_authenticated:
             # ✅ AJAX запрос - возвращаем JSON
@@ -385,50 +387,28 @@ class ToggleReactionView(View):
             messages.error(request, 'Недопустимый тип реакции.')
             return redirect('blog:post_detail', pk=pk)
 
-        # ✅ ОПТИМИЗАЦИЯ: get_or_create без дополнительных запросов
-        reaction, created = PostReaction.objects.get_or_create(
-            user=request.user,
-            post=post,
-            defaults={'reaction_type': reaction_type}
-        )
-
-        user_reaction = None
-
-        if not created:
-            if reaction.reaction_type == reaction_type:
-                # Отмена реакции
-                reaction.delete()
-                message = 'Реакция удалена'
-            else:
-                # Изменение реакции
-                reaction.reaction_type = reaction_type
-                reaction.save()
-                user_reaction = reaction_type
-                message = 'Реакция изменена'
-        else:
-            user_reaction = reaction_type
-            message = 'Реакция добавлена'
+        # ✅ ОПТИМИЗАЦИЯ: реакция и счетчики поста меняются в одной транзакции (F()),
+        # а в режиме буфера (POST_REACTION_BUFFER) - одним скриптом в Redis без обращения к БД
+        try:
+            user_reaction, message, counts = toggle_post_reaction(request.user, pk, reaction_type)
+        except ReactionBufferUnavailable:
+            # ✅ Буфер реакций (Redis) недоступен - клик не записан, просим повторить
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Реакции временно недоступны, попробуйте позже'
+                }, status=503)
 
-        # ✅ Сбрасываем кеш реакций
-        cache.delete(f'post_reactions_{pk}')
+            messages.error(request, 'Реакции временно недоступны, попробуйте позже.')
+            return redirect('blog:post_detail', pk=pk)
 
         # ✅ AJAX запрос - возвращаем JSON с обновленными данными
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            # Получаем актуальные счетчики
-            reaction_stats = PostReaction.objects.filter(
-                post=post
-            ).values('reaction_type').annotate(count=Count('reaction_type'))
-
-            reaction_counts = {
-                item['reaction_type']: item['count']
-                for item in reaction_stats
-            }
-
             return JsonResponse({
                 'success': True,
                 'message': message,
-                'like_count': reaction_counts.get('like', 0),
-                'dislike_count': reaction_counts.get('dislike', 0),
+                'like_count': counts['like_count'],
+                'dislike_count': counts['dislike_count'],
                 'user_reaction': user_reaction
             })
 
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
     'debug_toolbar',
     'crispy_forms',
     'channels',
+    'django_celery_beat',
 ]
 
 AUTH_USER_MODEL = 'blog.CustomUser'
@@ -247,6 +248,113 @@ CACHES = {
     }
 }
 
+# Ограничение частоты сообщений в чате (скользящее окно в Redis).
+# Запасной вариант на таблице UserMessageRate: 'blog.rate_limiting.DatabaseRateLimiter'
+MODERATION_RATE_LIMITER = 'blog.rate_limiting.RedisRateLimiter'
+
+# Как часто (в секундах) процесс сверяет версию индекса банов в кеше
+BAN_INDEX_REFRESH_INTERVAL = 1
+
+# Как часто (в секундах) процесс сверяет версию политик модерации комнат в кеше
+MODERATION_POLICY_REFRESH_INTERVAL = 1
+
+# Пул процессов для проверок текста сообщений чата (blog.moderation_executor).
+# WORKERS = 0 - проверять в пуле потоков; FAIL_MODE: 'open' - пропускать,
+# 'closed' - блокировать сообщения, если очередь переполнена или истек TIMEOUT
+MODERATION_EXECUTOR = {
+    'WORKERS': int(os.getenv('MODERATION_WORKERS', '2')),
+    'MAX_PENDING': 200,
+    'TIMEOUT': 2.0,
+    'FAIL_MODE': 'open',
+}
+
+# Кеш вердиктов проверки текста (повторы одного и того же сообщения)
+MODERATION_VERDICT_CACHE = {
+    'MAX_SIZE': 10000,
+    'SHARED_TIMEOUT': 300,
+}
+
+# Скомпилированные словари модерации (python manage.py compile_lexicon)
+LEXICON_ARTIFACT_DIR = BASE_DIR / 'var' / 'lexicon'
+LEXICON_REFRESH_INTERVAL = 1
+LEXICON_PUBLISH_DELAY = 2  # Правки словаря за это время публикуются одной версией
+
+# Замеры этапов модерации (python manage.py moderation_metrics)
+MODERATION_METRICS = {
+    'SINK': 'blog.moderation_metrics.HistogramMetricsSink',
+    'SAMPLE_RATE': float(os.getenv('MODERATION_METRICS_SAMPLE_RATE', '0.1')),
+    'FLUSH_INTERVAL': 60,
+}
+
+# Почасовые счетчики вердиктов модерации по комнатам (blog.moderation_stats)
+MODERATION_STATS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 10,
+    'WINDOW_DAYS': 7,
+}
+
+# Отложенная запись сообщений чата пачками (blog.message_buffer).
+# MAX_PENDING - сколько несохраненных сообщений процесс может потерять при сбое
+CHAT_MESSAGE_BUFFER = {
+    'ENABLED': os.getenv('CHAT_MESSAGE_BUFFER', 'False') == 'True',
+    'FLUSH_INTERVAL_MS': 200,
+    'MAX_BATCH': 100,
+    'MAX_PENDING': 1000,
+}
+
+# Буфер реакций на посты в Redis для "горячих" постов (blog.reaction_buffer):
+# клики пишутся в БД задачей flush_reaction_buffer_task из CELERY_BEAT_SCHEDULE
+POST_REACTION_BUFFER = {
+    'ENABLED': os.getenv('POST_REACTION_BUFFER', 'False') == 'True',
+    'BACKEND': 'blog.reaction_buffer.RedisReactionBuffer',
+    'FLUSH_BATCH': 1000,
+    'TIMEOUT': 24 * 60 * 60,
+}
+
+# Кольцевой буфер последних сообщений комнат (blog.recent_messages)
+CHAT_RECENT_MESSAGES = {
+    'BACKEND': 'blog.recent_messages.RedisRecentMessages',
+    'SIZE': 200,
+    'TIMEOUT': 24 * 60 * 60,
+}
+
+# Полнотекстовый поиск по сообщениям чата (blog.message_search):
+# BACKEND None - FTS5 на SQLite, tsvector + GIN на PostgreSQL
+CHAT_MESSAGE_SEARCH = {
+    'BACKEND': None,
+    'CONFIG': 'russian',
+}
+
+# Полнотекстовый поиск по постам на главной (blog.post_search)
+POST_SEARCH = {
+    'BACKEND': None,
+    'CONFIG': 'russian',
+    'SNIPPET_WORDS': 30,
+    'SUGGEST_LIMIT': 8,
+}
+
+# Защита от лавины пересчетов кеша (blog.cache_utils.get_or_compute):
+# блокировка пересчета, ранний пересчет XFetch, устаревшие значения и разброс срока жизни
+CACHE_GET_OR_COMPUTE = {
+    'LOCK_TIMEOUT': 10,
+    'LOCK_WAIT': 2.0,
+    'BETA': 1.0,
+    'STALE_TTL': 60,
+    'JITTER': 0.1,
+}
+
+# Двухуровневый кеш (blog.two_tier_cache): копии горячих ключей в памяти процесса
+# перед Redis; сброс копий рассылается через Redis pub/sub всем воркерам
+TWO_TIER_CACHE = {
+    'ENABLED': os.getenv('TWO_TIER_CACHE', 'True') == 'True',
+    'ALIAS': 'default',
+    'BUS': 'blog.two_tier_cache.RedisInvalidationBus',
+    'MAX_SIZE': 5000,
+    'TIMEOUT': 5,
+    # Только ключи, значения которых никто не изменяет после чтения
+    'PREFIXES': ['ns:', 'total_published_posts', 'chat_room_'],
+}
+
 # Используем отдельный кеш для сессий
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'sessions'
@@ -276,6 +384,28 @@ CELERY_RESULT_BACKEND = 'redis://127.0.0.1:6379/3'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 
+# Периодические задачи: celery -A blog_project beat -l info
+# Расписание записывается в БД django_celery_beat и правится в админке
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'cleanup-expired-bans': {
+        'task': 'blog.tasks.cleanup_expired_bans_task',
+        'schedule': 60.0,
+    },
+    'cleanup-message-rates': {
+        'task': 'blog.tasks.cleanup_message_rates_task',
+        'schedule': 120.0,
+    },
+    'flush-reaction-buffer': {
+        'task': 'blog.tasks.flush_reaction_buffer_task',
+        'schedule': 5.0,
+    },
+    'reconcile-reaction-counts': {
+        'task': 'blog.tasks.reconcile_reaction_counts_task',
+        'schedule': 60 * 60.0,
+    },
+}
+
 
 # Django Debug Toolbar - не перехватывать редиректы
 if DEBUG:
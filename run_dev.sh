@@ -8,8 +8,13 @@ DAPHNE_PID=$!
 celery -A blog_project worker -l info &
 CELERY_PID=$!
 
+# Запуск Celery beat (периодическое обслуживание модерации)
+celery -A blog_project beat -l info &
+BEAT_PID=$!
+
 echo "Daphne PID: $DAPHNE_PID"
 echo "Celery PID: $CELERY_PID"
+echo "Celery beat PID: $BEAT_PID"
 echo "Для остановки нажмите Ctrl+C"
 
 # Ожидание
@@ -1,13 +1,84 @@
 """
 Тестирование системы автоматической модерации
 """
-from django.test import TestCase
-from blog.models import CustomUser, ChatRoom, ModerationSettings
-from blog.moderation_utils import moderate_message
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.core.cache import cache
+from django.utils import timezone
+from blog.models import CustomUser, ChatRoom, Message, ModerationSettings, UserMessageRate, UserBan, ModerationStatsRollup
+from asgiref.sync import async_to_sync
+from blog.moderation_utils import (
+    moderate_message, test_moderation, check_user_ban, check_message_content,
+    cleanup_expired_bans, cleanup_old_message_rates,
+)
+from blog.lexicon import PROHIBITED_WORDS, TOXIC_INDICATORS, SPAM_INDICATORS, contains_prohibited_word
+from blog.lexicon_matcher import scan_lexicon
+from blog.message_analysis import analyze_message
+from blog.rate_limiting import InMemoryRateLimiter, RedisRateLimiter
+from blog.ban_index import get_ban_index
+from blog.moderation_policy import policy_cache, compile_blocked_words, policy_version, ModerationPolicy
+from blog.moderation_executor import ModerationExecutor, FAIL_CLOSED_REASON
+from blog.verdict_cache import VerdictCache, get_verdict_cache
+from blog.models import LexiconEntry
+from blog.lexicon import normalize_text
+from blog.text_normalizer import load_confusables
+from blog.lexicon_store import (
+    lexicon_store, publish_lexicon, load_lexicon_words, load_artifact, artifact_path, schedule_publish,
+    LEXICON_CURRENT_KEY, BUILTIN_VERSION,
+)
+from blog.moderation_metrics import HistogramMetricsSink, StageHistogram, StageTimer
+from blog.moderation_benchmark import build_corpus, compare_with_baseline, CATEGORIES
+from blog.moderation_stats import get_stats_recorder, get_moderation_stats, hour_bucket, reason_key
+from blog.remoderation import remoderate_messages, checkpoint_key
+
+
+# Корпус сообщений для проверки модерации
+MODERATION_CORPUS = [
+    "Это нормальное сообщение",
+    "Ты дурак",
+    "Ты идиот и дурак",
+    "Ты отвратительный человек",
+    "Чёрт возьми!",
+    "Привет всем, как дела?",
+    "х у й",
+    "х@й и п*зда",
+    "ХУЙНЯ КАКАЯ-ТО",
+    "блиииин, опять тормоз",
+    "заткнись, придурок",
+    "легкие деньги без вложений, жми сюда",
+    "Казино онлайн: фриспины и джекпот",
+    "1488",
+    "у меня 88 яблок",
+    "Ты тупой и глупый",
+    "з@ткнись лошара",
+    "д у р а к и т у п о й",
+    "hello world",
+    "",
+]
+
+
+def reset_moderation_caches():
+    """Кеши процесса не знают об откате транзакции между тестами"""
+    get_ban_index().invalidate()
+    policy_cache.invalidate()
+    get_verdict_cache().clear()
+    cache.delete(LEXICON_CURRENT_KEY)
+    lexicon_store.reset()
+    recorder = get_stats_recorder()
+    if recorder is not None:
+        recorder.discard()
 
 
 class ModerationTestCase(TestCase):
     def setUp(self):
+        reset_moderation_caches()
+
         # Создаем тестового пользователя
         self.user = CustomUser.objects.create_user(
             username='testuser',
@@ -68,6 +139,621 @@ class ModerationTestCase(TestCase):
         self.assertEqual(result, (False, ""))
 
 
+class LexiconMatcherParityTestCase(SimpleTestCase):
+    """Автомат словаря дает те же результаты, что и проверка слово за словом"""
+
+    def test_prohibited_words_parity(self):
+        for text in MODERATION_CORPUS:
+            with self.subTest(text=text):
+                expected = any(contains_prohibited_word(text, word) for word in PROHIBITED_WORDS)
+                self.assertEqual(scan_lexicon(text).is_prohibited, expected)
+
+    def test_toxic_indicators_parity(self):
+        for text in MODERATION_CORPUS:
+            with self.subTest(text=text):
+                expected = tuple(
+                    indicator for indicator in TOXIC_INDICATORS
+                    if contains_prohibited_word(text, indicator)
+                )
+                self.assertEqual(scan_lexicon(text).toxic, expected)
+
+    def test_spam_indicators_parity(self):
+        for text in MODERATION_CORPUS:
+            with self.subTest(text=text):
+                expected = any(spam_word in text.lower() for spam_word in SPAM_INDICATORS)
+                self.assertEqual(scan_lexicon(text).is_spam, expected)
+
+
+class MessageAnalysisTestCase(SimpleTestCase):
+    """Сообщение разбирается один раз и используется всеми проверками"""
+
+    def test_precomputed_forms(self):
+        analysis = analyze_message("Х У Й, Привет")
+        self.assertEqual(analysis.lowered, "х у й, привет")
+        self.assertEqual(analysis.normalized, normalize_text("Х У Й, Привет"))
+        self.assertAlmostEqual(analysis.caps_ratio, 4 / 13)
+        self.assertTrue(analysis.lexicon_hits.is_prohibited)
+
+    def test_debug_results_include_analysis(self):
+        results = test_moderation("Ты дурак")
+        analysis = results['analysis']
+        self.assertEqual(results['normalized'], analysis.normalized)
+        self.assertEqual(analysis.as_dict()['prohibited_words'], ['дурак'])
+
+
+class TextNormalizerTestCase(SimpleTestCase):
+    def test_obfuscation_is_folded(self):
+        cases = {
+            "х у й": "хуй",
+            "х@й": "хай",
+            "xyй": "хуй",            # латинские x и y
+            "ху\u200bй": "хуй",      # zero-width space
+            "ＸＵЙ": "хуй",           # полноширинные буквы
+            "п!зда": "пизда",
+            "блииииин": "блиин",
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(normalize_text(text), expected)
+
+    def test_latin_words_and_numbers_are_kept(self):
+        self.assertEqual(normalize_text("hello world"), "helloworld")
+        self.assertEqual(normalize_text("1488"), "1488")
+        self.assertEqual(normalize_text("у меня 88 яблок"), "уменя 88 яблок")
+
+    def test_catches_obfuscation_missed_before(self):
+        for text in ("xyй", "ху\u200bй", "пидоp"):
+            with self.subTest(text=text):
+                self.assertTrue(scan_lexicon(text).is_prohibited)
+
+    def test_confusables_are_loaded_from_data_file(self):
+        confusables = load_confusables()
+        self.assertEqual(confusables['mixed']['x'], 'х')
+        self.assertEqual(confusables['delete']['\u200b'], '')
+
+
+class InMemoryRateLimiterTestCase(SimpleTestCase):
+    """Скользящее окно: лимит в окне и освобождение по мере старения записей"""
+
+    def test_sliding_window(self):
+        limiter = InMemoryRateLimiter()
+        for second in range(3):
+            self.assertTrue(limiter.hit(1, 1, limit=3, window=60, now=1000 + second))
+        self.assertFalse(limiter.hit(1, 1, limit=3, window=60, now=1030))
+        # Другая комната - отдельное окно
+        self.assertTrue(limiter.hit(1, 2, limit=3, window=60, now=1030))
+        # Первая запись вышла из окна
+        self.assertTrue(limiter.hit(1, 1, limit=3, window=60, now=1060))
+        self.assertFalse(limiter.hit(1, 1, limit=3, window=60, now=1060))
+
+
+class RedisRateLimiterFallbackTestCase(TestCase):
+    """Без Redis (locmem-кеш в тестах) лимит считается по таблице UserMessageRate"""
+
+    def test_unavailable_redis_falls_back_to_database(self):
+        user = CustomUser.objects.create_user(username='fallback', email='fallback@example.com', password='x')
+        room = ChatRoom.objects.create(name='fallback_room')
+        limiter = RedisRateLimiter()
+
+        for _ in range(3):
+            self.assertTrue(limiter.hit(user.pk, room.pk, limit=3))
+        self.assertFalse(limiter.hit(user.pk, room.pk, limit=3))
+        self.assertEqual(UserMessageRate.objects.filter(user=user, room=room).count(), 3)
+
+        limiter.reset(user.pk, room.pk)
+        self.assertTrue(limiter.hit(user.pk, room.pk, limit=3))
+
+
+@override_settings(MODERATION_RATE_LIMITER='blog.rate_limiting.InMemoryRateLimiter')
+class MessageRateModerationTestCase(TestCase):
+    def setUp(self):
+        reset_moderation_caches()
+        self.user = CustomUser.objects.create_user(
+            username='rateuser',
+            email='rate@example.com',
+            password='testpass123'
+        )
+        self.room = ChatRoom.objects.create(name='rate_room')
+        ModerationSettings.objects.create(room=self.room, max_messages_per_minute=3)
+
+    def test_rate_limit_without_database_rows(self):
+        for _ in range(3):
+            self.assertEqual(moderate_message(self.user, self.room, "Привет"), (False, ""))
+
+        is_blocked, reason = moderate_message(self.user, self.room, "Привет")
+        self.assertTrue(is_blocked)
+        self.assertIn("Превышено ограничение частоты", reason)
+        self.assertFalse(UserMessageRate.objects.exists())
+
+
+class BanIndexTestCase(TestCase):
+    def setUp(self):
+        reset_moderation_caches()
+        self.user = CustomUser.objects.create_user(
+            username='banned',
+            email='banned@example.com',
+            password='testpass123'
+        )
+        self.room = ChatRoom.objects.create(name='ban_room')
+        self.other_room = ChatRoom.objects.create(name='other_room')
+
+    def test_room_ban_is_scoped_to_room(self):
+        UserBan.objects.create(user=self.user, room=self.room, reason='спам', is_permanent=True)
+
+        self.assertTrue(check_user_ban(self.user, self.room)[0])
+        self.assertFalse(check_user_ban(self.user, self.other_room)[0])
+
+    def test_ban_check_does_not_query_database(self):
+        UserBan.objects.create(user=self.user, reason='флуд', is_permanent=True)
+        check_user_ban(self.user, self.room)
+
+        with self.assertNumQueries(0):
+            is_banned, reason = check_user_ban(self.user, self.other_room)
+        self.assertTrue(is_banned)
+        self.assertIn('навсегда', reason)
+
+    def test_signals_invalidate_index(self):
+        ban = UserBan.objects.create(user=self.user, reason='флуд', is_permanent=True)
+        self.assertTrue(check_user_ban(self.user, self.room)[0])
+
+        ban.delete()
+        self.assertFalse(check_user_ban(self.user, self.room)[0])
+
+    def test_expired_ban_drops_out(self):
+        UserBan.objects.create(
+            user=self.user, reason='флуд', expires_at=timezone.now() + timedelta(hours=1)
+        )
+        self.assertTrue(check_user_ban(self.user, self.room)[0])
+
+        # Срок истек - бан выпадает из индекса без сохранения строки
+        later = timezone.now() + timedelta(hours=2)
+        with mock.patch('blog.ban_index.timezone.now', return_value=later), self.assertNumQueries(0):
+            self.assertFalse(check_user_ban(self.user, self.room)[0])
+
+
+class ModerationMaintenanceTestCase(TestCase):
+    def setUp(self):
+        reset_moderation_caches()
+        self.user = CustomUser.objects.create_user(
+            username='maintenance', email='maintenance@example.com', password='testpass123'
+        )
+        self.room = ChatRoom.objects.create(name='maintenance_room')
+
+    def test_expired_bans_deactivated_with_single_update(self):
+        now = timezone.now()
+        expired = [
+            UserBan.objects.create(user=self.user, reason='old', expires_at=now - timedelta(hours=i + 1))
+            for i in range(3)
+        ]
+        active = UserBan.objects.create(user=self.user, reason='new', expires_at=now + timedelta(hours=1))
+        permanent = UserBan.objects.create(user=self.user, reason='perm', is_permanent=True)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(cleanup_expired_bans(), 3)
+
+        self.assertFalse(UserBan.objects.filter(pk__in=[ban.pk for ban in expired], is_active=True).exists())
+        self.assertTrue(UserBan.objects.get(pk=active.pk).is_active)
+        self.assertTrue(UserBan.objects.get(pk=permanent.pk).is_active)
+
+    def test_old_message_rates_deleted_in_batches(self):
+        UserMessageRate.objects.bulk_create(
+            UserMessageRate(user=self.user, room=self.room) for _ in range(7)
+        )
+        UserMessageRate.objects.update(timestamp=timezone.now() - timedelta(minutes=5))
+        UserMessageRate.objects.create(user=self.user, room=self.room)
+
+        self.assertEqual(cleanup_old_message_rates(batch_size=3), 7)
+        self.assertEqual(UserMessageRate.objects.count(), 1)
+
+
+class ModerationPolicyTestCase(TestCase):
+    def setUp(self):
+        reset_moderation_caches()
+        self.user = CustomUser.objects.create_user(
+            username='policy',
+            email='policy@example.com',
+            password='testpass123'
+        )
+        self.room = ChatRoom.objects.create(name='policy_room')
+        self.moderation_settings = ModerationSettings.objects.create(
+            room=self.room,
+            blocked_words="редиска\nбяка-закаляка"
+        )
+
+    def test_blocked_words_regex_matches_whole_words(self):
+        pattern = compile_blocked_words(("редиска", "бяка-закаляка"))
+        self.assertTrue(pattern.search("ну ты и редиска"))
+        self.assertTrue(pattern.search("бяка-закаляка!"))
+        self.assertFalse(pattern.search("редиская"))
+
+    def test_policy_lookup_without_queries(self):
+        moderate_message(self.user, self.room, "Привет")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(moderate_message(self.user, self.room, "Ты редиска"), (True, "Будьте вежливы"))
+
+    def test_settings_change_invalidates_policy(self):
+        moderate_message(self.user, self.room, "Привет")
+
+        self.moderation_settings.blocked_words = "кабачок"
+        self.moderation_settings.save()
+
+        self.assertEqual(moderate_message(self.user, self.room, "Ты редиска"), (False, ""))
+        self.assertEqual(moderate_message(self.user, self.room, "Ты кабачок"), (True, "Будьте вежливы"))
+
+
+def _slow_check_task(content, policy, moderation_level, timed=False):
+    """Подменяет проверку в процессе пула: спит float(content) секунд"""
+    time.sleep(float(content))
+    return (False, ""), []
+
+
+def _crashing_check_task(content, policy, moderation_level, timed=False):
+    os._exit(1)
+
+
+class ModerationExecutorTestCase(SimpleTestCase):
+    def setUp(self):
+        self.policy = ModerationPolicy(
+            room_id=1, enabled=True, enable_toxicity_filter=True, max_messages_per_minute=10,
+            blocked_words=("редиска",), blocked_words_re=compile_blocked_words(("редиска",)),
+            version=policy_version(True, ("редиска",)),
+        )
+        self.verdict_cache = VerdictCache(shared_timeout=0)
+        patcher = mock.patch('blog.moderation_executor.get_verdict_cache', return_value=self.verdict_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_thread_mode_matches_sync_checks(self):
+        executor = ModerationExecutor(workers=0)
+        for text in MODERATION_CORPUS + ["Ты редиска"]:
+            with self.subTest(text=text):
+                self.assertEqual(
+                    async_to_sync(executor.run)(text, self.policy),
+                    check_message_content(text, self.policy)
+                )
+        self.assertEqual(executor.stats()['completed'], len(MODERATION_CORPUS) + 1)
+
+    def test_full_queue_fails_closed(self):
+        executor = ModerationExecutor(workers=1, max_pending=0, fail_mode='closed')
+        self.assertEqual(async_to_sync(executor.run)("Привет", self.policy), (True, FAIL_CLOSED_REASON))
+        self.assertEqual(executor.stats()['failures'], {'queue_full': 1})
+
+    def test_full_queue_fails_open(self):
+        executor = ModerationExecutor(workers=1, max_pending=0, fail_mode='open')
+        self.assertEqual(async_to_sync(executor.run)("х у й", self.policy), (False, ""))
+        # Вердикт по политике отказа не должен попасть в кеш
+        self.assertEqual(self.verdict_cache.stats()['size'], 0)
+
+    def test_pool_worker_returns_stage_timings(self):
+        executor = ModerationExecutor(workers=1, timeout=60)
+        self.addCleanup(executor.shutdown)
+        sink = HistogramMetricsSink(sample_rate=1, flush_interval=0)
+
+        timer = StageTimer(sink)
+        self.assertEqual(async_to_sync(executor.run)("Совершенно обычное сообщение", self.policy, timer=timer),
+                         (False, ""))
+        timer.finish()
+        self.assertTrue(
+            {'analyze', 'prohibited_words', 'blocked_words', 'toxicity', 'spam'} <= set(sink.snapshot())
+        )
+
+        # Сообщение вне выборки: воркер не засекает этапы
+        self.assertEqual(async_to_sync(executor.run)("Еще одно обычное сообщение", self.policy), (False, ""))
+        self.assertEqual(sink.snapshot()['analyze']['count'], 1)
+
+    def wait_until_idle(self, executor):
+        deadline = time.monotonic() + 10
+        while executor.pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(executor.pending, 0)
+
+    @mock.patch('blog.moderation_executor._check_content_task', _slow_check_task)
+    def test_slow_task_keeps_its_slot_until_it_finishes(self):
+        executor = ModerationExecutor(workers=1, max_pending=1, timeout=60, fail_mode='closed')
+        self.addCleanup(executor.shutdown)
+        run = async_to_sync(executor.run)
+        self.assertEqual(run("0", self.policy), (False, ""))  # Процесс пула запущен
+
+        executor.timeout = 0.3
+        self.assertEqual(run("1.5", self.policy), (True, FAIL_CLOSED_REASON))
+        # После таймаута проверка еще идет в процессе пула и занимает очередь
+        self.assertEqual(executor.pending, 1)
+        self.assertEqual(run("0.0", self.policy), (True, FAIL_CLOSED_REASON))
+        self.assertEqual(executor.stats()['failures'], {'timeout': 1, 'queue_full': 1})
+
+        self.wait_until_idle(executor)
+        self.assertEqual(run("0.00", self.policy), (False, ""))
+
+        executor.timeout = 60
+        with mock.patch('blog.moderation_executor._check_content_task', _crashing_check_task):
+            self.assertEqual(run("0.000", self.policy), (True, FAIL_CLOSED_REASON))
+        self.assertEqual(executor.stats()['failures']['broken_pool'], 1)
+        self.wait_until_idle(executor)
+        # Сломанный пул пересоздается при следующей проверке
+        self.assertEqual(run("0.0000", self.policy), (False, ""))
+
+    def test_repeated_text_is_served_from_cache(self):
+        executor = ModerationExecutor(workers=0)
+        for _ in range(50):
+            self.assertEqual(async_to_sync(executor.run)("легкие деньги, жми сюда", self.policy)[0], True)
+
+        self.assertEqual(executor.stats()['completed'], 1)
+        stats = self.verdict_cache.stats()
+        self.assertEqual((stats['misses'], stats['local_hits']), (1, 49))
+
+
+class VerdictCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.policy = ModerationPolicy(
+            room_id=1, enabled=True, enable_toxicity_filter=True, max_messages_per_minute=10,
+            blocked_words=(), blocked_words_re=None, version=policy_version(True, ()),
+        )
+
+    def test_key_depends_on_exact_text_policy_and_level(self):
+        verdict_cache = VerdictCache(shared_timeout=0)
+        key = verdict_cache.make_key("ПРИВЕТ ВСЕМ", self.policy)
+
+        self.assertNotEqual(key, verdict_cache.make_key("привет всем", self.policy))
+        self.assertNotEqual(key, verdict_cache.make_key("ПРИВЕТ ВСЕМ", self.policy, 'strict'))
+        self.assertNotEqual(key, verdict_cache.make_key(
+            "ПРИВЕТ ВСЕМ", self.policy._replace(version=policy_version(True, ("привет",)))
+        ))
+
+    def test_lru_eviction(self):
+        verdict_cache = VerdictCache(max_size=2, shared_timeout=0)
+        verdict_cache.set('a', (False, ""))
+        verdict_cache.set('b', (False, ""))
+        verdict_cache.get('a')
+        verdict_cache.set('c', (True, "Спам"))
+
+        self.assertIsNone(verdict_cache.get('b'))
+        self.assertEqual(verdict_cache.get('a'), (False, ""))
+        self.assertEqual(verdict_cache.get('c'), (True, "Спам"))
+
+
+class ModerationBenchmarkTestCase(SimpleTestCase):
+    def test_corpus_is_reproducible(self):
+        corpus = build_corpus(seed=7, per_category=5)
+
+        self.assertEqual(corpus, build_corpus(seed=7, per_category=5))
+        self.assertEqual({message.category for message in corpus}, set(CATEGORIES))
+        self.assertIn("х у й", [message.text for message in corpus])
+
+    def test_baseline_regressions(self):
+        baseline = {'stages': {'check_spam': {'p95_us': 10.0, 'ops_per_sec': 1000.0}}}
+        report = {'stages': {
+            'check_spam': {'p95_us': 13.0, 'ops_per_sec': 950.0},
+            'check_toxicity': {'p95_us': 50.0, 'ops_per_sec': 10.0},
+        }}
+
+        regressions = compare_with_baseline(report, baseline, threshold=0.2)
+        self.assertEqual([(r['stage'], r['metric']) for r in regressions], [('check_spam', 'p95_us')])
+
+
+class ModerationMetricsTestCase(TestCase):
+    def setUp(self):
+        reset_moderation_caches()
+        self.user = CustomUser.objects.create_user(
+            username='metricsuser', email='metrics@example.com', password='testpass123'
+        )
+        self.room = ChatRoom.objects.create(name='metrics_room')
+
+    def test_histogram_percentiles(self):
+        histogram = StageHistogram()
+        for ms in range(1, 101):
+            histogram.add(ms / 1000)
+
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 100)
+        # Точность - ширина корзины (~19%)
+        self.assertAlmostEqual(summary['p50_ms'], 50, delta=10)
+        self.assertAlmostEqual(summary['p99_ms'], 99, delta=19)
+        self.assertEqual(summary['max_ms'], 100)
+
+        merged = StageHistogram()
+        merged.merge(histogram.as_dict())
+        merged.merge(histogram.as_dict())
+        self.assertEqual(merged.summary()['p50_ms'], summary['p50_ms'])
+
+    def test_extended_stages_are_not_counted_in_next_lap(self):
+        recorded = []
+        sink = mock.Mock(record_many=recorded.extend)
+        with mock.patch('blog.moderation_metrics.time.perf_counter', side_effect=[0.0, 1.0, 1.0]):
+            timer = StageTimer(sink)
+            # Этапы воркера заняли 0.75 из 1.0 секунды вызова пула
+            timer.extend([('analyze', 0.5), ('spam', 0.25)])
+            timer.lap('executor')
+            timer.finish()
+
+        durations = dict(recorded)
+        self.assertAlmostEqual(durations['executor'], 0.25)
+        self.assertAlmostEqual(sum(d for stage, d in recorded if stage != 'total'), durations['total'])
+
+    @override_settings(MODERATION_RATE_LIMITER='blog.rate_limiting.InMemoryRateLimiter')
+    def test_moderate_message_records_each_step(self):
+        sink = HistogramMetricsSink(sample_rate=1, flush_interval=0)
+        with mock.patch('blog.moderation_metrics.get_metrics_sink', return_value=sink):
+            moderate_message(self.user, self.room, "Совершенно обычное сообщение")
+
+        self.assertEqual(
+            set(sink.snapshot()),
+            {'ban', 'policy', 'analyze', 'length', 'prohibited_words', 'blocked_words',
+             'toxicity', 'spam', 'suspicious_patterns', 'verdict_cache', 'rate', 'total'}
+        )
+
+    def test_unsampled_messages_are_not_recorded(self):
+        sink = HistogramMetricsSink(sample_rate=0, flush_interval=0)
+        with mock.patch('blog.moderation_metrics.get_metrics_sink', return_value=sink):
+            moderate_message(self.user, self.room, "Привет")
+
+        self.assertEqual(sink.snapshot(), {})
+
+
+@override_settings(
+    MODERATION_STATS={'FLUSH_INTERVAL': 0},
+    MODERATION_RATE_LIMITER='blog.rate_limiting.InMemoryRateLimiter',
+)
+class ModerationStatsTestCase(TestCase):
+    def setUp(self):
+        reset_moderation_caches()
+        self.user = CustomUser.objects.create_user(
+            username='statsuser', email='stats@example.com', password='testpass123'
+        )
+        self.room = ChatRoom.objects.create(name='stats_room')
+
+    def test_verdicts_are_counted_by_reason(self):
+        moderate_message(self.user, self.room, "Привет всем")
+        moderate_message(self.user, self.room, "Как дела?")
+        moderate_message(self.user, self.room, "х у й")
+        get_stats_recorder().flush()
+
+        with self.assertNumQueries(1):
+            stats = get_moderation_stats(self.room)
+        self.assertEqual(stats['total_messages'], 3)
+        self.assertEqual(stats['blocked_messages'], 1)
+        self.assertEqual(stats['reasons'], {'prohibited': 1})
+        self.assertAlmostEqual(stats['block_rate'], 100 / 3)
+
+    def test_flushes_add_to_hourly_rows(self):
+        recorder = get_stats_recorder()
+        recorder.record(self.room.pk, False)
+        recorder.flush()
+        recorder.record(self.room.pk, False)
+        recorder.record(self.room.pk, True, "Обнаружен спам")
+        recorder.flush()
+
+        # Счетчик за пределами окна не учитывается
+        ModerationStatsRollup.objects.create(
+            room=self.room, hour=hour_bucket(timezone.now() - timedelta(days=8)), reason='', count=100
+        )
+
+        rows = ModerationStatsRollup.objects.filter(room=self.room, hour=hour_bucket())
+        self.assertEqual(dict(rows.values_list('reason', 'count')), {'': 2, 'spam': 1})
+        self.assertEqual(get_moderation_stats(self.room)['total_messages'], 3)
+        self.assertEqual(recorder.pending(), {})
+
+    def test_reason_keys(self):
+        self.assertEqual(reason_key("Превышено ограничение частоты сообщений: 10 в минуту"), 'rate')
+        self.assertEqual(reason_key("Пользователь заблокирован навсегда. Причина: спам"), 'ban')
+        self.assertEqual(reason_key(FAIL_CLOSED_REASON), 'unavailable')
+        self.assertEqual(reason_key("Что-то новое"), 'other')
+
+
+@override_settings(CHAT_RECENT_MESSAGES={'BACKEND': 'blog.recent_messages.InMemoryRecentMessages'})
+class RemoderationTestCase(TestCase):
+    def setUp(self):
+        reset_moderation_caches()
+        self.user = CustomUser.objects.create_user(
+            username='remoderationuser', email='remoderation@example.com', password='testpass123'
+        )
+        self.room = ChatRoom.objects.create(name='remoderation_room')
+        self.clean = Message.objects.create(room=self.room, user=self.user, content="Привет всем")
+        self.stale = Message.objects.create(room=self.room, user=self.user, content="х у й")
+        self.unblocked = Message.objects.create(
+            room=self.room, user=self.user, content="Как дела?", is_blocked=True, moderation_reason="Обнаружен спам"
+        )
+
+    def test_dry_run_reports_without_writing(self):
+        report = remoderate_messages(dry_run=True, batch_size=2)
+
+        self.assertEqual((report['scanned'], report['changed']), (3, 2))
+        self.assertEqual((report['blocked'], report['unblocked']), (1, 1))
+        self.assertEqual(report['reasons'], {'prohibited': 1})
+        self.assertFalse(Message.objects.get(pk=self.stale.pk).is_blocked)
+
+    def test_verdicts_are_written_back(self):
+        report = remoderate_messages(batch_size=2)
+
+        self.assertEqual(report['changed'], 2)
+        stale = Message.objects.get(pk=self.stale.pk)
+        self.assertTrue(stale.is_blocked)
+        self.assertEqual(stale.moderation_reason, "Сообщение содержит запрещенные слова")
+        self.assertFalse(Message.objects.get(pk=self.unblocked.pk).is_blocked)
+        self.assertIsNone(cache.get(checkpoint_key()))
+
+    def test_resume_from_checkpoint_and_filters(self):
+        cache.set(checkpoint_key(), self.stale.pk, None)
+        report = remoderate_messages(resume=True)
+        self.assertEqual(report['scanned'], 1)
+        self.assertFalse(Message.objects.get(pk=self.stale.pk).is_blocked)
+
+        other_room = ChatRoom.objects.create(name='remoderation_other')
+        report = remoderate_messages(dry_run=True, room_ids=[other_room.pk])
+        self.assertEqual(report['scanned'], 0)
+
+        report = remoderate_messages(dry_run=True, unblock=False)
+        self.assertEqual(report['unblocked'], 0)
+
+
+class LexiconStoreTestCase(TestCase):
+    def setUp(self):
+        reset_moderation_caches()
+        self.addCleanup(reset_moderation_caches)
+
+        artifact_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(artifact_dir.cleanup)
+        settings_override = override_settings(LEXICON_ARTIFACT_DIR=Path(artifact_dir.name))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_migration_seeds_builtin_lexicon(self):
+        words = load_lexicon_words()
+        self.assertEqual(words['prohibited'], tuple(PROHIBITED_WORDS))
+        self.assertEqual(words['toxic'], tuple(TOXIC_INDICATORS))
+        self.assertEqual(words['spam'], tuple(SPAM_INDICATORS))
+
+    def test_new_version_replaces_matcher_after_reload(self):
+        self.assertEqual(lexicon_store.version, BUILTIN_VERSION)
+        self.assertFalse(analyze_message("это кабачок").lexicon_hits.is_prohibited)
+
+        LexiconEntry.objects.create(category='prohibited', word='кабачок')
+        version = publish_lexicon()
+
+        # Другой процесс: до перезагрузки отвечает старый словарь
+        other_process = type(lexicon_store)()
+        self.assertFalse(other_process.get().scan_text("это кабачок").is_prohibited)
+        other_process.reload(cache.get(LEXICON_CURRENT_KEY))
+        self.assertEqual(other_process.version, version)
+        self.assertTrue(other_process.get().scan_text("это кабачок").is_prohibited)
+
+        self.assertTrue(analyze_message("это кабачок").lexicon_hits.is_prohibited)
+
+    def test_lexicon_version_is_part_of_verdict_key(self):
+        policy = ModerationPolicy(
+            room_id=1, enabled=True, enable_toxicity_filter=True, max_messages_per_minute=10,
+            blocked_words=(), blocked_words_re=None, version=policy_version(True, ()),
+        )
+        key = get_verdict_cache().make_key("кабачок", policy)
+
+        LexiconEntry.objects.create(category='prohibited', word='кабачок')
+        publish_lexicon()
+        self.assertNotEqual(get_verdict_cache().make_key("кабачок", policy), key)
+
+    def test_tampered_artifact_is_rebuilt_from_db(self):
+        LexiconEntry.objects.create(category='prohibited', word='кабачок')
+        version = publish_lexicon()
+        path = artifact_path(version)
+        artifact = json.loads(path.read_text(encoding='utf-8'))
+        artifact['matcher']['words']['prohibited'] = []
+        path.write_text(json.dumps(artifact), encoding='utf-8')
+
+        loaded_version, matcher = load_artifact(version)
+        self.assertEqual(loaded_version, version)
+        self.assertTrue(matcher.scan_text("это кабачок").is_prohibited)
+        # Поврежденный файл заменен свежей компиляцией
+        self.assertEqual(json.loads(path.read_text(encoding='utf-8'))['matcher']['words']['prohibited'][-1], 'кабачок')
+
+    def test_changes_in_a_row_are_published_once(self):
+        with mock.patch('blog.lexicon_store.publish_lexicon') as publish:
+            for _ in range(3):
+                schedule_publish(delay=0.05)
+            time.sleep(0.3)
+            schedule_publish(delay=0.05)
+            time.sleep(0.3)
+        self.assertEqual(publish.call_count, 2)
+
+
 if __name__ == '__main__':
     import os
     import django